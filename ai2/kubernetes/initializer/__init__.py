@@ -1,6 +1,22 @@
 """Module containing a basic Kubernetes initializer."""
 
 from .simple_resource_controller import SimpleResourceController
+from .caching_resource_controller import CachingResourceController
+from .async_initializer_controller import AsyncInitializerController
 from .initializer_controller import InitializerController
 from .rejection import Rejection
 from .resource_handler import ResourceHandler
+from .work_queue import WorkQueue
+from .update_strategy import JsonPatchUpdateStrategy, ReplaceUpdateStrategy
+from .metrics import Metrics
+from .owner_resolver import OwnerResolver, ResourceCache
+from .shard_membership import ShardMembership
+from .leader_elector import LeaderElector
+from .process_handler_pool import ProcessHandlerPool
+from .connection_pool import build_api_client, connection_pool_stats
+from .poll_schedule import PollSchedule
+from .load_shedding import LoadSheddingPolicy
+from .rule_resource_controller import RuleResourceController, RuleSet
+from .speculation_cache import SpeculationCache
+from .tracking_store import TrackingStore
+from .watch_multiplexer import WatchMultiplexer
@@ -0,0 +1,296 @@
+"""
+AsyncInitializerController runs the initializer logic on a single asyncio event loop.
+
+This requires the optional kubernetes_asyncio package (installed with the `asyncio` extra), and
+controllers whose ResourceHandlers were built from a kubernetes_asyncio ApiClient.
+"""
+
+import asyncio
+import inspect
+import json
+import logging
+
+from .initializer_controller import _is_conflict
+from .metrics import (EVENTS_FILTERED, EVENTS_RECEIVED, HANDLE_SECONDS, RESULTS, UPDATE_SECONDS,
+                      WATCH_RECONNECTS, Metrics)
+from .rejection import Rejection
+from .tracking_store import (ItemTracker, TrackingStore, is_pending_on, observe_latency,
+                             pop_pending_head)
+
+logger = logging.getLogger(__name__)
+
+
+async def _maybe_await(value):
+    """Returns the given value, awaiting it first if it's awaitable."""
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+def _owns_all(namespace, uid):
+    """Returns True; a single AsyncInitializerController handles every item."""
+    return True
+
+
+class AsyncInitializerController(object):
+    """
+    AsyncInitializerController is the asyncio equivalent of InitializerController's asynchronous
+    mode.
+
+    All watches, item handling, and updates run as tasks on one event loop. Controllers'
+    handle_item may be a regular function or a coroutine function; coroutine handlers for many
+    items run concurrently.
+
+    The entry method is the handle_updates coroutine, which runs until halt_handle_updates is
+    called.
+
+    As in InitializerController, objects pending on this initializer are kept in `tracking_store`,
+    a TrackingStore, along with the resourceVersion each controller's watch resumes from. All of
+    its updates happen on the event loop.
+    """
+
+    def __init__(self,
+                 initializer_name,
+                 controllers,
+                 request_timeout_seconds=30,
+                 json_loads=json.loads,
+                 max_concurrent_items=None,
+                 max_conflict_retries=3,
+                 metrics=None):
+        """
+        Builds an AsyncInitializerController handling the given initializer name with the given
+        controllers.
+
+        Args:
+            initializer_name: The name of the initializer in the InitializerConfiguration.
+            controllers: The ResourceControllers to delegate update logic to. Their
+                ResourceHandlers must wrap asyncio API functions.
+            request_timeout_seconds: The amount of time to allow requests to be idle before
+                reconnecting.
+            json_loads: The function used to parse raw watch events from a string.
+            max_concurrent_items: If set, the maximum number of items to handle at once. Watches
+                wait for a free slot before handling another item.
+            max_conflict_retries: The number of times to re-read, re-handle, and re-save an item
+                whose update fails with a 409 Conflict.
+            metrics: The Metrics to record events, timings, and results in. Defaults to a new
+                Metrics instance, available as the `metrics` attribute.
+        """
+        self.initializer_name = initializer_name
+        self.controllers = controllers
+        self._request_timeout_seconds = request_timeout_seconds
+        self._json_loads = json_loads
+        self._max_concurrent_items = max_concurrent_items
+        self._max_conflict_retries = max_conflict_retries
+        self.metrics = metrics or Metrics()
+        self.tracking_store = TrackingStore()
+        self._item_tracker = ItemTracker(self.tracking_store, initializer_name, _owns_all,
+                                         self.metrics)
+        # Map of (controller name, uid) to the latest task handling that object.
+        self._item_tasks = {}
+        # Limits the items handled at once if max_concurrent_items is set. This is created in
+        # handle_updates, so that it belongs to the running event loop.
+        self._item_slots = None
+        self._halt = False
+
+    async def handle_updates(self, error_callback):
+        """
+        Watches and updates all controllers' items as they are created, until halted.
+
+        As with InitializerController.async_handle_updates, each controller's items are listed
+        once, and watches then resume from the latest resourceVersion seen.
+
+        Args:
+            error_callback: The function to invoke with any exception caught. This should log the
+                exception and / or invoke halt_handle_updates, as desired.
+        """
+        self._halt = False
+        if self._max_concurrent_items:
+            self._item_slots = asyncio.Semaphore(self._max_concurrent_items)
+        await asyncio.gather(*[
+            self._handle_controller_updates(error_callback, controller)
+            for controller in self.controllers
+        ])
+        # Let in-flight items finish before returning.
+        if self._item_tasks:
+            await asyncio.wait(list(self._item_tasks.values()))
+
+    def halt_handle_updates(self):
+        """Stops processing of updates. Watches stop after their next event or timeout."""
+        self._halt = True
+
+    async def _handle_controller_updates(self, error_callback, controller):
+        """Runs the list-then-watch loop for a single controller until halted."""
+        try:
+            await self._resync(error_callback, controller)
+        except Exception as e:
+            error_callback(e)
+
+        # Reconnect in a loop; we expect to break out after every _request_timeout_seconds of idle
+        # time.
+        first_watch = True
+        while not self._halt:
+            if not first_watch:
+                self.metrics.increment(WATCH_RECONNECTS, controller.name)
+            first_watch = False
+            try:
+                await self._watch(error_callback, controller)
+            except asyncio.TimeoutError:
+                # Expected when we hit _request_timeout; this lets us detect dropped connections.
+                logger.debug('Request timeout; ignoring.')
+            except Exception as e:
+                error_callback(e)
+
+    async def _watch(self, error_callback, controller):
+        """Runs a single watch connection for the given controller."""
+        kwargs = dict(controller.selector_kwargs)
+        resource_version = self.tracking_store.resume_version(controller.name)
+        if resource_version:
+            kwargs['resource_version'] = resource_version
+
+        watch = self._new_watch()
+        return_type = watch.get_return_type(controller.list_all_items_fn)
+        response = await controller.list_all_items_fn(
+            include_uninitialized=True,
+            watch=True,
+            _request_timeout=self._request_timeout_seconds,
+            _preload_content=False,
+            **kwargs)
+        try:
+            while not self._halt:
+                line = await response.content.readline()
+                if not line:
+                    return
+                line = line.strip()
+                if not line:
+                    continue
+
+                raw_event = self._json_loads(line)
+                event_type = raw_event['type']
+                if event_type == 'ERROR':
+                    status = raw_event['object']
+                    if status.get('code') == 410:
+                        logger.info('Watch on %s expired; relisting.', controller.name)
+                        await self._resync(error_callback, controller)
+                    else:
+                        logger.warning('Watch on %s returned an error: %s', controller.name,
+                                       status.get('message'))
+                    return
+
+                if self._item_tracker.accept_event(controller.name, raw_event):
+                    item = watch.unmarshal_event(line, return_type)['object']
+                    await self._schedule_item(error_callback, controller, item)
+        finally:
+            response.release()
+
+    async def _resync(self, error_callback, controller):
+        """
+        Lists and handles all items for the given controller, resetting its resourceVersion and
+        dropping tracked objects which weren't listed.
+
+        The controller's watch isn't running while this does, so nothing it tracks can be dropped.
+        """
+        self.tracking_store.reset_resume_version(controller.name)
+
+        def record_list_metadata(list_metadata):
+            """Records the list's resourceVersion, which is shared by all pages of a list."""
+            if self.tracking_store.resume_version(controller.name) is None:
+                self.tracking_store.set_resume_version(controller.name,
+                                                       list_metadata.resource_version)
+
+        tracked_uids = set()
+        async for item in controller.aiter_items(metadata_callback=record_list_metadata):
+            self.metrics.increment(EVENTS_RECEIVED, controller.name)
+            if self._item_tracker.track_item(controller.name, item):
+                tracked_uids.add(item.metadata.uid)
+            if is_pending_on(item, self.initializer_name):
+                await self._schedule_item(error_callback, controller, item)
+            else:
+                self.metrics.increment(EVENTS_FILTERED, controller.name)
+        self.tracking_store.retain(controller.name, tracked_uids)
+
+    async def _schedule_item(self, error_callback, controller, item):
+        """
+        Starts a task to initialize the given item.
+
+        Tasks for the same object run in the order they were scheduled. If max_concurrent_items is
+        set, this waits for a free slot first.
+        """
+        if self._item_slots:
+            await self._item_slots.acquire()
+        key = (controller.name, item.metadata.uid)
+        previous_task = self._item_tasks.get(key)
+        task = asyncio.ensure_future(
+            self._run_item(error_callback, controller, item, previous_task))
+        self._item_tasks[key] = task
+
+        def forget_task(finished_task):
+            """Removes the finished task, unless a later task for the same object replaced it."""
+            if self._item_tasks.get(key) is finished_task:
+                del self._item_tasks[key]
+
+        task.add_done_callback(forget_task)
+
+    async def _run_item(self, error_callback, controller, item, previous_task):
+        """Initializes the given item after the previous task for the same object finishes."""
+        try:
+            if previous_task:
+                await asyncio.wait([previous_task])
+            await self._initialize_item(controller, item)
+        except Exception as e:
+            error_callback(e)
+        finally:
+            if self._item_slots:
+                self._item_slots.release()
+
+    async def _initialize_item(self, controller, item):
+        """Runs the given controller on an item pending on our initializer, and saves the result.
+
+        As in InitializerController, a 409 Conflict on save results in the item being re-read and
+        handled again, up to max_conflict_retries times.
+        """
+        conflicts = 0
+        while True:
+            updated_item, snapshot = await self._run_handler(controller, item)
+            try:
+                # Save the results back to the server.
+                with self.metrics.time(UPDATE_SECONDS, controller.name):
+                    await _maybe_await(controller.update_item(updated_item, snapshot))
+                observe_latency(self.metrics, controller, item)
+                self.tracking_store.discard(item.metadata.uid)
+                return
+            except Exception as e:
+                if not _is_conflict(e) or conflicts >= self._max_conflict_retries:
+                    raise
+            conflicts += 1
+            logger.info('Conflict updating %s %s:%s; re-reading.', controller.name,
+                        item.metadata.namespace, item.metadata.name)
+            item = await _maybe_await(
+                controller.read_item(item.metadata.name, item.metadata.namespace))
+            if not is_pending_on(item, self.initializer_name):
+                logger.info('Item is no longer pending on this initializer; skipping.')
+                return
+
+    async def _run_handler(self, controller, item):
+        """Runs the given controller on an item, returning the item to save and its snapshot."""
+        initializers = item.metadata.initializers
+        snapshot = controller.snapshot_item(item)
+        logger.info('Processing %s %s:%s.', controller.name, item.metadata.namespace,
+                    item.metadata.name)
+        try:
+            with self.metrics.time(HANDLE_SECONDS, controller.name):
+                updated_item = await _maybe_await(controller.handle_item(item))
+            logger.info('Controller accepted.')
+            self.metrics.increment(RESULTS, controller.name, result='accepted')
+        except Rejection as rejection:
+            logger.info('Controller rejected.')
+            self.metrics.increment(RESULTS, controller.name, result='rejected')
+            # Update the unmodified item, using the provided rejection reason.
+            updated_item = item
+            updated_item.metadata.initializers.result = rejection.status
+        pop_pending_head(initializers, updated_item)
+        return updated_item, snapshot
+
+    def _new_watch(self):
+        """Returns a kubernetes_asyncio Watch, used to find return types and unmarshal events."""
+        import kubernetes_asyncio.watch
+        return kubernetes_asyncio.watch.Watch()
@@ -0,0 +1,181 @@
+"""
+CachingResourceController memoizes another controller's decisions for items which look alike.
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import kubernetes
+
+from .metrics import DECISION_CACHE_LOOKUPS
+from .rejection import Rejection
+from .resource_controller import ResourceController
+from .serialization import item_from_json
+from .update_strategy import json_patch_apply, json_patch_diff
+
+logger = logging.getLogger(__name__)
+
+# Mutations touching these paths are specific to one object, so they're never replayed.
+IDENTITY_PATHS = ('/metadata/name', '/metadata/namespace', '/metadata/uid',
+                   '/metadata/resourceVersion', '/metadata/initializers')
+
+
+def owner_template_fingerprint(serialized_item):
+    """
+    Returns a fingerprint which is equal for objects created from the same template.
+
+    This combines the item's kind, namespace, controlling owner reference, labels, and a hash of its
+    spec. Pods created by one ReplicaSet, Job, or DaemonSet generation share a fingerprint.
+
+    Args:
+        serialized_item: The item, as a JSON-compatible dict.
+    """
+    metadata = serialized_item.get('metadata') or {}
+    owner_uid = None
+    for owner in metadata.get('ownerReferences') or []:
+        if owner.get('controller'):
+            owner_uid = owner.get('uid')
+    spec = json.dumps(serialized_item.get('spec'), sort_keys=True)
+    return (serialized_item.get('kind'), metadata.get('namespace'), owner_uid,
+            json.dumps(metadata.get('labels'), sort_keys=True),
+            hashlib.sha256(spec.encode('utf8')).hexdigest())
+
+
+class CachingResourceController(ResourceController):
+    """
+    A ResourceController which caches the decisions of a wrapped controller.
+
+    Items are keyed by a fingerprint: a projection of the item which the wrapped controller's
+    decision depends on entirely. Items with the same fingerprint as a recently-handled item get
+    that item's decision without calling the wrapped controller. An accepted item gets the same
+    changes as the original (recorded as a JSON Patch), and a rejected item gets the same rejection.
+
+    Changes to an item's name, namespace, uid, resourceVersion, or initializers are never replayed;
+    decisions making them aren't cached.
+
+    Entries are evicted once they're older than `ttl_seconds`, or when the cache holds more than
+    `max_size` entries, least-recently-used first.
+    """
+
+    def __init__(self,
+                 controller,
+                 fingerprint_function=owner_template_fingerprint,
+                 max_size=1024,
+                 ttl_seconds=300,
+                 api_client=None,
+                 metrics=None):
+        """
+        Args:
+            controller: The ResourceController to cache handle_item decisions for.
+            fingerprint_function: A function from an item, serialized to a JSON-compatible dict, to
+                a hashable fingerprint.
+            max_size: The maximum number of decisions to cache.
+            ttl_seconds: The maximum time to cache a decision for.
+            api_client: The ApiClient used to serialize and deserialize items. Defaults to a new
+                kubernetes.client.ApiClient.
+            metrics: If set, a Metrics to count cache hits and misses in.
+        """
+        super().__init__(controller._resource_handler)
+        self._controller = controller
+        self._fingerprint_function = fingerprint_function
+        self._max_size = max_size
+        self._ttl_seconds = ttl_seconds
+        self._api_client = api_client or kubernetes.client.ApiClient()
+        self._metrics = metrics
+        self._lock = threading.Lock()
+        # Map of fingerprint to (expiry time, Rejection status or JSON Patch), in LRU order.
+        self._cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache_size(self):
+        """The number of decisions currently cached."""
+        with self._lock:
+            return len(self._cache)
+
+    def clear(self):
+        """Drops all cached decisions."""
+        with self._lock:
+            self._cache.clear()
+
+    def handle_item(self, item):
+        """Returns the cached decision for the item, or the wrapped controller's decision."""
+        serialized = self._api_client.sanitize_for_serialization(item)
+        fingerprint = self._fingerprint_function(serialized)
+        decision = self._lookup(fingerprint)
+        result = None
+        if isinstance(decision, list):
+            try:
+                result = self._replay(item, serialized, decision)
+            except ValueError as e:
+                # The item differs from the original outside its fingerprint; handle it instead.
+                logger.debug('Cached decision does not apply to %s:%s: %s',
+                             item.metadata.namespace, item.metadata.name, e)
+        rejection_status = None if isinstance(decision, list) else decision
+        self._count_lookup(result is not None or rejection_status is not None)
+        if result is not None:
+            return result
+        if rejection_status is not None:
+            raise Rejection(
+                message=rejection_status.message,
+                reason=rejection_status.reason,
+                code=rejection_status.code,
+                details=rejection_status.details)
+
+        try:
+            result = self._controller.handle_item(item)
+        except Rejection as rejection:
+            self._store(fingerprint, rejection.status)
+            raise
+        patch = json_patch_diff(serialized, self._api_client.sanitize_for_serialization(result))
+        if not any(op['path'].startswith(IDENTITY_PATHS) for op in patch):
+            self._store(fingerprint, patch)
+        return result
+
+    def _lookup(self, fingerprint):
+        """Returns the unexpired cached decision for a fingerprint, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(fingerprint)
+            if entry is not None and entry[0] <= now:
+                del self._cache[fingerprint]
+                entry = None
+            if entry is not None:
+                self._cache.move_to_end(fingerprint)
+        return None if entry is None else entry[1]
+
+    def _count_lookup(self, hit):
+        """Counts a lookup as a hit, or as a miss if no cached decision was used."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if self._metrics:
+            self._metrics.increment(
+                DECISION_CACHE_LOOKUPS, self.name, result='hit' if hit else 'miss')
+
+    def _store(self, fingerprint, decision):
+        """Caches a decision, evicting the least-recently-used decisions if over max_size."""
+        with self._lock:
+            self._cache[fingerprint] = (time.monotonic() + self._ttl_seconds, decision)
+            self._cache.move_to_end(fingerprint)
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+
+    def _replay(self, item, serialized, patch):
+        """
+        Returns the item with a cached JSON Patch applied.
+
+        Raises:
+            ValueError: If the patch can't be applied to the item.
+        """
+        if not patch:
+            return item
+        patched = json_patch_apply(serialized, patch)
+        return item_from_json(self._api_client, json.dumps(patched), type(item).__name__)
@@ -0,0 +1,69 @@
+"""
+Helpers to size and inspect the HTTP connection pool shared by all API calls made with an ApiClient.
+
+Every API object (CoreV1Api, BatchV1Api, ...) built from one ApiClient shares that client's
+urllib3 connection pool, so all ResourceHandlers built from one ApiClient share a pool. Each open
+watch holds a connection for as long as it runs, so the pool must be large enough for all watches
+plus all concurrent reads and updates; otherwise, updates open (and then discard) extra
+connections, paying a TCP and TLS handshake each time.
+"""
+
+import kubernetes
+
+
+def build_api_client(configuration=None, watches=0, concurrent_requests=1, block=False):
+    """
+    Builds an ApiClient with a connection pool sized for the given workload.
+
+    Share the returned client between all ResourceHandlers (and OwnerResolver caches) so that they
+    draw from one pool. Connections are kept alive and reused across calls.
+
+    Args:
+        configuration: The kubernetes.client.Configuration to use. Defaults to a new one.
+        watches: The number of watches which will be open at once. This is one per controller for
+            InitializerController.async_handle_updates, plus one per ResourceCache.
+        concurrent_requests: The number of other requests which may be in flight at once, such
+            as the InitializerController's max_workers.
+        block: If true, requests beyond the pool size wait for a pooled connection, instead of
+            opening a connection which is closed after use.
+
+    Returns:
+        A kubernetes.client.ApiClient.
+    """
+    api_client = kubernetes.client.ApiClient(configuration)
+    # Pools are created lazily with these arguments, so this applies to all of them.
+    pool_kwargs = api_client.rest_client.pool_manager.connection_pool_kw
+    pool_kwargs['maxsize'] = max(1, watches + concurrent_requests)
+    pool_kwargs['block'] = block
+    return api_client
+
+
+def connection_pool_stats(api_client):
+    """
+    Returns statistics for the connection pools of an ApiClient.
+
+    There is one pool per API server host, which is usually a single pool.
+
+    Args:
+        api_client: A kubernetes.client.ApiClient.
+
+    Returns:
+        A dict with the summed `maxsize` of all pools, the number of connections `in_use` and
+        `idle`, the total `connections_created` and `requests` made, and `saturation`, the fraction
+        of the pools' capacity in use. A saturation of 1 means further requests will open extra
+        connections, or wait if the pool blocks.
+    """
+    stats = {'maxsize': 0, 'in_use': 0, 'idle': 0, 'connections_created': 0, 'requests': 0}
+    pools = api_client.rest_client.pool_manager.pools
+    for key in list(pools.keys()):
+        pool = pools.get(key)
+        if pool is None or pool.pool is None:
+            continue
+        available = list(pool.pool.queue)
+        stats['maxsize'] += pool.pool.maxsize
+        stats['in_use'] += pool.pool.maxsize - len(available)
+        stats['idle'] += sum(1 for connection in available if connection is not None)
+        stats['connections_created'] += pool.num_connections
+        stats['requests'] += pool.num_requests
+    stats['saturation'] = stats['in_use'] / stats['maxsize'] if stats['maxsize'] else 0.0
+    return stats
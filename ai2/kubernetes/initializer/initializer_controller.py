@@ -1,14 +1,50 @@
+import functools
+import heapq
+import json
 import logging
+import threading
+import time
 
 import kubernetes
 from kubernetes.watch.watch import iter_resp_lines
 import urllib3
 
-from .exceptions import HttpError
+from .exceptions import HttpError, InitializerError
+from .item_batcher import ItemBatcher
+from .keyed_worker_pool import KeyedWorkerPool
+from .poll_schedule import PollSchedule
+from .process_handler_pool import ProcessHandlerPool
+from .load_shedding import LoadShedder, by_deadline, is_expired
+from .metrics import (EVENTS_FILTERED, EVENTS_RECEIVED, HANDLE_SECONDS, ITEMS_EXPIRED, RESULTS,
+                      UPDATE_SECONDS, WATCH_RECONNECTS, Metrics)
+from .tracking_store import (ItemTracker, TrackingStore, is_pending_later, is_pending_on,
+                             observe_latency, pop_pending_head)
+from .watch_multiplexer import RECONNECT, ReconnectAfter, WatchMultiplexer
 from .rejection import Rejection
 
 logger = logging.getLogger(__name__)
 
+# Dispatched in place of a watch line to relist a controller whose watch expired.
+_RESYNC = object()
+
+
+def _item_key(controller, item):
+    """Returns a key identifying the given item of the given controller's type."""
+    metadata = item.metadata
+    return (controller.name, metadata.namespace, metadata.name, metadata.uid)
+
+
+def _report_future_error(error_callback, future):
+    """Passes the error from a completed future, if any, to the given error callback."""
+    error = future.exception()
+    if error:
+        error_callback(error)
+
+
+def _is_conflict(error):
+    """Returns True if the given error is an API error for a 409 Conflict."""
+    return getattr(error, 'status', None) == 409
+
 
 class InitializerController(object):
     """
@@ -20,9 +56,38 @@ class InitializerController(object):
     sub-controller.
 
     The entry method is handle_update, which runs a single lookup-update loop over all controllers.
+
+    The state of each object pending on this initializer is kept in `tracking_store`, a
+    TrackingStore holding only the few fields needed to drop repeated watch events and measure the
+    backlog (its size and oldest item), rather than whole models, along with the resourceVersion
+    each controller's watch resumes from.
     """
 
-    def __init__(self, initializer_name, controllers, request_timeout_seconds=30):
+    def __init__(self,
+                 initializer_name,
+                 controllers,
+                 request_timeout_seconds=30,
+                 json_loads=json.loads,
+                 max_workers=None,
+                 max_pending_items=None,
+                 work_queue=None,
+                 max_conflict_retries=3,
+                 metrics=None,
+                 batch_size=None,
+                 batch_window_seconds=0.05,
+                 shard_membership=None,
+                 leader_elector=None,
+                 handler_processes=None,
+                 client_deadline_seconds=None,
+                 skip_expired_items=False,
+                 load_shedding=None,
+                 speculation_cache=None,
+                 watch_threads=None,
+                 watch_slice_seconds=10,
+                 max_queued_events=1000,
+                 resync_interval_seconds=None,
+                 watch_retry_delay_seconds=1,
+                 max_watch_retries=5):
         """
         Builds a InitializerController handling the given initializer name with the given
         controllers.
@@ -34,15 +99,143 @@ class InitializerController(object):
             controllers: The ResourceControllers to delegate update logic to.
             request_timeout_seconds: The amount of time to allow requests to be idle before
                 reconnecting.
+            json_loads: The function used to parse raw watch events from a string. Events are
+                parsed with this first, and only unmarshalled into models if they need handling. A
+                faster drop-in parser, like `orjson.loads` or `ujson.loads`, may be used here.
+            max_workers: If set, items are handled and updated on a pool of this many threads,
+                instead of inline on the thread which found them. Items with the same uid are
+                still handled in the order they were found.
+            max_pending_items: If set along with max_workers, the maximum number of items which may
+                be queued or in progress on the pool. Finding more items blocks until the pool
+                catches up.
+            work_queue: If set, a WorkQueue which items are sent through before handling. Repeated
+                finds of an item which is still queued are collapsed to the latest version, and
+                failed items are retried with backoff. Items are processed from the queue at the
+                end of each handle_update, or continuously by a background thread while
+                async_handle_updates is running.
+            max_conflict_retries: The number of times to re-read, re-handle, and re-save an item
+                whose update fails with a 409 Conflict. Retries require the controllers'
+                ResourceHandlers to have a read_item function.
+            metrics: The Metrics to record events, timings, and results in. Defaults to a new
+                Metrics instance, available as the `metrics` attribute.
+            batch_size: If set, items are passed to the controllers' handle_items in batches of up
+                to this many items, instead of to handle_item one at a time. Batches are gathered
+                from list results, and from watch events arriving within batch_window_seconds of
+                each other. This can't be combined with max_workers or work_queue.
+            batch_window_seconds: The maximum time a watched item waits for a batch to fill.
+            shard_membership: If set, a started ShardMembership shared with the other replicas of
+                this initializer. Only items in this replica's shard are handled, and watched
+                controllers relist whenever the membership changes, to pick up items from replicas
+                which have left. If handler_processes is set, start it after creating this
+                controller.
+            leader_elector: If set, a started LeaderElector shared with the standby replicas of this
+                initializer. Items are only handled while this replica is the leader; standbys keep
+                their lists and watches running, so that a new leader only needs to relist before
+                taking over. If handler_processes is set, start it after creating this controller.
+            handler_processes: If set, handle_item calls are run on a pool of this many worker
+                processes (see ProcessHandlerPool), so that CPU-bound handlers use more than one
+                core. Items are sent to the pool from the worker threads, so max_workers defaults
+                to this value. This can't be combined with batch_size. The workers are forked when
+                this controller is created, which must happen before shard_membership or
+                leader_elector are started: forking while their threads hold locks can deadlock the
+                workers.
+            client_deadline_seconds: If set, how long after an item's creation its creating client
+                gives up waiting for initialization. Items found by a list are then handled earliest
+                deadline (oldest) first, with items already past their deadline handled after all
+                others. This holds the list's items pending on this replica in memory while
+                sorting.
+            skip_expired_items: If true along with client_deadline_seconds, items past their
+                deadline are not handled at all, leaving them pending.
+            load_shedding: If set, a LoadSheddingPolicy for all controllers, or a dict of controller
+                name to the LoadSheddingPolicy for that controller. The backlog and oldest pending
+                item of each controller are checked on every list pass (which then holds the list's
+                pending items in memory) and watched item, and a controller in degraded mode
+                accepts or rejects items without running its handler.
+            speculation_cache: If set, a SpeculationCache. Items found pending on this initializer
+                behind other initializers are then evaluated ahead of their turn (on the worker pool
+                if configured), and the cached decision is used once their turn comes, if the
+                fields it depends on are unchanged. Evaluation uses handle_item, even when batching.
+            watch_threads: If set, async_handle_updates reads all controllers' watches on this many
+                I/O threads (see WatchMultiplexer), instead of through the API client's callbacks.
+                Watched items are then handled on one dispatch thread, or passed from it to the
+                worker pool or work queue.
+            watch_slice_seconds: If there are fewer watch_threads than controllers, the time each
+                watch connection is held before yielding its thread to another controller's watch.
+            max_queued_events: The maximum number of watched items waiting for the dispatch thread,
+                if watch_threads is set.
+            resync_interval_seconds: If set, how often async_handle_updates relists all controllers
+                while watching, to pick up items left pending by failures which weren't retried.
+                Items a watch is already handling may be handled again, and fail to save with a
+                409 Conflict, so this is off by default.
+            watch_retry_delay_seconds: The time before a watched item whose handling or update
+                failed is re-read and handled again, doubling with each attempt. Retries require the
+                controllers' ResourceHandlers to have a read_item function. Items in a batch, or
+                sent to the work_queue, aren't retried this way.
+            max_watch_retries: The number of times to retry a failed watched item.
+
+        Raises:
+            ValueError: If batch_size is combined with max_workers, work_queue, or
+                handler_processes, or handler_processes is set with a shard_membership or
+                leader_elector which is already running.
         """
+        if batch_size and (max_workers or work_queue or handler_processes):
+            raise ValueError('batch_size cannot be combined with max_workers, work_queue, or '
+                             'handler_processes.')
+        if handler_processes and any(
+                coordinator is not None and coordinator.running
+                for coordinator in (shard_membership, leader_elector)):
+            raise ValueError('Start shard_membership and leader_elector after creating an '
+                             'InitializerController with handler_processes.')
         self.initializer_name = initializer_name
         self.controllers = controllers
         self._request_timeout_seconds = request_timeout_seconds
+        self._json_loads = json_loads
+        self._work_queue = work_queue
+        self._max_conflict_retries = max_conflict_retries
+        self._batch_size = batch_size
+        self._batch_window_seconds = batch_window_seconds
+        self._shard_membership = shard_membership
+        self._leader_elector = leader_elector
+        self._client_deadline_seconds = client_deadline_seconds
+        self._skip_expired_items = skip_expired_items
+        self.metrics = metrics or Metrics()
+        self._load_shedder = LoadShedder(load_shedding, self.metrics)
+        self._speculation_cache = speculation_cache
+        self._watch_threads = watch_threads
+        self._watch_slice_seconds = watch_slice_seconds
+        self._max_queued_events = max_queued_events
+        self._resync_interval_seconds = resync_interval_seconds
+        self._watch_retry_delay_seconds = watch_retry_delay_seconds
+        self._max_watch_retries = max_watch_retries
+        self._multiplexer = None
+        # The state of every object pending on this initializer, and owned by this replica.
+        self.tracking_store = TrackingStore()
+        self._item_tracker = ItemTracker(self.tracking_store, initializer_name, self._owns,
+                                         self.metrics, include_later=bool(speculation_cache))
+        # Names of controllers whose watches have been opened by the multiplexer.
+        self._opened_watches = set()
+        if speculation_cache and speculation_cache.metrics is None:
+            speculation_cache.metrics = self.metrics
+        self._process_pool = None
+        if handler_processes:
+            self._process_pool = ProcessHandlerPool(controllers, handler_processes)
+            max_workers = max_workers or handler_processes
+        self._worker_pool = None
+        if max_workers:
+            self._worker_pool = KeyedWorkerPool(max_workers, max_pending_items)
+        self._halt_event = threading.Event()
 
     def async_handle_updates(self, error_callback):
         """
         Runs an asynchronous update loop, updating all controllers' items as they are created.
 
+        Each controller's items are first listed (and handled) once, and its watch is then started
+        from the resourceVersion of that list. Reconnects resume from the latest resourceVersion
+        seen, so existing items are not replayed; a fresh list is made if the API server reports
+        that the resourceVersion has expired (410 Gone). If resync_interval_seconds is set, all
+        controllers are also relisted that often. Watched items which fail are retried after
+        watch_retry_delay_seconds.
+
         This can be stopped by calling halt_async_handle_updates.
 
         Args:
@@ -51,15 +244,139 @@ class InitializerController(object):
         """
 
         self._halt = False
+        self._halt_event.clear()
+        if self._shard_membership:
+            self._shard_membership.add_listener(
+                lambda members: self._resync_all(error_callback))
+        if self._leader_elector:
+            # Items found while on standby were skipped; pick them up on taking over.
+            self._leader_elector.add_listener(
+                lambda is_leader: is_leader and self._resync_all(error_callback))
+        if self._work_queue:
+            threading.Thread(
+                target=self._run_work_queue, args=(error_callback, ), daemon=True).start()
+        if self._resync_interval_seconds:
+            threading.Thread(
+                target=self._run_periodic_resync, args=(error_callback, ), daemon=True).start()
+        if self._watch_threads:
+            self._start_multiplexer(error_callback)
+            return
         for controller in self.controllers:
             self._async_handle_updates(error_callback, controller)
 
+    def _resync_all(self, error_callback):
+        """Relists all controllers on a background thread, reporting errors to error_callback."""
+
+        def resync():
+            for controller in self.controllers:
+                if self._halt:
+                    return
+                try:
+                    self._resync(controller)
+                except Exception as e:
+                    error_callback(e)
+
+        threading.Thread(target=resync, daemon=True).start()
+
+    def _run_periodic_resync(self, error_callback):
+        """Lists and handles all controllers' items every resync_interval_seconds until halted."""
+        while not self._halt_event.wait(self._resync_interval_seconds):
+            for controller in self.controllers:
+                if self._halt:
+                    return
+                try:
+                    # Watches keep their resourceVersion; this only catches up on missed items.
+                    self._handle_single_update(controller)
+                except Exception as e:
+                    error_callback(e)
+
     def halt_async_handle_updates(self):
         """Stops asynchronous processing of updates."""
         self._halt = True
+        self._halt_event.set()
+        if self._multiplexer:
+            self._multiplexer.stop()
+
+    def _start_multiplexer(self, error_callback):
+        """Lists all controllers, then starts reading their watches on a WatchMultiplexer."""
+        slice_seconds = None
+        if self._watch_threads < len(self.controllers):
+            slice_seconds = self._watch_slice_seconds
+        # Map of controller name to (controller, watch return type, batcher).
+        dispatch_targets = {}
+
+        def dispatch(name, line):
+            controller, return_type, batcher = dispatch_targets[name]
+            if line is _RESYNC:
+                self._resync(controller)
+                return
+            self._handle_watched_line(controller, line, return_type, batcher, error_callback)
+
+        multiplexer = WatchMultiplexer(
+            self._watch_threads,
+            dispatch,
+            error_callback,
+            slice_seconds=slice_seconds,
+            max_queued_events=self._max_queued_events)
+        for controller in self.controllers:
+            batcher = None
+            if self._batch_size:
+                batcher = ItemBatcher(self._batch_size, self._batch_window_seconds,
+                                      functools.partial(self._initialize_batch, controller),
+                                      error_callback)
+            return_type = kubernetes.watch.Watch().get_return_type(controller.list_all_items_fn)
+            dispatch_targets[controller.name] = (controller, return_type, batcher)
+            try:
+                self._resync(controller)
+            except Exception as e:
+                error_callback(e)
+            multiplexer.add_watch(controller.name, functools.partial(self._open_watch, controller),
+                                  functools.partial(self._read_watch_line, controller))
+        self._multiplexer = multiplexer
+        multiplexer.start()
+
+    def _open_watch(self, controller, timeout_seconds):
+        """Opens a streaming watch connection, resuming from the last resourceVersion seen."""
+        if controller.name in self._opened_watches:
+            self.metrics.increment(WATCH_RECONNECTS, controller.name)
+        self._opened_watches.add(controller.name)
+        kwargs = self._watch_kwargs(controller)
+        if timeout_seconds:
+            kwargs['timeout_seconds'] = timeout_seconds
+        return controller.list_all_items_fn(
+            include_uninitialized=True,
+            watch=True,
+            _request_timeout=self._request_timeout_seconds,
+            _preload_content=False,
+            **kwargs)
+
+    def _read_watch_line(self, controller, line):
+        """Parses and filters a raw watch line on an I/O thread, returning it if it's wanted."""
+        raw_event = self._json_loads(line)
+        if raw_event['type'] == 'ERROR':
+            if self._handle_watch_error(controller, raw_event['object']):
+                # Relist on the dispatch thread, reopening the watch once that's done.
+                return ReconnectAfter(_RESYNC)
+            return RECONNECT
+        return line if self._item_tracker.accept_event(controller.name, raw_event) else None
 
     def _async_handle_updates(self, error_callback, controller):
         """Runs an asynchronous update loop using the given controller."""
+        batcher = None
+        if self._batch_size:
+            batcher = ItemBatcher(self._batch_size, self._batch_window_seconds,
+                                  functools.partial(self._initialize_batch, controller),
+                                  error_callback)
+
+        def start_watch():
+            """Opens a watch connection, resuming from the last resourceVersion seen."""
+            controller.list_all_items_fn(
+                include_uninitialized=True,
+                watch=True,
+                callback=handle_response,
+                _request_timeout=self._request_timeout_seconds,
+                _preload_content=False,
+                **self._watch_kwargs(controller))
 
         def handle_response(response):
             """Handles the response of a watch request."""
@@ -72,14 +389,18 @@ class InitializerController(object):
                     if self._halt:
                         return
 
-                    event = watch.unmarshal_event(line, return_type)
-                    event_type = event['type']
-                    if event_type == 'MODIFIED' or event_type == 'ADDED':
-                        item = event['object']
-                        self._handle_single_item(controller, item)
-                    else:
-                        logger.debug('Ignored event type {} for item {}:{}'.format(
-                            event_type, item.metadata.namespace, item.metadata.name))
+                    raw_event = self._json_loads(line)
+                    if raw_event['type'] == 'ERROR':
+                        # Error events hold a Status, not an item, so they can't be unmarshalled
+                        # into the return type. The watch is unusable after an error; reconnect
+                        # after handling it.
+                        if self._handle_watch_error(controller, raw_event['object']):
+                            self._resync(controller)
+                        break
+
+                    if self._item_tracker.accept_event(controller.name, raw_event):
+                        self._handle_watched_line(controller, line, return_type, batcher,
+                                                  error_callback)
             except urllib3.exceptions.ReadTimeoutError as timeout:
                 # This is expected to occur when we hit _request_timeout below. We need to have a
                 # request timeout, else we won't detect dropped network connections or restarted API
@@ -93,19 +414,107 @@ class InitializerController(object):
             if not self._halt:
                 # We expect to break out repeatedly (after every _request_timeout_seconds of idle
                 # time).
-                controller.list_all_items_fn(
-                    include_uninitialized=True,
-                    watch=True,
-                    callback=handle_response,
-                    _request_timeout=self._request_timeout_seconds,
-                    _preload_content=False)
-
-        controller.list_all_items_fn(
-            include_uninitialized=True,
-            watch=True,
-            callback=handle_response,
-            _request_timeout=self._request_timeout_seconds,
-            _preload_content=False)
+                self.metrics.increment(WATCH_RECONNECTS, controller.name)
+                start_watch()
+
+        try:
+            self._resync(controller)
+        except Exception as e:
+            error_callback(e)
+        start_watch()
+
+    def _handle_watched_line(self, controller, line, return_type, batcher, error_callback):
+        """Unmarshals and handles the item of a raw watch line accepted by the ItemTracker."""
+        item = kubernetes.watch.Watch().unmarshal_event(line, return_type)['object']
+        if (self._load_shedder.policy(controller.name)
+                and is_pending_on(item, self.initializer_name)):
+            self._update_load(controller)
+        self._handle_watched_item(controller, item, batcher, error_callback)
+
+    def _handle_watched_item(self, controller, item, batcher, error_callback, attempt=0):
+        """
+        Handles a watched item, re-reading and retrying it with backoff if handling or saving fails.
+
+        Watches resume from the last resourceVersion seen, so a failed item isn't seen again until
+        it's next modified. Items still failing after max_watch_retries are left for a resync.
+        """
+        name, namespace = item.metadata.name, item.metadata.namespace
+
+        def retry(retry_attempt):
+            if self._halt:
+                return
+            try:
+                retried_item = controller.read_item(name, namespace)
+            except Exception as e:
+                # Deleted items, and controllers which can't read items, aren't retried.
+                if getattr(e, 'status', None) != 404:
+                    failed(e, retry_attempt, not isinstance(e, InitializerError))
+                return
+            self._handle_watched_item(controller, retried_item, None, error_callback, retry_attempt)
+
+        def failed(error, failed_attempt=attempt, retryable=True):
+            error_callback(error)
+            if self._halt or not retryable:
+                return
+            if failed_attempt >= self._max_watch_retries:
+                logger.warning('Giving up on %s %s:%s after %s retries; leaving it for a resync.',
+                               controller.name, namespace, name, failed_attempt)
+                return
+            timer = threading.Timer(self._watch_retry_delay_seconds * 2**failed_attempt, retry,
+                                    (failed_attempt + 1, ))
+            timer.daemon = True
+            timer.start()
+
+        def handle_done(future):
+            if future.exception():
+                failed(future.exception())
+
+        try:
+            future = self._handle_single_item(controller, item, batcher)
+        except Exception as e:
+            failed(e)
+            return
+        if future:
+            future.add_done_callback(handle_done)
+
+    def _watch_kwargs(self, controller):
+        """Returns the keyword arguments for a watch call on the given controller."""
+        kwargs = dict(controller.selector_kwargs)
+        resource_version = self.tracking_store.resume_version(controller.name)
+        if resource_version:
+            kwargs['resource_version'] = resource_version
+        return kwargs
+
+    def _resync(self, controller):
+        """
+        Lists and handles all items for the given controller from scratch.
+
+        This resets the controller's resourceVersion to that of the new list.
+
+        Raises:
+            urllib3.exceptions.HTTPError: If any HTTP calls throw an error.
+        """
+        self.tracking_store.reset_resume_version(controller.name)
+        self._handle_single_update(controller)
+
+    def _handle_watch_error(self, controller, status):
+        """
+        Handles an ERROR event from a watch on the given controller.
+
+        Args:
+            controller: The controller whose watch returned the error.
+            status: The raw Status object (as a dict) sent with the event.
+
+        Returns:
+            True if the watch expired, and the controller must be relisted with _resync before
+            watching again.
+        """
+        if status.get('code') == 410:
+            # Our resourceVersion is older than the API server's history; start over.
+            logger.info('Watch on %s expired; relisting.', controller.name)
+            return True
+        logger.warning('Watch on %s returned an error: %s', controller.name, status.get('message'))
+        return False
 
     def handle_update(self):
         """Finds and updates all items in need of update, using the wrapped controllers.
@@ -116,6 +525,91 @@ class InitializerController(object):
         try:
             for controller in self.controllers:
                 self._handle_single_update(controller)
+            if self._work_queue:
+                self._drain_work_queue()
+        except urllib3.exceptions.HTTPError as http_error:
+            raise HttpError('Error talking to Kubernetes', http_error) from http_error
+
+    def run_forever(self,
+                    error_callback=None,
+                    latency_target_seconds=5,
+                    controller_latency_targets=None,
+                    **schedule_kwargs):
+        """
+        Polls all controllers on adaptive schedules, until halt_run_forever is called.
+
+        This replaces calling handle_update in a fixed-interval loop. Each controller is polled on
+        its own PollSchedule: immediately again after a poll which found pending items, and with
+        jittered exponential backoff, up to its latency target, after idle polls.
+
+        Args:
+            error_callback: The function to invoke with any exception raised by a poll, after which
+                that controller backs off as if idle. If not set, exceptions are raised.
+            latency_target_seconds: The longest interval between polls of a controller.
+            controller_latency_targets: A dict of controller name to a latency target overriding
+                latency_target_seconds for that controller.
+            schedule_kwargs: Any other PollSchedule arguments, such as min_interval_seconds.
+
+        Raises:
+            initializer.HttpError: If an HTTP error is encountered, and there's no error_callback.
+        """
+        self._halt_event.clear()
+        controller_latency_targets = controller_latency_targets or {}
+        # Heap of (next poll time, controller index); the index breaks ties.
+        schedule = [(0, index) for index in range(len(self.controllers))]
+        poll_schedules = [
+            PollSchedule(
+                controller_latency_targets.get(controller.name, latency_target_seconds),
+                **schedule_kwargs) for controller in self.controllers
+        ]
+        while schedule:
+            poll_time, index = heapq.heappop(schedule)
+            if self._halt_event.wait(max(0, poll_time - time.monotonic())):
+                return
+            controller = self.controllers[index]
+            try:
+                pending_count = self._poll(controller)
+            except Exception as e:
+                if error_callback is None:
+                    raise
+                error_callback(e)
+                pending_count = 0
+            interval = poll_schedules[index].next_interval(pending_count > 0)
+            logger.debug('Found %s pending %s items; polling again in %.2fs.', pending_count,
+                         controller.name, interval)
+            heapq.heappush(schedule, (time.monotonic() + interval, index))
+
+    def halt_run_forever(self):
+        """Stops run_forever after its current poll."""
+        self._halt_event.set()
+
+    def close(self):
+        """
+        Shuts down the worker threads and handler processes, waiting for work in progress.
+
+        Call this once updates have been halted; no more items can be handled afterwards.
+        """
+        if self._worker_pool:
+            self._worker_pool.shutdown()
+        if self._process_pool:
+            self._process_pool.close()
+
+    def _poll(self, controller):
+        """
+        Finds and updates all items in need of update for one controller, for run_forever.
+
+        Returns:
+            The number of items handled during this poll. With a work queue, this counts the items
+            saved from the queue, so items waiting out a retry delay don't count as work found.
+
+        Raises:
+            initializer.HttpError: If an HTTP error is encountered.
+        """
+        try:
+            pending_count = self._handle_single_update(controller)
+            if self._work_queue:
+                pending_count += self._drain_work_queue()
+            return pending_count
         except urllib3.exceptions.HTTPError as http_error:
             raise HttpError('Error talking to Kubernetes', http_error) from http_error
 
@@ -125,49 +619,375 @@ class InitializerController(object):
         Args:
             controller: The controller to fetch items from and run updates with.
 
+        Returns:
+            The number of items found pending on this initializer which this replica handled, not
+            counting items owned by other replicas or skipped as expired, or sent to the work queue.
+
         Raises:
             urllib3.exceptions.HTTPError: If any HTTP calls throw an error.
         """
-        result = controller.list_all_items()
-        # TODO(jkinkead): Validate `result`? It's unclear if ALL errors will result in an HTTPError,
-        # or if some will result in a response field indicating an error.
-        logger.debug('Got %s results from %s lookup.', len(result.items), controller.name)
-        for item in result.items:
-            self._handle_single_item(controller, item)
+        # TODO(jkinkead): Validate list results? It's unclear if ALL errors will result in an
+        # HTTPError, or if some will result in a response field indicating an error.
+        def record_list_metadata(list_metadata):
+            """Records the list's resourceVersion, which is shared by all pages of a list."""
+            if self.tracking_store.resume_version(controller.name) is None:
+                self.tracking_store.set_resume_version(controller.name,
+                                                       list_metadata.resource_version)
+
+        batcher = None
+        if self._batch_size:
+            batcher = ItemBatcher(self._batch_size, None,
+                                  functools.partial(self._initialize_batch, controller), None)
+
+        item_count = 0
+        pending_count = 0
+        futures = []
+        tracked_uids = set()
+        # Watches may track new items while the list runs; those mustn't be dropped after it.
+        list_mark = self.tracking_store.mark()
+
+        def process(item):
+            nonlocal pending_count
+            if self._will_handle(item) and not self._work_queue:
+                pending_count += 1
+            self.metrics.increment(EVENTS_RECEIVED, controller.name)
+            future = self._handle_single_item(controller, item, batcher)
+            if future:
+                futures.append(future)
 
-    def _handle_single_item(self, controller, item):
+        # Ordering and load checks need all of our pending items at once. Only those are held in
+        # memory; all other items are processed as the list pages stream in.
+        hold_pending = self._client_deadline_seconds or self._load_shedder.policy(controller.name)
+        held_items = []
+        for item in controller.iter_items(metadata_callback=record_list_metadata):
+            item_count += 1
+            if self._item_tracker.track_item(controller.name, item):
+                tracked_uids.add(item.metadata.uid)
+            if (hold_pending and is_pending_on(item, self.initializer_name)
+                    and self._owns(item.metadata.namespace, item.metadata.uid)):
+                held_items.append(item)
+            else:
+                process(item)
+        logger.debug('Got %s results from %s lookup.', item_count, controller.name)
+        self.tracking_store.retain(controller.name, tracked_uids, since=list_mark)
+        if hold_pending:
+            if self._client_deadline_seconds:
+                held_items = by_deadline(held_items, self._client_deadline_seconds)
+            if self._load_shedder.policy(controller.name):
+                self._update_load(controller)
+            for item in held_items:
+                process(item)
+        if batcher:
+            batcher.flush()
+
+        # Wait for any pooled work, raising the first error encountered.
+        for future in futures:
+            future.result()
+        return pending_count
+
+    def _update_load(self, controller):
+        """
+        Updates a controller's load shedding mode from the items tracked as pending on us.
+
+        Items stay tracked while queued or in progress, until they're saved, so these count too.
+        """
+        self._load_shedder.update(
+            controller.name, self.tracking_store.count(controller.name, self.initializer_name),
+            self.tracking_store.oldest_age_seconds(controller.name, self.initializer_name))
+
+    def _precomputed_result(self, controller, item):
+        """Returns the degraded-mode or speculative result for an item, or None to handle it."""
+        result = self._load_shedder.shed_result(controller.name, item)
+        if result is None and self._speculation_cache:
+            result = self._speculation_cache.lookup(controller, item)
+        return result
+
+    def _will_handle(self, item):
+        """Returns whether this replica handles an item: it's pending on us, owned, and in time."""
+        return (is_pending_on(item, self.initializer_name)
+                and self._owns(item.metadata.namespace, item.metadata.uid)
+                and not (self._skip_expired_items
+                         and is_expired(item, self._client_deadline_seconds)))
+
+    def _handle_single_item(self, controller, item, batcher=None):
         """Updates the given item, if needed, using the given controller.
 
+        If a batcher is given, the item is added to it instead of being handled. If a work queue is
+        configured, the item is added to the queue instead of being handled. Otherwise, if a worker
+        pool is configured, the update is scheduled on the pool instead of being run inline.
+
         Args:
             controller: The controller to update the item with.
             item: The item to handle.
+            batcher: The ItemBatcher gathering items for the controller, if batching.
+
+        Returns:
+            A concurrent.futures.Future for the scheduled update if the item was sent to the worker
+            pool, else None.
+
+        Raises:
+            urllib3.exceptions.HTTPError: If any HTTP calls throw an error.
+        """
+        if (is_pending_on(item, self.initializer_name)
+                and self._owns(item.metadata.namespace, item.metadata.uid)):
+            if self._skip_expired_items and is_expired(item, self._client_deadline_seconds):
+                logger.info('Skipping %s %s:%s, which is past its deadline.', controller.name,
+                            item.metadata.namespace, item.metadata.name)
+                self.metrics.increment(ITEMS_EXPIRED, controller.name)
+                return None
+            if batcher:
+                batcher.add(item)
+                return None
+            if self._work_queue:
+                self._work_queue.add(
+                    _item_key(controller, item), (controller, item),
+                    item.metadata.resource_version)
+                return None
+            if self._worker_pool:
+                # Work on a single object must stay ordered, so key on its uid.
+                key = (controller.name, item.metadata.uid)
+                return self._worker_pool.submit(key, self._initialize_item, controller, item)
+            self._initialize_item(controller, item)
+        else:
+            self.metrics.increment(EVENTS_FILTERED, controller.name)
+            if (self._speculation_cache and is_pending_later(item, self.initializer_name)
+                    and self._owns(item.metadata.namespace, item.metadata.uid)
+                    and not self._load_shedder.is_degraded(controller.name)):
+                if self._worker_pool:
+                    key = (controller.name, item.metadata.uid)
+                    return self._worker_pool.submit(key, self._speculate, controller, item)
+                self._speculate(controller, item)
+        return None
+
+    def _speculate(self, controller, item):
+        """Evaluates an item ahead of its turn, caching the decision."""
+        handle_item_function = None
+        if self._process_pool:
+            handle_item_function = functools.partial(self._process_pool.handle_item, controller)
+        self._speculation_cache.evaluate(controller, item, handle_item_function)
+
+    def _owns(self, namespace, uid):
+        """Returns whether this replica should handle the item with the given namespace and uid."""
+        if self._leader_elector and not self._leader_elector.is_leader:
+            return False
+        return self._shard_membership is None or self._shard_membership.owns(namespace, uid)
+
+    def _run_work_queue(self, error_callback):
+        """Processes items from the work queue until async updates are halted."""
+        while not self._halt:
+            # Wake up periodically to check for a halt.
+            entry = self._work_queue.get(timeout=1)
+            if entry is None:
+                continue
+            key, value = entry
+            if self._worker_pool:
+                future = self._worker_pool.submit(key, self._process_queued_item, key, value)
+                future.add_done_callback(functools.partial(_report_future_error, error_callback))
+            else:
+                try:
+                    self._process_queued_item(key, value)
+                except Exception as e:
+                    error_callback(e)
+
+    def _drain_work_queue(self):
+        """Processes all items in the work queue which are ready now.
+
+        Returns:
+            The number of items saved; failed items which were re-queued aren't counted.
+
+        Raises:
+            urllib3.exceptions.HTTPError: If an HTTP error is encountered on an item which has run
+                out of retries.
+        """
+        futures = []
+        saved_count = 0
+        entry = self._work_queue.get(timeout=0)
+        while entry:
+            key, value = entry
+            if self._worker_pool:
+                futures.append(self._worker_pool.submit(key, self._process_queued_item, key, value))
+            elif self._process_queued_item(key, value):
+                saved_count += 1
+            entry = self._work_queue.get(timeout=0)
+
+        # Wait for any pooled work, raising the first error encountered.
+        return saved_count + sum(future.result() for future in futures)
+
+    def _process_queued_item(self, key, value):
+        """Initializes an item taken from the work queue, re-queueing it on failure.
+
+        Args:
+            key: The item's key in the work queue.
+            value: The (controller, item) tuple from the work queue.
+
+        Returns:
+            True if the item was saved, or False if it was re-queued for a retry.
+
+        Raises:
+            Exception: The error encountered, if the item failed and has run out of retries.
+        """
+        controller, item = value
+        initializers = item.metadata.initializers
+        pending = initializers.pending
+        try:
+            self._initialize_item(controller, item)
+        except Exception as e:
+            # Initialization updates the item's initializers in place; restore them so that a retry
+            # sees the item as it was found.
+            initializers.pending = pending
+            initializers.result = None
+            item.metadata.initializers = initializers
+            self._work_queue.done(key)
+            if self._work_queue.add_after_failure(key, value, item.metadata.resource_version):
+                logger.warning('Failed to initialize %s %s:%s; will retry: %s', controller.name,
+                               item.metadata.namespace, item.metadata.name, e)
+                return False
+            raise
+        self._work_queue.forget(key)
+        self._work_queue.done(key)
+        return True
+
+    def _initialize_item(self, controller, item):
+        """Runs the given controller on an item pending on our initializer, and saves the result.
+
+        Args:
+            controller: The controller to update the item with.
+            item: The item to handle. Our initializer must be first in its pending initializers.
 
         Raises:
             urllib3.exceptions.HTTPError: If any HTTP calls throw an error.
+            kubernetes.client.rest.ApiException: If the API server returns an error, including a
+                409 Conflict once out of retries.
+        """
+        updated_item, snapshot = self._run_handler(controller, item)
+        self._save_item(controller, item, updated_item, snapshot)
+
+    def _initialize_batch(self, controller, items):
+        """Runs the given controller's handle_items on a batch of items, and saves the results.
+
+        Every item is saved even if some saves fail; the first error is raised afterwards.
+
+        Args:
+            controller: The controller to update the items with.
+            items: The items to handle. Our initializer must be first in their pending initializers.
+
+        Raises:
+            InitializerError: If handle_items doesn't return one result per item.
+            urllib3.exceptions.HTTPError: If any HTTP calls throw an error.
+            kubernetes.client.rest.ApiException: If the API server returns an error, including a
+                409 Conflict once out of retries.
+        """
+        logger.info('Processing %s %s items.', len(items), controller.name)
+        initializers = [item.metadata.initializers for item in items]
+        snapshots = [controller.snapshot_item(item) for item in items]
+        results = [self._precomputed_result(controller, item) for item in items]
+        remaining = [item for item, result in zip(items, results) if result is None]
+        if remaining:
+            with self.metrics.time(HANDLE_SECONDS, controller.name):
+                handled = list(controller.handle_items(remaining))
+            if len(handled) != len(remaining):
+                raise InitializerError('{} returned {} results for {} items.'.format(
+                    controller.name, len(handled), len(remaining)))
+            handled = iter(handled)
+            results = [next(handled) if result is None else result for result in results]
+
+        first_error = None
+        for item, item_initializers, snapshot, result in zip(items, initializers, snapshots,
+                                                              results):
+            updated_item = self._apply_result(controller, item, item_initializers, result)
+            try:
+                self._save_item(controller, item, updated_item, snapshot)
+            except Exception as e:
+                first_error = first_error or e
+        if first_error:
+            raise first_error
+
+    def _save_item(self, controller, item, updated_item, snapshot):
+        """Saves a handled item.
+
+        If saving fails with a 409 Conflict, the item is re-read, and handled and saved again if
+        it's still pending on our initializer, up to max_conflict_retries times.
+
+        Args:
+            controller: The controller to update the item with.
+            item: The item, as found.
+            updated_item: The handled item to save.
+            snapshot: The controller's snapshot of the item from before handling.
+
+        Raises:
+            urllib3.exceptions.HTTPError: If any HTTP calls throw an error.
+            kubernetes.client.rest.ApiException: If the API server returns an error, including a
+                409 Conflict once out of retries.
+        """
+        conflicts = 0
+        while True:
+            try:
+                # Save the results back to the server.
+                with self.metrics.time(UPDATE_SECONDS, controller.name):
+                    controller.update_item(updated_item, snapshot)
+                observe_latency(self.metrics, controller, item)
+                self.tracking_store.discard(item.metadata.uid)
+                return
+            except Exception as e:
+                if not _is_conflict(e) or conflicts >= self._max_conflict_retries:
+                    raise
+            conflicts += 1
+            logger.info('Conflict updating %s %s:%s; re-reading.', controller.name,
+                        item.metadata.namespace, item.metadata.name)
+            item = controller.read_item(item.metadata.name, item.metadata.namespace)
+            if not is_pending_on(item, self.initializer_name):
+                logger.info('Item is no longer pending on this initializer; skipping.')
+                return
+            updated_item, snapshot = self._run_handler(controller, item)
+
+    def _run_handler(self, controller, item):
+        """Runs the given controller on an item, returning the item to save.
+
+        Args:
+            controller: The controller to handle the item with.
+            item: The item to handle. Our initializer must be first in its pending initializers.
+
+        Returns:
+            A tuple of the handled item, with its initializers updated for saving, and the
+            controller's snapshot of the item from before handling.
         """
         initializers = item.metadata.initializers
-        if (initializers and initializers.pending
-                and initializers.pending[0].name == self.initializer_name):
-            logger.info('Processing %s %s:%s.', controller.name, item.metadata.namespace,
-                        item.metadata.name)
+        snapshot = controller.snapshot_item(item)
+        logger.info('Processing %s %s:%s.', controller.name, item.metadata.namespace,
+                    item.metadata.name)
+        result = self._precomputed_result(controller, item)
+        if result is None:
             try:
-                updated_item = controller.handle_item(item)
-                logger.info('Controller accepted.')
+                with self.metrics.time(HANDLE_SECONDS, controller.name):
+                    if self._process_pool:
+                        result = self._process_pool.handle_item(controller, item)
+                    else:
+                        result = controller.handle_item(item)
             except Rejection as rejection:
-                logger.info('Controller rejected.')
-                # Update the unmodified item, using the provided rejection reason.
-                updated_item = item
-                updated_item.metadata.initializers.result = rejection.status
-            # The API contract is to clear `initializers` completely if we had a successful run
-            # and we're the last initializer.
-            updated_initializers = updated_item.metadata.initializers
-            if not updated_initializers.result and len(initializers.pending) == 1:
-                # Successful run and no more initializers; clear the initializers object.
-                updated_item.metadata.initializers = None
-            else:
-                # There are more initializers, or we saw an error. Update the list to remove the
-                # first item.
-                updated_initializers.pending = initializers.pending[1:]
+                result = rejection
+        return self._apply_result(controller, item, initializers, result), snapshot
+
+    def _apply_result(self, controller, item, initializers, result):
+        """Applies a handler result to an item, returning the item to save.
 
-            # Save the results back to the server.
-            controller.update_item(updated_item)
+        Args:
+            controller: The controller which handled the item.
+            item: The item which was handled.
+            initializers: The initializers of the item, as found before handling.
+            result: The handled item to save, or the Rejection raised for the item.
+
+        Returns:
+            The item to save, with its initializers updated.
+        """
+        if isinstance(result, Rejection):
+            logger.info('Controller rejected.')
+            self.metrics.increment(RESULTS, controller.name, result='rejected')
+            # Update the unmodified item, using the provided rejection reason.
+            updated_item = item
+            updated_item.metadata.initializers.result = result.status
+        else:
+            logger.info('Controller accepted.')
+            self.metrics.increment(RESULTS, controller.name, result='accepted')
+            updated_item = result
+        pop_pending_head(initializers, updated_item)
+        return updated_item
@@ -0,0 +1,74 @@
+"""
+ItemBatcher gathers items into batches, flushing on size or after a short time window.
+"""
+
+import threading
+
+
+class ItemBatcher(object):
+    """
+    Gathers items into batches for a processing function.
+
+    A batch is flushed as soon as it holds `batch_size` items, or `window_seconds` after its first
+    item was added, whichever comes first. Without a window, batches are only flushed when full or
+    when flush is called. Flushes are serialized, so batches are processed one at a time, in order.
+    """
+
+    def __init__(self, batch_size, window_seconds, process_batch, error_callback):
+        """
+        Args:
+            batch_size: The maximum number of items in a batch.
+            window_seconds: The maximum time to hold an item before flushing its batch, or None.
+            process_batch: The function to call with each list of items.
+            error_callback: The function to call with any exception raised by process_batch during
+                a timed flush. This is only needed if window_seconds is set.
+        """
+        self._batch_size = batch_size
+        self._window_seconds = window_seconds
+        self._process_batch = process_batch
+        self._error_callback = error_callback
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._items = []
+        self._timer = None
+
+    def add(self, item):
+        """
+        Adds an item to the current batch, flushing it if it's full.
+
+        Raises:
+            Exception: Any exception raised by process_batch, if the batch was flushed.
+        """
+        with self._lock:
+            self._items.append(item)
+            full = len(self._items) >= self._batch_size
+            if not full and self._timer is None and self._window_seconds is not None:
+                self._timer = threading.Timer(self._window_seconds, self._timed_flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Processes any gathered items immediately.
+
+        Raises:
+            Exception: Any exception raised by process_batch.
+        """
+        with self._flush_lock:
+            with self._lock:
+                items = self._items
+                self._items = []
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if items:
+                self._process_batch(items)
+
+    def _timed_flush(self):
+        """Flushes the current batch once its window has passed."""
+        try:
+            self.flush()
+        except Exception as e:
+            self._error_callback(e)
@@ -0,0 +1,92 @@
+"""
+KeyedWorkerPool runs work on a bounded thread pool, preserving order for work sharing a key.
+"""
+
+import collections
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+
+
+class KeyedWorkerPool(object):
+    """
+    A thread pool which runs work items concurrently, except for items sharing a key.
+
+    Work submitted with the same key (for example, a Kubernetes object's uid) is run serially, in
+    submission order. Work with different keys runs concurrently on up to `max_workers` threads.
+
+    If `max_pending` is set, submit will block while that many work items are queued or running,
+    which applies backpressure to the submitting thread.
+    """
+
+    def __init__(self, max_workers, max_pending=None):
+        """
+        Args:
+            max_workers: The maximum number of threads to run work on.
+            max_pending: If set, the maximum number of submitted work items which may be queued or
+                running at any time.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        # Map of key to a deque of (future, fn, args) tuples waiting on the key's running work.
+        # A key is present iff work for that key is running.
+        self._queues = {}
+        self._pending_count = 0
+        self._slots = threading.BoundedSemaphore(max_pending) if max_pending else None
+
+    @property
+    def pending_count(self):
+        """The number of work items currently queued or running."""
+        return self._pending_count
+
+    def submit(self, key, fn, *args):
+        """
+        Schedules fn(*args) to be run after all previously-submitted work with the same key.
+
+        This blocks if the pool has `max_pending` items queued or running.
+
+        Args:
+            key: The (hashable) key to serialize work on.
+            fn: The function to run.
+            args: The arguments to pass to fn.
+
+        Returns:
+            A concurrent.futures.Future holding the result of the call.
+        """
+        if self._slots:
+            self._slots.acquire()
+        future = Future()
+        with self._lock:
+            self._pending_count += 1
+            queue = self._queues.get(key)
+            if queue is not None:
+                # Work with this key is running; its worker will pick this up when done.
+                queue.append((future, fn, args))
+                return future
+            self._queues[key] = collections.deque()
+        self._executor.submit(self._run, key, future, fn, args)
+        return future
+
+    def _run(self, key, future, fn, args):
+        """Runs the given work, followed by any work queued on the same key."""
+        while True:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+            with self._lock:
+                self._pending_count -= 1
+                queue = self._queues[key]
+                if queue:
+                    future, fn, args = queue.popleft()
+                else:
+                    del self._queues[key]
+                    future = None
+            if self._slots:
+                self._slots.release()
+            if future is None:
+                return
+
+    def shutdown(self, wait=True):
+        """Stops accepting work, optionally waiting for running work to finish."""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,234 @@
+"""
+LeaderElector elects a single active replica of an initializer, using a ConfigMap as the lock.
+"""
+
+import datetime
+import json
+import logging
+import socket
+import threading
+import time
+
+import kubernetes
+from kubernetes.client.models.v1_config_map import V1ConfigMap
+from kubernetes.client.models.v1_object_meta import V1ObjectMeta
+from kubernetes.client.rest import ApiException
+
+logger = logging.getLogger(__name__)
+
+# The annotation holding the leader record; this matches client-go's ConfigMap lock.
+LEADER_ANNOTATION = 'control-plane.alpha.kubernetes.io/leader'
+
+
+def _timestamp():
+    """Returns the current time, formatted for a leader record."""
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class LeaderElector(object):
+    """
+    Elects one leader among the replicas of an initializer.
+
+    The leader holds a lease recorded in an annotation on a shared ConfigMap, and renews it every
+    `retry_interval_seconds`. Standbys check the lease at the same interval, and take over once it
+    hasn't been renewed for `lease_seconds`, or immediately once the leader releases it on stop.
+
+    Lease expiry is measured on the standby's own clock, from when it last saw the record change,
+    so replicas' clocks don't need to agree. The leader measures its own lease from when it sent
+    its last successful renewal, and stops reporting leadership once that's `lease_seconds` old,
+    even while a renewal is still in flight. Each API call times out after
+    `request_timeout_seconds`, so a hung call can't hold up a step-down.
+    """
+
+    def __init__(self,
+                 api_client,
+                 name,
+                 namespace,
+                 identity=None,
+                 lease_seconds=15,
+                 retry_interval_seconds=1,
+                 request_timeout_seconds=None):
+        """
+        Args:
+            api_client: The kubernetes.client.api_client.ApiClient to use.
+            name: The name of the ConfigMap to use as the lock. It's created if missing.
+            namespace: The namespace of the ConfigMap.
+            identity: The unique name of this replica. Defaults to the hostname, which is the pod
+                name when running in Kubernetes.
+            lease_seconds: The time after its last renewal that a leader's lease expires.
+            retry_interval_seconds: The time between renewals by the leader, and between checks by
+                standbys. This bounds the failover time when a leader stops cleanly.
+            request_timeout_seconds: The timeout for each API call. Defaults to half of
+                lease_seconds.
+
+        Raises:
+            ValueError: If request_timeout_seconds isn't shorter than lease_seconds.
+        """
+        if request_timeout_seconds is None:
+            request_timeout_seconds = lease_seconds / 2
+        if request_timeout_seconds >= lease_seconds:
+            raise ValueError('request_timeout_seconds must be shorter than lease_seconds.')
+        self._core_client = kubernetes.client.CoreV1Api(api_client)
+        self.name = name
+        self.namespace = namespace
+        self.identity = identity or socket.gethostname()
+        self._lease_seconds = lease_seconds
+        self._retry_interval_seconds = retry_interval_seconds
+        self._request_timeout_seconds = request_timeout_seconds
+        self._is_leader = False
+        self._listeners = []
+        self._stopped = threading.Event()
+        self._thread = None
+        # The last leader record seen, and the monotonic time it was first seen.
+        self._observed_record = None
+        self._observed_time = None
+        # The monotonic time our last successful renewal was sent.
+        self._renewed_time = None
+
+    @property
+    def is_leader(self):
+        """Whether this replica currently holds an unexpired lease."""
+        renewed_time = self._renewed_time
+        return (self._is_leader and renewed_time is not None
+                and time.monotonic() - renewed_time < self._lease_seconds)
+
+    @property
+    def running(self):
+        """Whether the background renewal thread is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_listener(self, listener):
+        """Registers a function to call with the new is_leader value whenever it changes."""
+        self._listeners.append(listener)
+
+    def start(self, error_callback):
+        """
+        Makes a first attempt to acquire the lease, then keeps trying (or renewing) on a background
+        thread until stopped.
+
+        Args:
+            error_callback: The function to invoke with any exception caught during background
+                attempts.
+
+        Raises:
+            kubernetes.client.rest.ApiException: If the first attempt fails.
+        """
+        self._stopped.clear()
+        self.try_acquire_or_renew()
+        self._thread = threading.Thread(target=self._run, args=(error_callback, ), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops trying to lead, releasing the lease if held so a standby takes over at once."""
+        self._stopped.set()
+        if not self._is_leader:
+            return
+        self._set_leader(False)
+        try:
+            config_map = self._core_client.read_namespaced_config_map(
+                self.name, self.namespace, _request_timeout=self._request_timeout_seconds)
+            record = json.loads(config_map.metadata.annotations[LEADER_ANNOTATION])
+            if record.get('holderIdentity') == self.identity:
+                record['holderIdentity'] = ''
+                config_map.metadata.annotations[LEADER_ANNOTATION] = json.dumps(record)
+                self._core_client.replace_namespaced_config_map(
+                    self.name, self.namespace, config_map,
+                    _request_timeout=self._request_timeout_seconds)
+        except (ApiException, KeyError, ValueError) as e:
+            logger.warning('Failed to release leader lease %s: %s', self.name, e)
+
+    def try_acquire_or_renew(self):
+        """
+        Acquires the lease if it's free or expired, or renews it if held.
+
+        Returns:
+            Whether this replica holds the lease.
+
+        Raises:
+            kubernetes.client.rest.ApiException: If the ConfigMap can't be read or written, other
+                than a 409 Conflict from another replica's concurrent update.
+        """
+        # The lease runs from when the renewal was sent, not from when it returned.
+        started_time = time.monotonic()
+        try:
+            config_map = self._core_client.read_namespaced_config_map(
+                self.name, self.namespace, _request_timeout=self._request_timeout_seconds)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            config_map = None
+
+        record = {}
+        if config_map is not None:
+            raw_record = (config_map.metadata.annotations or {}).get(LEADER_ANNOTATION)
+            if raw_record != self._observed_record:
+                self._observed_record = raw_record
+                self._observed_time = time.monotonic()
+            record = json.loads(raw_record) if raw_record else {}
+            holder = record.get('holderIdentity')
+            lease_seconds = record.get('leaseDurationSeconds', self._lease_seconds)
+            if (holder and holder != self.identity
+                    and time.monotonic() - self._observed_time < lease_seconds):
+                self._set_leader(False)
+                return False
+
+        now = _timestamp()
+        held = record.get('holderIdentity') == self.identity
+        new_record = {
+            'holderIdentity': self.identity,
+            'leaseDurationSeconds': self._lease_seconds,
+            'acquireTime': record.get('acquireTime') if held else now,
+            'renewTime': now,
+            'leaderTransitions': record.get('leaderTransitions', 0) + (0 if held else 1),
+        }
+        raw_record = json.dumps(new_record)
+        try:
+            if config_map is None:
+                self._core_client.create_namespaced_config_map(
+                    self.namespace,
+                    V1ConfigMap(
+                        metadata=V1ObjectMeta(
+                            name=self.name,
+                            namespace=self.namespace,
+                            annotations={LEADER_ANNOTATION: raw_record})),
+                    _request_timeout=self._request_timeout_seconds)
+            else:
+                config_map.metadata.annotations = config_map.metadata.annotations or {}
+                config_map.metadata.annotations[LEADER_ANNOTATION] = raw_record
+                self._core_client.replace_namespaced_config_map(
+                    self.name, self.namespace, config_map,
+                    _request_timeout=self._request_timeout_seconds)
+        except ApiException as e:
+            if e.status != 409:
+                raise
+            # Another replica updated the lock first.
+            self._set_leader(False)
+            return False
+        self._observed_record = raw_record
+        self._observed_time = time.monotonic()
+        self._renewed_time = started_time
+        self._set_leader(True)
+        return True
+
+    def _run(self, error_callback):
+        """Tries to acquire or renew the lease until stopped."""
+        while not self._stopped.wait(self._retry_interval_seconds):
+            try:
+                self.try_acquire_or_renew()
+            except Exception as e:
+                # Step down if we can't renew before the lease runs out, since a standby may
+                # take over.
+                if (self._is_leader
+                        and time.monotonic() - self._renewed_time >= self._lease_seconds):
+                    self._set_leader(False)
+                error_callback(e)
+
+    def _set_leader(self, is_leader):
+        """Records leadership, notifying listeners if it changed."""
+        if is_leader == self._is_leader:
+            return
+        self._is_leader = is_leader
+        logger.info('%s %s leadership of %s.', self.identity,
+                    'acquired' if is_leader else 'lost', self.name)
+        for listener in self._listeners:
+            listener(is_leader)
@@ -0,0 +1,196 @@
+"""
+LoadSheddingPolicy decides when an overloaded initializer stops running handlers, and what it does
+with items instead. This module also holds the helpers ordering items by their clients' deadlines.
+"""
+
+import logging
+import threading
+
+from .metrics import ITEMS_SHED, LOAD_SHEDDING_ACTIVE, LOAD_SHEDDING_TRANSITIONS
+from .rejection import Rejection
+from .tracking_store import creation_age_seconds
+
+logger = logging.getLogger(__name__)
+
+# Degraded modes.
+FAIL_OPEN = 'accept'
+FAIL_CLOSED = 'reject'
+
+
+def is_expired(item, deadline_seconds):
+    """
+    Returns True if the given item's creating client has stopped waiting for it.
+
+    Args:
+        item: The item to check.
+        deadline_seconds: How long after an item's creation its client gives up, or None if never.
+    """
+    if not deadline_seconds:
+        return False
+    age = creation_age_seconds(item)
+    return age is not None and age > deadline_seconds
+
+
+def by_deadline(items, deadline_seconds):
+    """
+    Returns the given pending items sorted for handling, earliest client deadline first.
+
+    Items within their deadline come first, oldest first, followed by items which are already past
+    their deadline.
+    """
+
+    def priority(item):
+        age = creation_age_seconds(item) or 0
+        return (is_expired(item, deadline_seconds), -age)
+
+    return sorted(items, key=priority)
+
+
+class LoadSheddingPolicy(object):
+    """
+    A backlog-triggered degraded mode for controllers.
+
+    A controller enters degraded mode once its backlog of pending items reaches `enter_backlog`,
+    or its oldest pending item reaches `enter_age_seconds` old. It stays degraded until both have
+    fallen back to `exit_backlog` and `exit_age_seconds`, so that it doesn't flap at the boundary.
+
+    While degraded, items are not passed to the controller's handler. In FAIL_OPEN mode they're
+    accepted unchanged; in FAIL_CLOSED mode they're rejected with `rejection_reason`. Either way,
+    the backlog drains quickly, instead of growing as clients time out and retry.
+
+    Each controller's state is tracked separately, by controller name.
+    """
+
+    def __init__(self,
+                 mode=FAIL_OPEN,
+                 enter_backlog=None,
+                 exit_backlog=None,
+                 enter_age_seconds=None,
+                 exit_age_seconds=None,
+                 rejection_reason='InitializerOverloaded'):
+        """
+        Args:
+            mode: FAIL_OPEN to accept items while degraded, or FAIL_CLOSED to reject them.
+            enter_backlog: The number of pending items at which to enter degraded mode.
+            exit_backlog: The number of pending items at or below which to leave degraded mode.
+                Defaults to half of enter_backlog.
+            enter_age_seconds: The age of the oldest pending item at which to enter degraded mode.
+            exit_age_seconds: The age of the oldest pending item at or below which to leave
+                degraded mode. Defaults to half of enter_age_seconds.
+            rejection_reason: The reason for rejections in FAIL_CLOSED mode.
+
+        Raises:
+            ValueError: If mode is unknown, or neither threshold is set.
+        """
+        if mode not in (FAIL_OPEN, FAIL_CLOSED):
+            raise ValueError('Unknown load shedding mode {}.'.format(mode))
+        if enter_backlog is None and enter_age_seconds is None:
+            raise ValueError('One of enter_backlog or enter_age_seconds is required.')
+        self.mode = mode
+        self._enter_backlog = enter_backlog
+        self._exit_backlog = exit_backlog if exit_backlog is not None else (enter_backlog or 0) / 2
+        self._enter_age_seconds = enter_age_seconds
+        self._exit_age_seconds = (exit_age_seconds if exit_age_seconds is not None else
+                                  (enter_age_seconds or 0) / 2)
+        self._rejection_reason = rejection_reason
+        self._lock = threading.Lock()
+        # Set of names of degraded controllers.
+        self._degraded = set()
+
+    def is_degraded(self, controller_name):
+        """Returns whether the named controller is in degraded mode."""
+        with self._lock:
+            return controller_name in self._degraded
+
+    def update(self, controller_name, backlog, oldest_age_seconds):
+        """
+        Updates a controller's mode for its current load.
+
+        Args:
+            controller_name: The name of the controller.
+            backlog: The number of items pending on the controller.
+            oldest_age_seconds: The age of the oldest pending item, or None if unknown.
+
+        Returns:
+            True if the controller entered degraded mode, False if it left it, or None if its mode
+            didn't change.
+        """
+        age = oldest_age_seconds or 0
+        with self._lock:
+            degraded = controller_name in self._degraded
+            if not degraded and (
+                (self._enter_backlog is not None and backlog >= self._enter_backlog) or
+                (self._enter_age_seconds is not None and age >= self._enter_age_seconds)):
+                self._degraded.add(controller_name)
+                return True
+            if degraded and (
+                (self._enter_backlog is None or backlog <= self._exit_backlog) and
+                (self._enter_age_seconds is None or age <= self._exit_age_seconds)):
+                self._degraded.discard(controller_name)
+                return False
+            return None
+
+    def degraded_result(self, item):
+        """
+        Returns the result for an item handled in degraded mode.
+
+        Returns:
+            The unchanged item in FAIL_OPEN mode, or a Rejection in FAIL_CLOSED mode.
+        """
+        if self.mode == FAIL_OPEN:
+            return item
+        return Rejection(
+            message='Initializer overloaded; rejecting {}.'.format(item.metadata.name),
+            reason=self._rejection_reason,
+            code=503)
+
+
+class LoadShedder(object):
+    """
+    Applies an InitializerController's LoadSheddingPolicies to its controllers, logging and
+    recording mode transitions and shed items in its Metrics.
+    """
+
+    def __init__(self, load_shedding, metrics):
+        """
+        Args:
+            load_shedding: None, a LoadSheddingPolicy for all controllers, or a dict of controller
+                name to the LoadSheddingPolicy for that controller.
+            metrics: The Metrics to record transitions and shed items in.
+        """
+        self._load_shedding = load_shedding
+        self._metrics = metrics
+
+    def policy(self, controller_name):
+        """Returns the LoadSheddingPolicy for the named controller, or None."""
+        if isinstance(self._load_shedding, dict):
+            return self._load_shedding.get(controller_name)
+        return self._load_shedding
+
+    def update(self, controller_name, backlog, oldest_age_seconds):
+        """Updates the named controller's mode for its current load. See LoadSheddingPolicy."""
+        policy = self.policy(controller_name)
+        entered = policy.update(controller_name, backlog, oldest_age_seconds) if policy else None
+        if entered is None:
+            return
+        if entered:
+            logger.warning('%s entered degraded mode with %s pending items, the oldest %ss old.',
+                           controller_name, backlog, oldest_age_seconds)
+        else:
+            logger.warning('%s left degraded mode.', controller_name)
+        self._metrics.increment(
+            LOAD_SHEDDING_TRANSITIONS, controller_name, state='entered' if entered else 'exited')
+        self._metrics.set_gauge(LOAD_SHEDDING_ACTIVE, controller_name, 1 if entered else 0)
+
+    def is_degraded(self, controller_name):
+        """Returns whether the named controller is in degraded mode."""
+        policy = self.policy(controller_name)
+        return bool(policy and policy.is_degraded(controller_name))
+
+    def shed_result(self, controller_name, item):
+        """Returns the degraded-mode result for an item if its controller is degraded, or None."""
+        if not self.is_degraded(controller_name):
+            return None
+        policy = self.policy(controller_name)
+        self._metrics.increment(ITEMS_SHED, controller_name, mode=policy.mode)
+        return policy.degraded_result(item)
@@ -0,0 +1,209 @@
+"""
+Metrics records counters and histograms for an initializer, and serves them to Prometheus.
+
+Exports:
+    Metrics: A thread-safe collection of per-controller metrics.
+"""
+
+import collections
+import contextlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import threading
+import time
+
+# Histogram buckets, in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+EVENTS_RECEIVED = 'initializer_events_received_total'
+EVENTS_FILTERED = 'initializer_events_filtered_total'
+HANDLE_SECONDS = 'initializer_handle_seconds'
+UPDATE_SECONDS = 'initializer_update_seconds'
+RESULTS = 'initializer_results_total'
+INITIALIZATION_LATENCY_SECONDS = 'initializer_latency_seconds'
+WATCH_RECONNECTS = 'initializer_watch_reconnects_total'
+DECISION_CACHE_LOOKUPS = 'initializer_decision_cache_lookups_total'
+ITEMS_EXPIRED = 'initializer_items_expired_total'
+LOAD_SHEDDING_ACTIVE = 'initializer_load_shedding_active'
+LOAD_SHEDDING_TRANSITIONS = 'initializer_load_shedding_transitions_total'
+ITEMS_SHED = 'initializer_items_shed_total'
+SPECULATIVE_EVALUATIONS = 'initializer_speculative_evaluations_total'
+SPECULATION_LOOKUPS = 'initializer_speculation_lookups_total'
+
+# Map of metric name to (type, help text).
+_METRIC_INFO = collections.OrderedDict([
+    (EVENTS_RECEIVED, ('counter', 'Items received from list and watch calls.')),
+    (EVENTS_FILTERED, ('counter', 'Items received which did not need handling.')),
+    (HANDLE_SECONDS, ('histogram', 'Time spent in handle_item.')),
+    (UPDATE_SECONDS, ('histogram', 'Time spent in update_item.')),
+    (RESULTS, ('counter', 'Handled items, by result.')),
+    (INITIALIZATION_LATENCY_SECONDS, ('histogram',
+                                      'Time from item creation to a successful update.')),
+    (WATCH_RECONNECTS, ('counter', 'Watch connections reopened.')),
+    (DECISION_CACHE_LOOKUPS, ('counter', 'Decision cache lookups, by hit or miss.')),
+    (ITEMS_EXPIRED, ('counter', 'Pending items skipped for being past their client deadline.')),
+    (LOAD_SHEDDING_ACTIVE, ('gauge', '1 while a controller is in degraded mode, else 0.')),
+    (LOAD_SHEDDING_TRANSITIONS, ('counter', 'Entries to and exits from degraded mode.')),
+    (ITEMS_SHED, ('counter', 'Items accepted or rejected in degraded mode, without handling.')),
+    (SPECULATIVE_EVALUATIONS, ('counter', 'Items handled ahead of their turn.')),
+    (SPECULATION_LOOKUPS, ('counter', 'Speculative decision lookups, by hit or miss.')),
+])
+
+
+def _format_labels(labels):
+    """Formats a tuple of (name, value) label pairs in Prometheus text format."""
+    if not labels:
+        return ''
+    formatted = []
+    for name, value in labels:
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        formatted.append('{}="{}"'.format(name, escaped))
+    return '{' + ','.join(formatted) + '}'
+
+
+class Metrics(object):
+    """
+    A thread-safe collection of counters, gauges, and histograms, labeled by controller name.
+
+    Metrics are rendered in the Prometheus text exposition format by render, which
+    start_http_server serves over HTTP.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            buckets: The upper bounds of the histogram buckets, in ascending order.
+        """
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # Map of (name, labels) to count.
+        self._counters = collections.defaultdict(int)
+        # Map of (name, labels) to value.
+        self._gauges = {}
+        # Map of (name, labels) to [per-bucket counts, sum, count].
+        self._histograms = {}
+
+    def increment(self, name, controller_name, amount=1, **labels):
+        """
+        Increments a counter.
+
+        Args:
+            name: The name of the counter.
+            controller_name: The name of the controller to label the count with.
+            amount: The amount to increment by.
+            labels: Any additional labels.
+        """
+        key = (name, (('controller', controller_name), ) + tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+
+    def set_gauge(self, name, controller_name, value):
+        """
+        Sets a gauge.
+
+        Args:
+            name: The name of the gauge.
+            controller_name: The name of the controller to label the value with.
+            value: The new value.
+        """
+        key = (name, (('controller', controller_name), ))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, controller_name, value):
+        """
+        Records a value in a histogram.
+
+        Args:
+            name: The name of the histogram.
+            controller_name: The name of the controller to label the value with.
+            value: The value to record.
+        """
+        key = (name, (('controller', controller_name), ))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self._buckets), 0.0, 0]
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, name, controller_name):
+        """Returns a context manager recording the time spent in its body in a histogram."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, controller_name, time.monotonic() - start)
+
+    def get(self, name, controller_name, **labels):
+        """Returns the current value of a counter or gauge, or the count of a histogram."""
+        key = (name, (('controller', controller_name), ) + tuple(sorted(labels.items())))
+        with self._lock:
+            if key in self._histograms:
+                return self._histograms[key][2]
+            if key in self._gauges:
+                return self._gauges[key]
+            return self._counters.get(key, 0)
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items()) + sorted(self._gauges.items())
+            histograms = sorted(
+                (key, (list(buckets), total, count))
+                for key, (buckets, total, count) in self._histograms.items())
+
+        lines = []
+        for name, (metric_type, help_text) in _METRIC_INFO.items():
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            for (counter_name, labels), value in counters:
+                if counter_name == name:
+                    lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+            for (histogram_name, labels), (buckets, total, count) in histograms:
+                if histogram_name != name:
+                    continue
+                for bound, bucket_count in zip(self._buckets, buckets):
+                    bucket_labels = labels + (('le', repr(float(bound))), )
+                    lines.append('{}_bucket{} {}'.format(name, _format_labels(bucket_labels),
+                                                         bucket_count))
+                inf_labels = labels + (('le', '+Inf'), )
+                lines.append('{}_bucket{} {}'.format(name, _format_labels(inf_labels), count))
+                lines.append('{}_sum{} {}'.format(name, _format_labels(labels), total))
+                lines.append('{}_count{} {}'.format(name, _format_labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+    def start_http_server(self, port, address=''):
+        """
+        Serves the rendered metrics over HTTP on a background thread.
+
+        Args:
+            port: The port to listen on. Zero picks a free port.
+            address: The address to listen on. Defaults to all interfaces.
+
+        Returns:
+            The running http.server.HTTPServer. Call shutdown on this to stop serving.
+        """
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            """Responds to every GET request with the rendered metrics."""
+
+            def do_GET(self):
+                body = metrics.render().encode('utf8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Don't log every scrape to stderr.
+                pass
+
+        server = HTTPServer((address, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,283 @@
+"""
+OwnerResolver looks up the owners of Kubernetes objects from local caches kept fresh by watches.
+
+Exports:
+    ResourceCache: A local copy of all objects of one type, kept up to date by a watch.
+    OwnerResolver: Walks `metadata.ownerReferences` through ResourceCaches.
+"""
+
+import logging
+import threading
+import time
+
+import kubernetes
+from kubernetes.client.rest import ApiException
+
+from .resource_handler import ResourceHandler
+
+logger = logging.getLogger(__name__)
+
+# Map of owner kind to the ResourceHandler factory for that kind.
+OWNER_HANDLER_FACTORIES = {
+    'ReplicaSet': ResourceHandler.replica_set_handler,
+    'Deployment': ResourceHandler.deployment_handler,
+    'DaemonSet': ResourceHandler.daemon_set_handler,
+    'Job': ResourceHandler.job_handler,
+    'CronJob': ResourceHandler.cron_job_handler,
+}
+
+
+class ResourceCache(object):
+    """
+    A thread-safe local copy of all objects of one type, kept up to date by a list and watch.
+
+    Objects are listed once, and then watched from the list's resourceVersion on a background
+    thread. A fresh list is only made if the API server reports that the resourceVersion has
+    expired (410 Gone).
+    """
+
+    def __init__(self, resource_handler, request_timeout_seconds=30, retry_delay_seconds=1):
+        """
+        Args:
+            resource_handler: The ResourceHandler for the cached type.
+            request_timeout_seconds: The amount of time to allow watches to be idle before
+                reconnecting.
+            retry_delay_seconds: The time to wait before relisting or rewatching after an error.
+        """
+        self._resource_handler = resource_handler
+        self._request_timeout_seconds = request_timeout_seconds
+        self._retry_delay_seconds = retry_delay_seconds
+        self._lock = threading.Lock()
+        # Map of (namespace, name) to object.
+        self._items = {}
+        self._resource_version = None
+        self._stopped = threading.Event()
+        self._watch = None
+        # Set once the first list has been loaded.
+        self.synced = threading.Event()
+
+    @property
+    def name(self):
+        """The name of the cached resource type."""
+        return self._resource_handler.name
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def get(self, namespace, name):
+        """Returns the cached object with the given namespace and name, or None."""
+        with self._lock:
+            return self._items.get((namespace, name))
+
+    def read(self, namespace, name):
+        """
+        Returns the object with the given namespace and name, reading it from the API on a miss.
+
+        Objects read from the API are added to the cache, so a newly-created object is only read
+        once even if its watch event hasn't arrived yet.
+
+        Raises:
+            kubernetes.client.rest.ApiException: If the API server returns an error other than a
+                404 Not Found.
+        """
+        item = self.get(namespace, name)
+        if item is not None:
+            return item
+        try:
+            item = self._resource_handler.read_item(name, namespace)
+        except ApiException as e:
+            if e.status == 404:
+                return None
+            raise
+        self._put(item)
+        return item
+
+    def start(self, error_callback):
+        """
+        Starts keeping the cache up to date, on a background thread.
+
+        Args:
+            error_callback: The function to invoke with any exception caught. The cache keeps
+                retrying after errors until stop is called.
+        """
+        self._stopped.clear()
+        threading.Thread(target=self._run, args=(error_callback, ), daemon=True).start()
+
+    def stop(self):
+        """Stops updating the cache. Cached objects remain readable."""
+        self._stopped.set()
+        if self._watch:
+            self._watch.stop()
+
+    def _run(self, error_callback):
+        """Lists and watches objects until stopped."""
+        while not self._stopped.is_set():
+            try:
+                if self._resource_version is None:
+                    self._relist()
+                self._watch_once()
+            except Exception as e:
+                error_callback(e)
+                self._stopped.wait(self._retry_delay_seconds)
+
+    def _relist(self):
+        """Replaces the cache contents with a fresh list."""
+        resource_versions = []
+
+        def record_list_metadata(list_metadata):
+            """Records the resourceVersion of each page; these are the same for all pages."""
+            resource_versions.append(list_metadata.resource_version)
+
+        items = {}
+        for item in self._resource_handler.iter_items(metadata_callback=record_list_metadata):
+            items[(item.metadata.namespace, item.metadata.name)] = item
+        with self._lock:
+            self._items = items
+        self._resource_version = resource_versions[0] if resource_versions else None
+        self.synced.set()
+        logger.debug('Cached %s %s items.', len(items), self.name)
+
+    def _watch_once(self):
+        """Applies watch events until the watch times out, fails, or is stopped."""
+        self._watch = kubernetes.watch.Watch()
+        kwargs = dict(self._resource_handler.selector_kwargs)
+        if self._resource_version:
+            kwargs['resource_version'] = self._resource_version
+        for event in self._watch.stream(
+                self._resource_handler.list_all_items_fn,
+                include_uninitialized=True,
+                timeout_seconds=self._request_timeout_seconds,
+                _request_timeout=self._request_timeout_seconds + 5,
+                **kwargs):
+            if event['type'] == 'ERROR':
+                if event['raw_object'].get('code') == 410:
+                    logger.info('Watch on %s expired; relisting.', self.name)
+                    self._resource_version = None
+                    return
+                raise ApiException(
+                    status=event['raw_object'].get('code'),
+                    reason=event['raw_object'].get('message'))
+            item = event['object']
+            self._resource_version = item.metadata.resource_version
+            if event['type'] == 'DELETED':
+                with self._lock:
+                    self._items.pop((item.metadata.namespace, item.metadata.name), None)
+            else:
+                self._put(item)
+
+    def _put(self, item):
+        """Adds or replaces an object in the cache."""
+        with self._lock:
+            self._items[(item.metadata.namespace, item.metadata.name)] = item
+
+
+class OwnerResolver(object):
+    """
+    Resolves the owners of objects through local ResourceCaches.
+
+    This is meant to be shared by all of an initializer's controllers, so that handlers needing an
+    item's owning ReplicaSet, Deployment, or Job don't have to make API calls for every item. For
+    example:
+
+        resolver = OwnerResolver.for_api_client(api_client)
+        resolver.start(logger.exception)
+
+        def handle_item(item):
+            owners = resolver.owners(item)
+            ...
+    """
+
+    def __init__(self, caches):
+        """
+        Args:
+            caches: A dict of owner kind (such as 'ReplicaSet') to the ResourceCache for that kind.
+                Owners of other kinds are not resolved.
+        """
+        self.caches = caches
+
+    @staticmethod
+    def for_api_client(api_client, kinds=None, request_timeout_seconds=30, **kwargs):
+        """
+        Builds an OwnerResolver caching the given kinds, using the ResourceHandler factories.
+
+        Args:
+            api_client: The kubernetes.client.api_client.ApiClient to use.
+            kinds: The owner kinds to cache. Defaults to all of OWNER_HANDLER_FACTORIES.
+            request_timeout_seconds: The amount of time to allow watches to be idle before
+                reconnecting.
+            kwargs: Keyword arguments for the ResourceHandler factories, such as label_selector.
+        """
+        kinds = kinds or list(OWNER_HANDLER_FACTORIES)
+        return OwnerResolver({
+            kind: ResourceCache(
+                OWNER_HANDLER_FACTORIES[kind](api_client, **kwargs), request_timeout_seconds)
+            for kind in kinds
+        })
+
+    def start(self, error_callback):
+        """Starts all caches. See ResourceCache.start."""
+        for cache in self.caches.values():
+            cache.start(error_callback)
+
+    def stop(self):
+        """Stops all caches."""
+        for cache in self.caches.values():
+            cache.stop()
+
+    def wait_for_sync(self, timeout_seconds=None):
+        """Waits until all caches have loaded, returning False on timeout."""
+        deadline = None if timeout_seconds is None else time.monotonic() + timeout_seconds
+        for cache in self.caches.values():
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not cache.synced.wait(remaining):
+                return False
+        return True
+
+    def owner(self, item):
+        """
+        Returns the controlling owner of the given item, or None.
+
+        An owner is only returned if its kind is cached, and its uid matches the item's owner
+        reference.
+
+        Args:
+            item: A Kubernetes object model.
+
+        Raises:
+            kubernetes.client.rest.ApiException: If the API server returns an error when reading an
+                owner missing from the cache.
+        """
+        for reference in item.metadata.owner_references or []:
+            if not reference.controller:
+                continue
+            cache = self.caches.get(reference.kind)
+            if cache is None:
+                return None
+            owner = cache.read(item.metadata.namespace, reference.name)
+            if owner is None or owner.metadata.uid != reference.uid:
+                return None
+            return owner
+        return None
+
+    def owners(self, item):
+        """
+        Returns the chain of controlling owners of the given item, nearest first.
+
+        For a pod created by a Deployment, this is the pod's ReplicaSet followed by the Deployment.
+
+        Args:
+            item: A Kubernetes object model.
+
+        Raises:
+            kubernetes.client.rest.ApiException: If the API server returns an error when reading an
+                owner missing from the cache.
+        """
+        owners = []
+        seen = set()
+        owner = self.owner(item)
+        while owner is not None and owner.metadata.uid not in seen:
+            seen.add(owner.metadata.uid)
+            owners.append(owner)
+            owner = self.owner(owner)
+        return owners
@@ -0,0 +1,55 @@
+"""
+PollSchedule decides when to next poll a controller, based on whether the last poll found work.
+"""
+
+import random
+
+
+class PollSchedule(object):
+    """
+    An adaptive polling interval for one controller.
+
+    After a poll which found pending items, the next poll is immediate, since more items are likely
+    on the way. After an idle poll, the interval backs off exponentially from `min_interval_seconds`
+    up to `latency_target_seconds`, the longest a new item may wait to be noticed. Intervals are
+    jittered downwards, so that replicas and controllers don't poll in lockstep, without ever
+    exceeding the latency target.
+    """
+
+    def __init__(self,
+                 latency_target_seconds=5,
+                 min_interval_seconds=0.1,
+                 backoff_factor=2,
+                 jitter=0.2,
+                 random_function=random.random):
+        """
+        Args:
+            latency_target_seconds: The maximum interval between polls.
+            min_interval_seconds: The interval after the first idle poll.
+            backoff_factor: The factor the interval grows by after each further idle poll.
+            jitter: The maximum fraction by which each interval is randomly shortened.
+            random_function: A function returning a random float in [0, 1).
+        """
+        self.latency_target_seconds = latency_target_seconds
+        self._min_interval_seconds = min(min_interval_seconds, latency_target_seconds)
+        self._backoff_factor = backoff_factor
+        self._jitter = jitter
+        self._random_function = random_function
+        self._idle_interval = None
+
+    def next_interval(self, found_pending):
+        """
+        Returns the time to wait before the next poll.
+
+        Args:
+            found_pending: Whether the last poll found any items pending on this initializer.
+        """
+        if found_pending:
+            self._idle_interval = None
+            return 0
+        if self._idle_interval is None:
+            self._idle_interval = self._min_interval_seconds
+        else:
+            self._idle_interval = min(self.latency_target_seconds,
+                                      self._idle_interval * self._backoff_factor)
+        return self._idle_interval * (1 - self._jitter * self._random_function())
@@ -0,0 +1,101 @@
+"""
+ProcessHandlerPool runs controllers' handle_item calls in worker processes, for CPU-bound handlers.
+"""
+
+import multiprocessing
+
+import kubernetes
+
+from .rejection import Rejection
+from .serialization import item_from_json, item_to_json
+
+# The controllers and ApiClient of a worker process, set when the worker starts.
+_worker_controllers = None
+_worker_api_client = None
+
+
+def _init_worker(controllers):
+    """Sets up a worker process with the controllers inherited from the parent."""
+    global _worker_controllers, _worker_api_client
+    _worker_controllers = controllers
+    _worker_api_client = kubernetes.client.ApiClient()
+
+
+def _handle_in_worker(controller_index, model_name, data):
+    """
+    Runs a controller's handle_item on a serialized item, in a worker process.
+
+    Returns:
+        A tuple of (model name, serialized result), or (None, serialized V1Status) for a rejection.
+    """
+    item = item_from_json(_worker_api_client, data, model_name)
+    try:
+        result = _worker_controllers[controller_index].handle_item(item)
+    except Rejection as rejection:
+        return None, item_to_json(_worker_api_client, rejection.status)
+    return type(result).__name__, item_to_json(_worker_api_client, result)
+
+
+class ProcessHandlerPool(object):
+    """
+    A pool of worker processes which run controllers' handle_item calls.
+
+    Items are sent to workers as compact JSON, and the handled item (or the Rejection) is sent back
+    the same way, so handlers are free of the GIL of the process doing watch I/O.
+
+    Workers are forked when the pool is created, and inherit the controllers then; handlers don't
+    need to be picklable. Any API clients a handler uses in a worker should be created in that
+    worker, since connections don't survive a fork. This requires a platform supporting fork.
+
+    Create the pool before starting any threads which do work, such as watches, a LeaderElector, or
+    a ShardMembership: a lock held by another thread when the workers fork stays held forever in
+    the workers.
+    """
+
+    def __init__(self, controllers, processes, api_client=None):
+        """
+        Args:
+            controllers: The ResourceControllers whose handle_item calls will be sent to the pool.
+            processes: The number of worker processes.
+            api_client: The ApiClient used to serialize and deserialize items. Defaults to a new
+                kubernetes.client.ApiClient.
+        """
+        self._controller_indexes = {
+            controller.name: index
+            for index, controller in enumerate(controllers)
+        }
+        self._api_client = api_client or kubernetes.client.ApiClient()
+        context = multiprocessing.get_context('fork')
+        self._pool = context.Pool(processes, _init_worker, (list(controllers), ))
+
+    def handle_item(self, controller, item):
+        """
+        Runs the given controller's handle_item on an item in a worker process, waiting for it.
+
+        Args:
+            controller: The controller to handle the item with. This must be one of the
+                controllers the pool was created with.
+            item: The item to handle.
+
+        Returns:
+            A copy of the item returned from handle_item.
+
+        Raises:
+            Rejection: If handle_item raised a Rejection.
+        """
+        model_name, data = self._pool.apply_async(
+            _handle_in_worker, (self._controller_indexes[controller.name], type(item).__name__,
+                                item_to_json(self._api_client, item))).get()
+        if model_name is None:
+            status = item_from_json(self._api_client, data, 'V1Status')
+            raise Rejection(
+                message=status.message,
+                reason=status.reason,
+                code=status.code,
+                details=status.details)
+        return item_from_json(self._api_client, data, model_name)
+
+    def close(self):
+        """Stops the worker processes, waiting for work in progress."""
+        self._pool.close()
+        self._pool.join()
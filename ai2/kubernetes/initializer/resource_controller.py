@@ -5,7 +5,7 @@ class ResourceController(object):
     """
     A ResourceController is responsible for all logic to accept or reject an uninitialized resource.
 
-    Subclasses should override handle_item.
+    Subclasses should override handle_item, or handle_items to handle items in batches.
     """
 
     def __init__(self, resource_handler):
@@ -26,17 +26,39 @@ class ResourceController(object):
         """Returns the list of all items of the handled type in the Kubernetes server."""
         return self._resource_handler.list_all_items()
 
-    def update_item(self, item):
+    @property
+    def selector_kwargs(self):
+        """Returns the selector keyword arguments to pass to every list or watch call."""
+        return self._resource_handler.selector_kwargs
+
+    def iter_items(self, resource_version=None, metadata_callback=None):
+        """Yields all items of the handled type in the Kubernetes server, one page at a time."""
+        return self._resource_handler.iter_items(resource_version, metadata_callback)
+
+    def aiter_items(self, resource_version=None, metadata_callback=None):
+        """Asynchronously yields all items of the handled type, for asyncio-based handlers."""
+        return self._resource_handler.aiter_items(resource_version, metadata_callback)
+
+    def read_item(self, name, namespace):
+        """Looks up the current version of a single item from the Kubernetes API."""
+        return self._resource_handler.read_item(name, namespace)
+
+    def snapshot_item(self, item):
+        """Captures the state of an item before it's handled, for use by update_item."""
+        return self._resource_handler.snapshot_item(item)
+
+    def update_item(self, item, snapshot=None):
         """
         Sends an update for the given item to the Kubernetes API.
 
         Args:
             item: The updated item to send. This must have valid metadata.
+            snapshot: The value returned from snapshot_item for the item before it was handled.
 
         Returns:
             The response from the API server to the request.
         """
-        return self._resource_handler.update_item(item)
+        return self._resource_handler.update_item(item, snapshot)
 
     def handle_item(self, item):
         """
@@ -60,3 +82,25 @@ class ResourceController(object):
         raise Rejection(
             message='Handler not implemented; rejecting {}.'.format(item.metadata.name),
             reason='RejectAll')
+
+    def handle_items(self, items):
+        """
+        Given a batch of resource items, decides on each of them.
+
+        This is only called if the initializer is configured with a batch size. The default calls
+        handle_item on each item in turn; override this to make one decision for a whole batch.
+
+        Args:
+            items: The list of items under consideration by the admission controller.
+
+        Returns:
+            A list with one entry per item, in the same order. Each entry is either the item to
+            post back to the Kubernetes API (as handle_item would return), or the Rejection for it.
+        """
+        results = []
+        for item in items:
+            try:
+                results.append(self.handle_item(item))
+            except Rejection as rejection:
+                results.append(rejection)
+        return results
@@ -2,11 +2,73 @@
 ResourceHandler is responsible for type-specific communication with the Kubernetes API.
 
 This contains a parent class, as well as instantiations of that class for common types (in
-Handlers).
+Handlers). The factory methods accept the optional ResourceHandler constructor arguments (such as
+page_size, label_selector, field_selector, and update_strategy) as keyword arguments, along with an
+optional namespace to restrict the handler to. If given a kubernetes_asyncio ApiClient, they build
+handlers whose API functions are coroutines.
 """
 
+import functools
+
 import kubernetes
 
+from .exceptions import InitializerError
+from .update_strategy import ReplaceUpdateStrategy
+
+
+def _client_module(api_client):
+    """
+    Returns the client module to build API objects with for the given ApiClient.
+
+    This is kubernetes_asyncio.client for a kubernetes_asyncio ApiClient, for use with an
+    AsyncInitializerController, and kubernetes.client otherwise.
+    """
+    if type(api_client).__module__.startswith('kubernetes_asyncio.'):
+        import kubernetes_asyncio.client
+        return kubernetes_asyncio.client
+    return kubernetes.client
+
+
+def _namespaced_list_function(list_namespaced_items, namespace):
+    """
+    Returns a list function for a single namespace, with the signature of a for_all_namespaces one.
+
+    The wrapper keeps the docstring of the wrapped function, which the watch code reads to find the
+    type of the listed items.
+    """
+
+    def list_items(*args, **kwargs):
+        return list_namespaced_items(namespace, *args, **kwargs)
+
+    return functools.update_wrapper(list_items, list_namespaced_items)
+
+
+def _build_handler(api, name, resource, namespace=None, **kwargs):
+    """
+    Constructs a ResourceHandler from the functions of an API object for the given resource.
+
+    Args:
+        api: The API object, such as a CoreV1Api.
+        name: The name of the handler.
+        resource: The resource name used in the API's function names, such as 'config_map'.
+        namespace: If set, the handler lists and watches only this namespace, and its name is
+            suffixed with it. Otherwise, all namespaces are listed.
+        kwargs: Any other ResourceHandler constructor arguments.
+    """
+    if namespace is None:
+        list_all_items = getattr(api, 'list_{}_for_all_namespaces'.format(resource))
+    else:
+        name = '{}/{}'.format(name, namespace)
+        list_all_items = _namespaced_list_function(
+            getattr(api, 'list_namespaced_{}'.format(resource)), namespace)
+    return ResourceHandler(
+        name=name,
+        list_all_items=list_all_items,
+        update_item=getattr(api, 'replace_namespaced_{}'.format(resource)),
+        read_item=getattr(api, 'read_namespaced_{}'.format(resource)),
+        patch_item=getattr(api, 'patch_namespaced_{}'.format(resource)),
+        **kwargs)
+
 
 class ResourceHandler(object):
     """
@@ -16,7 +78,16 @@ class ResourceHandler(object):
     writing changes to those items back to the API.
     """
 
-    def __init__(self, name, list_all_items, update_item):
+    def __init__(self,
+                 name,
+                 list_all_items,
+                 update_item,
+                 read_item=None,
+                 patch_item=None,
+                 update_strategy=None,
+                 page_size=None,
+                 label_selector=None,
+                 field_selector=None):
         """
         Args:
             name: A user-friendly name for logging and error reporting.
@@ -30,23 +101,141 @@ class ResourceHandler(object):
 
                 IMPORTANT NOTE: Per issue https://github.com/kubernetes/kubernetes/issues/49814,
                 this *must* be a replace_ method, NOT a patch_ method.
+            read_item: The Kubernetes API function used to look up a single item. This should
+                accept name and namespace parameters; the read_namespaced_{type} methods in the
+                python API meet this criteria. This is required to retry updates which fail with a
+                409 Conflict.
+            patch_item: The Kubernetes API function used to patch an item. This should accept name,
+                namespace, and body parameters, like the patch_namespaced_{type} methods in the
+                python API. This is required by JsonPatchUpdateStrategy.
+            update_strategy: The strategy used by update_item to save items. Defaults to a
+                ReplaceUpdateStrategy, which uses the update_item function.
+            page_size: If set, the maximum number of items to request per list call. Lists are then
+                fetched in chunks using the `limit` and `continue` list parameters, which requires
+                an API server and client supporting chunked lists (Kubernetes 1.9+).
+            label_selector: If set, a label selector passed to all list and watch calls, so that
+                filtering happens on the server.
+            field_selector: If set, a field selector passed to all list and watch calls, so that
+                filtering happens on the server.
         """
         self.name = name
         self._list_all_items = list_all_items
         self._update_item = update_item
+        self._read_item = read_item
+        self._patch_item = patch_item
+        self._update_strategy = update_strategy or ReplaceUpdateStrategy()
+        self._page_size = page_size
+        self._label_selector = label_selector
+        self._field_selector = field_selector
 
     @property
     def list_all_items_fn(self):
         """Returns the raw function which lists all items."""
         return self._list_all_items
 
+    @property
+    def selector_kwargs(self):
+        """Returns the selector keyword arguments to pass to every list or watch call."""
+        kwargs = {}
+        if self._label_selector:
+            kwargs['label_selector'] = self._label_selector
+        if self._field_selector:
+            kwargs['field_selector'] = self._field_selector
+        return kwargs
+
     def list_all_items(self):
         """Returns the list of all items of the handled type in the Kubernetes server."""
-        return self._list_all_items(include_uninitialized="true")
+        return self._list_all_items(include_uninitialized="true", **self.selector_kwargs)
+
+    def iter_items(self, resource_version=None, metadata_callback=None):
+        """
+        Yields all items of the handled type in the Kubernetes server.
+
+        If a page size was configured, items are fetched one page at a time, so only a single page
+        is held in memory at once.
+
+        Args:
+            resource_version: An optional resourceVersion hint for the first list call. A value of
+                "0" allows the API server to answer from its watch cache instead of etcd.
+            metadata_callback: If set, a function invoked with the list metadata (V1ListMeta) of
+                each page, before that page's items are yielded.
+
+        Yields:
+            Each item returned by the API server, in list order.
+        """
+        kwargs = self._first_page_kwargs(resource_version)
+        while kwargs is not None:
+            result = self._list_all_items(include_uninitialized="true", **kwargs)
+            if metadata_callback:
+                metadata_callback(result.metadata)
+            yield from result.items
+            kwargs = self._next_page_kwargs(kwargs, result)
+
+    async def aiter_items(self, resource_version=None, metadata_callback=None):
+        """
+        Asynchronously yields all items of the handled type in the Kubernetes server.
+
+        This is the equivalent of iter_items for handlers built on asyncio API functions, such as
+        those from a kubernetes_asyncio ApiClient.
+        """
+        kwargs = self._first_page_kwargs(resource_version)
+        while kwargs is not None:
+            result = await self._list_all_items(include_uninitialized="true", **kwargs)
+            if metadata_callback:
+                metadata_callback(result.metadata)
+            for item in result.items:
+                yield item
+            kwargs = self._next_page_kwargs(kwargs, result)
+
+    def _first_page_kwargs(self, resource_version):
+        """Returns the keyword arguments for the first list call of iter_items."""
+        kwargs = dict(self.selector_kwargs)
+        if resource_version is not None:
+            kwargs['resource_version'] = resource_version
+        if self._page_size:
+            kwargs['limit'] = self._page_size
+        return kwargs
+
+    def _next_page_kwargs(self, kwargs, result):
+        """Returns the keyword arguments for the list call following `result`, or None if done."""
+        # `_continue` is only present on list metadata from chunking-aware clients.
+        continue_token = getattr(result.metadata, '_continue', None)
+        if not self._page_size or not continue_token:
+            return None
+        next_kwargs = dict(kwargs)
+        # Continuation requests must not repeat the resourceVersion; the token encodes it.
+        next_kwargs.pop('resource_version', None)
+        next_kwargs['_continue'] = continue_token
+        return next_kwargs
+
+    def snapshot_item(self, item):
+        """
+        Captures the state of an item before it's handled, for use by update_item.
+
+        Args:
+            item: The item, before it's handled.
+
+        Returns:
+            The snapshot to pass to update_item. This may be None, depending on the update strategy.
+        """
+        return self._update_strategy.snapshot(item)
+
+    def update_item(self, item, snapshot=None):
+        """
+        Sends an update for the given item to the Kubernetes API, using the update strategy.
+
+        Args:
+            item: The updated item to send. This must have valid metadata.
+            snapshot: The value returned from snapshot_item for the item before it was handled.
+
+        Returns:
+            The response from the API server to the request.
+        """
+        return self._update_strategy.update(self, item, snapshot)
 
-    def update_item(self, item):
+    def replace_item(self, item):
         """
-        Sends an update for the given item to the Kubernetes API.
+        Sends the given item to the Kubernetes API, replacing the stored object.
 
         Args:
             item: The updated item to send. This must have valid metadata.
@@ -57,75 +246,121 @@ class ResourceHandler(object):
         return self._update_item(
             name=item.metadata.name, namespace=item.metadata.namespace, body=item)
 
+    def patch_item(self, item, patch):
+        """
+        Sends a patch for the given item to the Kubernetes API.
+
+        Args:
+            item: The item to patch. This must have valid metadata.
+            patch: The patch body to send.
+
+        Returns:
+            The response from the API server to the request.
+
+        Raises:
+            InitializerError: If this handler wasn't built with a patch_item function.
+        """
+        if not self._patch_item:
+            raise InitializerError('No patch_item function configured for {}.'.format(self.name))
+        return self._patch_item(
+            name=item.metadata.name, namespace=item.metadata.namespace, body=patch)
+
+    def read_item(self, name, namespace):
+        """
+        Looks up a single item from the Kubernetes API.
+
+        Args:
+            name: The name of the item.
+            namespace: The namespace of the item.
+
+        Returns:
+            The current version of the item.
+
+        Raises:
+            InitializerError: If this handler wasn't built with a read_item function.
+        """
+        if not self._read_item:
+            raise InitializerError('No read_item function configured for {}.'.format(self.name))
+        return self._read_item(name=name, namespace=namespace)
+
+    @staticmethod
+    def namespaced_handlers(factory, api_client, namespaces, **kwargs):
+        """
+        Constructs one handler per namespace, using one of the factory methods.
+
+        Each handler lists and watches only its own namespace, and is named for it (such as
+        'pod/tenant-a'), so that it can be wrapped in its own controller.
+
+        Args:
+            factory: The factory method to use, such as ResourceHandler.pod_handler.
+            api_client: The ApiClient to pass to the factory.
+            namespaces: The namespaces to handle.
+            kwargs: Any other keyword arguments for the factory.
+
+        Returns:
+            A list of ResourceHandlers, in namespace order.
+        """
+        return [
+            factory(api_client, namespace=namespace, **kwargs) for namespace in sorted(namespaces)
+        ]
+
     @staticmethod
-    def pod_handler(api_client):
+    def pod_handler(api_client, namespace=None, **kwargs):
         """Constructs a handler for pods using the given kubernetes.client.api_client.ApiClient."""
-        core_client = kubernetes.client.CoreV1Api(api_client)
-        return ResourceHandler(
-            name='pod',
-            list_all_items=core_client.list_pod_for_all_namespaces,
-            update_item=core_client.replace_namespaced_pod)
+        core_client = _client_module(api_client).CoreV1Api(api_client)
+        return _build_handler(core_client, 'pod', 'pod', namespace, **kwargs)
 
     @staticmethod
-    def service_handler(api_client):
+    def service_handler(api_client, namespace=None, **kwargs):
         """
         Constructs a handler for services using the given kubernetes.client.api_client.ApiClient.
         """
-        core_client = kubernetes.client.CoreV1Api(api_client)
-        return ResourceHandler(
-            name='service',
-            list_all_items=core_client.list_service_for_all_namespaces,
-            update_item=core_client.replace_namespaced_service)
+        core_client = _client_module(api_client).CoreV1Api(api_client)
+        return _build_handler(core_client, 'service', 'service', namespace, **kwargs)
 
     @staticmethod
-    def config_map_handler(api_client):
+    def config_map_handler(api_client, namespace=None, **kwargs):
         """
         Constructs a handler for config maps using the given kubernetes.client.api_client.ApiClient.
         """
-        core_client = kubernetes.client.CoreV1Api(api_client)
-        return ResourceHandler(
-            name='configmap',
-            list_all_items=core_client.list_config_map_for_all_namespaces,
-            update_item=core_client.replace_namespaced_config_map)
+        core_client = _client_module(api_client).CoreV1Api(api_client)
+        return _build_handler(core_client, 'configmap', 'config_map', namespace, **kwargs)
 
     @staticmethod
-    def job_handler(api_client):
+    def job_handler(api_client, namespace=None, **kwargs):
         """Constructs a handler for jobs using the given kubernetes.client.api_client.ApiClient."""
-        batch_client = kubernetes.client.BatchV1Api(api_client)
-        return ResourceHandler(
-            name='job',
-            list_all_items=batch_client.list_job_for_all_namespaces,
-            update_item=batch_client.replace_namespaced_job)
+        batch_client = _client_module(api_client).BatchV1Api(api_client)
+        return _build_handler(batch_client, 'job', 'job', namespace, **kwargs)
 
     @staticmethod
-    def deployment_handler(api_client):
+    def deployment_handler(api_client, namespace=None, **kwargs):
         """
         Constructs a handler for deployments using the given kubernetes.client.api_client.ApiClient.
         """
-        extensions_client = kubernetes.client.ExtensionsV1beta1Api(api_client)
-        return ResourceHandler(
-            name='deployment',
-            list_all_items=extensions_client.list_deployment_for_all_namespaces,
-            update_item=extensions_client.replace_namespaced_deployment)
+        extensions_client = _client_module(api_client).ExtensionsV1beta1Api(api_client)
+        return _build_handler(extensions_client, 'deployment', 'deployment', namespace, **kwargs)
+
+    @staticmethod
+    def replica_set_handler(api_client, namespace=None, **kwargs):
+        """
+        Constructs a handler for replica sets using the given
+        kubernetes.client.api_client.ApiClient.
+        """
+        extensions_client = _client_module(api_client).ExtensionsV1beta1Api(api_client)
+        return _build_handler(extensions_client, 'replicaset', 'replica_set', namespace, **kwargs)
 
     @staticmethod
-    def daemon_set_handler(api_client):
+    def daemon_set_handler(api_client, namespace=None, **kwargs):
         """
         Constructs a handler for daemonsets using the given kubernetes.client.api_client.ApiClient.
         """
-        extensions_client = kubernetes.client.ExtensionsV1beta1Api(api_client)
-        return ResourceHandler(
-            name='daemonset',
-            list_all_items=extensions_client.list_daemon_set_for_all_namespaces,
-            update_item=extensions_client.replace_namespaced_daemon_set)
+        extensions_client = _client_module(api_client).ExtensionsV1beta1Api(api_client)
+        return _build_handler(extensions_client, 'daemonset', 'daemon_set', namespace, **kwargs)
 
     @staticmethod
-    def cron_job_handler(api_client):
+    def cron_job_handler(api_client, namespace=None, **kwargs):
         """
         Constructs a handler for cron jobs using the given kubernetes.client.api_client.ApiClient.
         """
-        batch_alpha_client = kubernetes.client.BatchV2alpha1Api(api_client)
-        return ResourceHandler(
-            name='cronjob',
-            list_all_items=batch_alpha_client.list_cron_job_for_all_namespaces,
-            update_item=batch_alpha_client.replace_namespaced_cron_job)
+        batch_alpha_client = _client_module(api_client).BatchV2alpha1Api(api_client)
+        return _build_handler(batch_alpha_client, 'cronjob', 'cron_job', namespace, **kwargs)
@@ -0,0 +1,307 @@
+"""
+RuleResourceController handles items with a declarative rule set, instead of a Python function.
+
+Rules are JSON-compatible dicts, so that they can be kept in a ConfigMap. Each has a `type`, and
+may be limited to some `kinds` (like "Pod") and `namespaces`; rules without these apply to all
+items. Rules which read or write metadata name a `label` or an `annotation`. The rule types are:
+
+    require: Rejects items missing a non-empty label or annotation.
+    default: Sets a label or annotation to `value` if it's missing.
+    copy_to_template: Copies a label or annotation to the item's pod template, rejecting the item if
+        the template already has a different value.
+    reject: Rejects items whose labels match all of `match_labels`. A null value matches any value.
+
+Rejections use the rule's `reason` and `message`, if set.
+"""
+
+import json
+import logging
+import re
+import threading
+
+import kubernetes
+
+from .rejection import Rejection
+from .resource_controller import ResourceController
+
+logger = logging.getLogger(__name__)
+
+# Matches the API group and version prefix of model class names, like the "V1beta1" of
+# "V1beta1CronJob" or the "ExtensionsV1beta1" of "ExtensionsV1beta1Deployment".
+_MODEL_VERSION_PREFIX = re.compile(r'^[A-Za-z]*?V\d+(?:(?:alpha|beta)\d+)?(?=[A-Z])')
+
+
+def _kind_of(item):
+    """Returns the kind of an item. Items from list responses don't have `kind` set."""
+    return item.kind or _MODEL_VERSION_PREFIX.sub('', type(item).__name__)
+
+
+def _metadata_target(rule):
+    """Returns the (metadata field name, key) pair a rule reads or writes."""
+    if 'label' in rule:
+        return 'labels', rule['label']
+    if 'annotation' in rule:
+        return 'annotations', rule['annotation']
+    raise ValueError('Rule {} needs a label or an annotation.'.format(rule))
+
+
+def _describe(item):
+    """Returns the namespace:name of an item, for messages."""
+    return '{}:{}'.format(item.metadata.namespace, item.metadata.name)
+
+
+def _compile_require(rule):
+    """Compiles a `require` rule."""
+    field, key = _metadata_target(rule)
+    reason = rule.get('reason', 'Missing{}'.format(key.title().replace('-', '')))
+
+    def apply(item):
+        if not (getattr(item.metadata, field) or {}).get(key):
+            raise Rejection(
+                rule.get('message') or '{} {} missing from {}'.format(field[:-1].title(), key,
+                                                                      _describe(item)), reason)
+
+    return apply
+
+
+def _compile_default(rule):
+    """Compiles a `default` rule."""
+    field, key = _metadata_target(rule)
+    value = rule['value']
+
+    def apply(item):
+        values = getattr(item.metadata, field)
+        if values is None:
+            values = {}
+            setattr(item.metadata, field, values)
+        values.setdefault(key, value)
+
+    return apply
+
+
+def _compile_copy_to_template(rule):
+    """Compiles a `copy_to_template` rule."""
+    field, key = _metadata_target(rule)
+    reason = rule.get('reason', 'Mismatched{}'.format(key.title().replace('-', '')))
+
+    def apply(item):
+        value = (getattr(item.metadata, field) or {}).get(key)
+        template = getattr(getattr(item, 'spec', None), 'template', None)
+        if not value or template is None:
+            return
+        if template.metadata is None:
+            template.metadata = kubernetes.client.V1ObjectMeta()
+        values = getattr(template.metadata, field)
+        if values is None:
+            values = {}
+            setattr(template.metadata, field, values)
+        if key not in values:
+            values[key] = value
+        elif values[key] != value:
+            raise Rejection(
+                rule.get('message')
+                or 'Template {kind} {key}={expected} does not match {key}={value} on {item}'.format(
+                    kind=field[:-1], key=key, expected=values[key], value=value,
+                    item=_describe(item)), reason)
+
+    return apply
+
+
+def _compile_reject(rule):
+    """Compiles a `reject` rule."""
+    match_labels = rule['match_labels']
+    reason = rule.get('reason', 'RejectedByRule')
+
+    def apply(item):
+        labels = item.metadata.labels or {}
+        for key, value in match_labels.items():
+            if key not in labels or (value is not None and labels[key] != value):
+                return
+        raise Rejection(rule.get('message') or '{} matches {}'.format(_describe(item),
+                                                                       match_labels), reason)
+
+    return apply
+
+
+# Map of rule type to the function compiling a rule of that type into a function of an item.
+_COMPILERS = {
+    'require': _compile_require,
+    'default': _compile_default,
+    'copy_to_template': _compile_copy_to_template,
+    'reject': _compile_reject,
+}
+
+
+class RuleSet(object):
+    """
+    A compiled set of rules.
+
+    Rules are compiled once into functions, and indexed by the namespace and kind they apply to.
+    The rules for each (namespace, kind) pair are merged, in their original order, on first use,
+    so handling an item is a dict lookup and a single pass over the rules which apply to it.
+    """
+
+    def __init__(self, rules):
+        """
+        Args:
+            rules: A list of rule dicts, as described in this module's docstring.
+
+        Raises:
+            ValueError: If a rule is invalid.
+        """
+        self._rule_count = len(rules)
+        # Map of (namespace or None, kind or None) to a list of (rule index, compiled rule).
+        self._index = {}
+        for index, rule in enumerate(rules):
+            compiler = _COMPILERS.get(rule.get('type'))
+            if compiler is None:
+                raise ValueError('Unknown rule type in {}.'.format(rule))
+            try:
+                compiled = compiler(rule)
+            except KeyError as e:
+                raise ValueError('Rule {} is missing {}.'.format(rule, e)) from e
+            for namespace in rule.get('namespaces') or [None]:
+                for kind in rule.get('kinds') or [None]:
+                    self._index.setdefault((namespace, kind), []).append((index, compiled))
+        # Map of (namespace, kind) to the tuple of compiled rules applying to it.
+        self._matchers = {}
+
+    def __len__(self):
+        return self._rule_count
+
+    def apply(self, item):
+        """
+        Applies the rules matching an item to it, in order.
+
+        Returns:
+            The item, updated in place.
+
+        Raises:
+            Rejection: If a rule rejects the item.
+        """
+        for rule in self._matcher(item.metadata.namespace, _kind_of(item)):
+            rule(item)
+        return item
+
+    def _matcher(self, namespace, kind):
+        """Returns the compiled rules applying to items with the given namespace and kind."""
+        matcher = self._matchers.get((namespace, kind))
+        if matcher is None:
+            entries = []
+            for key in ((namespace, kind), (namespace, None), (None, kind), (None, None)):
+                entries.extend(self._index.get(key, []))
+            matcher = tuple(rule for _, rule in sorted(entries, key=lambda entry: entry[0]))
+            self._matchers[(namespace, kind)] = matcher
+        return matcher
+
+
+class RuleResourceController(ResourceController):
+    """
+    A ResourceController which handles items with a declarative RuleSet.
+
+    Rules can be replaced while running with load_rules, or reloaded from a ConfigMap whenever it
+    changes with start_reloading. Items are always handled by a single, complete rule set.
+    """
+
+    def __init__(self, resource_handler, rules=()):
+        """
+        Args:
+            resource_handler: The ResourceHandler for the handled type.
+            rules: The initial list of rule dicts.
+
+        Raises:
+            ValueError: If a rule is invalid.
+        """
+        super().__init__(resource_handler)
+        self._rule_set = RuleSet(rules)
+        self._stopped = threading.Event()
+        self._config_map_version = None
+
+    @property
+    def rule_count(self):
+        """The number of rules currently loaded."""
+        return len(self._rule_set)
+
+    def load_rules(self, rules):
+        """
+        Compiles and switches to a new list of rule dicts.
+
+        Raises:
+            ValueError: If a rule is invalid. The current rules are kept.
+        """
+        self._rule_set = RuleSet(rules)
+        logger.info('Loaded %s rules for %s.', len(self._rule_set), self.name)
+
+    def handle_item(self, item):
+        """Applies the current rules to an item."""
+        return self._rule_set.apply(item)
+
+    def start_reloading(self,
+                        api_client,
+                        name,
+                        namespace,
+                        error_callback,
+                        key='rules.json',
+                        interval_seconds=10):
+        """
+        Loads rules from a ConfigMap, then reloads them on a background thread whenever it changes.
+
+        The rules are a JSON list of rule dicts, under `key` in the ConfigMap's data. Invalid rules
+        are reported to error_callback, and the current rules kept.
+
+        Args:
+            api_client: The kubernetes.client.api_client.ApiClient to use.
+            name: The name of the ConfigMap.
+            namespace: The namespace of the ConfigMap.
+            error_callback: The function to invoke with any exception caught while reloading.
+            key: The key of the rules in the ConfigMap's data.
+            interval_seconds: The time between checks for changes.
+
+        Raises:
+            kubernetes.client.rest.ApiException: If the ConfigMap can't be read the first time.
+            ValueError: If the first rules loaded are invalid.
+        """
+        core_client = kubernetes.client.CoreV1Api(api_client)
+        self._stopped.clear()
+        self.reload_rules(core_client, name, namespace, key)
+
+        def run():
+            while not self._stopped.wait(interval_seconds):
+                try:
+                    self.reload_rules(core_client, name, namespace, key)
+                except Exception as e:
+                    error_callback(e)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def stop_reloading(self):
+        """Stops reloading rules. The current rules stay loaded."""
+        self._stopped.set()
+
+    def reload_rules(self, core_client, name, namespace, key='rules.json'):
+        """
+        Loads rules from a ConfigMap, if it changed since the last load.
+
+        Args:
+            core_client: The kubernetes.client.CoreV1Api to read the ConfigMap with.
+            name: The name of the ConfigMap.
+            namespace: The namespace of the ConfigMap.
+            key: The key of the rules in the ConfigMap's data.
+
+        Returns:
+            Whether new rules were loaded.
+
+        Raises:
+            kubernetes.client.rest.ApiException: If the ConfigMap can't be read.
+            ValueError: If the rules are invalid, or missing from the ConfigMap.
+        """
+        config_map = core_client.read_namespaced_config_map(name, namespace)
+        version = config_map.metadata.resource_version
+        if version is not None and version == self._config_map_version:
+            return False
+        data = (config_map.data or {}).get(key)
+        if data is None:
+            raise ValueError('ConfigMap {}/{} has no {} key.'.format(namespace, name, key))
+        self.load_rules(json.loads(data))
+        self._config_map_version = version
+        return True
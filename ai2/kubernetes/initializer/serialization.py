@@ -0,0 +1,35 @@
+"""
+Helpers to convert Kubernetes API models to and from compact JSON strings.
+"""
+
+import json
+
+
+class _JsonResponse(object):
+    """The minimal response object accepted by ApiClient.deserialize."""
+
+    def __init__(self, data):
+        self.data = data
+
+
+def item_to_json(api_client, item):
+    """
+    Returns the given model as a compact JSON string.
+
+    Args:
+        api_client: The ApiClient to serialize with.
+        item: The model to serialize.
+    """
+    return json.dumps(api_client.sanitize_for_serialization(item), separators=(',', ':'))
+
+
+def item_from_json(api_client, data, model_name):
+    """
+    Returns the model held in a JSON string.
+
+    Args:
+        api_client: The ApiClient to deserialize with.
+        data: The JSON string, as returned from item_to_json.
+        model_name: The name of the model class, such as 'V1Pod'.
+    """
+    return api_client.deserialize(_JsonResponse(data), model_name)
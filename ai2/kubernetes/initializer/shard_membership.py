@@ -0,0 +1,191 @@
+"""
+ShardMembership splits items between initializer replicas, coordinating through a ConfigMap.
+"""
+
+import logging
+import socket
+import threading
+import time
+import zlib
+
+import kubernetes
+from kubernetes.client.models.v1_config_map import V1ConfigMap
+from kubernetes.client.models.v1_object_meta import V1ObjectMeta
+from kubernetes.client.rest import ApiException
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(namespace, uid, shard_count):
+    """Returns the shard, in [0, shard_count), of the item with the given namespace and uid."""
+    key = '{}/{}'.format(namespace, uid).encode('utf8')
+    return zlib.crc32(key) % shard_count
+
+
+class ShardMembership(object):
+    """
+    Tracks the live replicas of an initializer, and which items this replica is responsible for.
+
+    Each replica records a heartbeat under its identity in a shared ConfigMap, and drops any
+    replicas whose heartbeat is older than `lease_seconds`. The live replicas, sorted by identity,
+    are the shards; this replica owns the items whose namespace/uid hash falls in its shard. When a
+    replica joins or disappears, the remaining replicas pick up the new membership on their next
+    renewal, and notify their listeners so that they can relist.
+
+    Heartbeats are wall-clock times, so replicas' clocks should agree to well within lease_seconds.
+    """
+
+    def __init__(self,
+                 api_client,
+                 name,
+                 namespace,
+                 identity=None,
+                 lease_seconds=30,
+                 renew_interval_seconds=10):
+        """
+        Args:
+            api_client: The kubernetes.client.api_client.ApiClient to use.
+            name: The name of the ConfigMap to coordinate through. It's created if missing.
+            namespace: The namespace of the ConfigMap.
+            identity: The unique name of this replica. Defaults to the hostname, which is the pod
+                name when running in Kubernetes.
+            lease_seconds: The time after its last heartbeat that a replica is considered gone.
+            renew_interval_seconds: The time between heartbeats. This should be well under
+                lease_seconds.
+        """
+        self._core_client = kubernetes.client.CoreV1Api(api_client)
+        self.name = name
+        self.namespace = namespace
+        self.identity = identity or socket.gethostname()
+        self._lease_seconds = lease_seconds
+        self._renew_interval_seconds = renew_interval_seconds
+        self._lock = threading.Lock()
+        self._members = ()
+        # The monotonic time our last recorded heartbeat was taken.
+        self._renewed_time = None
+        self._listeners = []
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def members(self):
+        """The sorted identities of the live replicas, as of the last renewal."""
+        with self._lock:
+            return self._members
+
+    @property
+    def running(self):
+        """Whether the background renewal thread is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_listener(self, listener):
+        """Registers a function to call with the new members whenever membership changes."""
+        self._listeners.append(listener)
+
+    def owns(self, namespace, uid):
+        """
+        Returns whether this replica is responsible for the item with the given namespace and uid.
+
+        Nothing is owned until this replica has recorded its own heartbeat, or once its last
+        recorded heartbeat is older than lease_seconds, since the other replicas will have taken
+        over its shard by then.
+        """
+        with self._lock:
+            members = self._members
+            renewed_time = self._renewed_time
+        if (self.identity not in members or renewed_time is None
+                or time.monotonic() - renewed_time >= self._lease_seconds):
+            return False
+        return shard_of(namespace, uid, len(members)) == members.index(self.identity)
+
+    def start(self, error_callback):
+        """
+        Joins the membership, and keeps renewing on a background thread until stopped.
+
+        Args:
+            error_callback: The function to invoke with any exception caught during background
+                renewals.
+
+        Raises:
+            kubernetes.client.rest.ApiException: If the first renewal fails.
+        """
+        self._stopped.clear()
+        self.renew()
+        self._thread = threading.Thread(target=self._run, args=(error_callback, ), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops renewing, and removes this replica from the membership so others take over."""
+        self._stopped.set()
+        try:
+            self._update(lambda data, now: data.pop(self.identity, None))
+        except ApiException as e:
+            logger.warning('Failed to leave shard membership %s: %s', self.name, e)
+
+    def renew(self):
+        """
+        Records this replica's heartbeat, and drops expired replicas from the membership.
+
+        Raises:
+            kubernetes.client.rest.ApiException: If the ConfigMap can't be read or written. A 409
+                Conflict from a concurrent renewal is retried once.
+        """
+        def heartbeat(data, now):
+            data[self.identity] = repr(now)
+            for identity, last_seen in list(data.items()):
+                if float(last_seen) < now - self._lease_seconds:
+                    logger.info('Replica %s expired from %s.', identity, self.name)
+                    del data[identity]
+
+        try:
+            self._update(heartbeat)
+        except ApiException as e:
+            if e.status != 409:
+                raise
+            self._update(heartbeat)
+
+    def _run(self, error_callback):
+        """Renews until stopped."""
+        while not self._stopped.wait(self._renew_interval_seconds):
+            try:
+                self.renew()
+            except Exception as e:
+                error_callback(e)
+
+    def _update(self, update_data):
+        """
+        Applies update_data(data, now) to the ConfigMap's data, saving it and the new membership.
+
+        Raises:
+            kubernetes.client.rest.ApiException: If the ConfigMap can't be read or written.
+        """
+        # Taken before the heartbeat, so our lease never outlasts the one other replicas see.
+        started_time = time.monotonic()
+        try:
+            config_map = self._core_client.read_namespaced_config_map(self.name, self.namespace)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            config_map = None
+        if config_map is None:
+            config_map = V1ConfigMap(
+                metadata=V1ObjectMeta(name=self.name, namespace=self.namespace), data={})
+            update_data(config_map.data, time.time())
+            config_map = self._core_client.create_namespaced_config_map(self.namespace, config_map)
+        else:
+            config_map.data = config_map.data or {}
+            update_data(config_map.data, time.time())
+            config_map = self._core_client.replace_namespaced_config_map(
+                self.name, self.namespace, config_map)
+        self._set_members(tuple(sorted((config_map.data or {}).keys())), started_time)
+
+    def _set_members(self, members, renewed_time):
+        """Records new membership, notifying listeners if it changed."""
+        with self._lock:
+            changed = members != self._members
+            self._members = members
+            self._renewed_time = renewed_time if self.identity in members else None
+        if changed:
+            logger.info('Shard membership of %s is now %s.', self.name, list(members))
+            for listener in self._listeners:
+                listener(members)
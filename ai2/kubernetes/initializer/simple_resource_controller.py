@@ -1,3 +1,4 @@
+from .rejection import Rejection
 from .resource_controller import ResourceController
 
 
@@ -6,6 +7,28 @@ class SimpleResourceController(ResourceController):
     A ResourceController implementation that delegates handle_item to a provided function.
     """
 
-    def __init__(self, resource_handler, handle_item_function):
+    def __init__(self, resource_handler, handle_item_function=None, handle_items_function=None):
+        """
+        Args:
+            resource_handler: The ResourceHandler for the handled type.
+            handle_item_function: The function to use as handle_item.
+            handle_items_function: The function to use as handle_items. If handle_item_function
+                isn't given, handle_item calls this with a batch of one item.
+
+        Raises:
+            ValueError: If neither function is given.
+        """
         super().__init__(resource_handler)
-        self.handle_item = handle_item_function
+        if handle_item_function is None and handle_items_function is None:
+            raise ValueError('One of handle_item_function or handle_items_function is required.')
+        if handle_item_function is not None:
+            self.handle_item = handle_item_function
+        if handle_items_function is not None:
+            self.handle_items = handle_items_function
+
+    def handle_item(self, item):
+        """Handles a single item as a batch of one, using handle_items."""
+        result = self.handle_items([item])[0]
+        if isinstance(result, Rejection):
+            raise result
+        return result
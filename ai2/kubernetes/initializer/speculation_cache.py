@@ -0,0 +1,184 @@
+"""
+SpeculationCache holds decisions made ahead of time, for items still waiting on other initializers.
+"""
+
+import collections
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import kubernetes
+
+from .caching_resource_controller import IDENTITY_PATHS
+from .metrics import SPECULATION_LOOKUPS, SPECULATIVE_EVALUATIONS
+from .rejection import Rejection
+from .serialization import item_from_json
+from .update_strategy import json_patch_apply, json_patch_diff
+
+logger = logging.getLogger(__name__)
+
+# Metadata which changes as an item moves through its initializers, whatever the handlers read.
+_VOLATILE_METADATA = ('initializers', 'resourceVersion', 'generation', 'managedFields')
+
+
+def all_fields(serialized_item):
+    """
+    Returns the fields of an item which a speculative decision is assumed to depend on.
+
+    This is the whole item, except for the metadata which changes as it moves through its
+    initializers.
+
+    Args:
+        serialized_item: The item, as a JSON-compatible dict.
+    """
+    fields = dict(serialized_item)
+    metadata = dict(fields.get('metadata') or {})
+    for key in _VOLATILE_METADATA:
+        metadata.pop(key, None)
+    fields['metadata'] = metadata
+    return fields
+
+
+class SpeculationCache(object):
+    """
+    A cache of handle_item decisions made before an item's turn in its initializers.
+
+    Items which are pending on our initializer, but behind other initializers, can be evaluated
+    early. The decision is recorded (as a JSON Patch, or a Rejection status) along with a hash of
+    the fields the handler reads. When the item reaches our turn with those fields unchanged, the
+    decision is replayed, and only the update is left to do; if they've changed (for example,
+    because an earlier initializer modified them), the handler is run again as usual.
+
+    Handlers evaluated early must not have side effects beyond the item they return, and their
+    decisions must depend only on the fields selected by `fields_function`.
+
+    Entries are keyed by controller name and uid. They're evicted once they're older than
+    `ttl_seconds`, or when the cache holds more than `max_size` entries, least-recently-used first.
+    """
+
+    def __init__(self,
+                 fields_function=all_fields,
+                 max_size=1024,
+                 ttl_seconds=300,
+                 api_client=None,
+                 metrics=None):
+        """
+        Args:
+            fields_function: A function from an item, serialized to a JSON-compatible dict, to the
+                JSON-compatible fields which the handlers' decisions depend on.
+            max_size: The maximum number of decisions to cache.
+            ttl_seconds: The maximum time to cache a decision for.
+            api_client: The ApiClient used to serialize and deserialize items. Defaults to a new
+                kubernetes.client.ApiClient.
+            metrics: If set, a Metrics to count evaluations, hits, and misses in.
+        """
+        self._fields_function = fields_function
+        self._max_size = max_size
+        self._ttl_seconds = ttl_seconds
+        self._api_client = api_client or kubernetes.client.ApiClient()
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        # Map of (controller name, uid) to (expiry time, fields hash, Rejection status or JSON
+        # Patch), in LRU order.
+        self._cache = collections.OrderedDict()
+
+    @property
+    def cache_size(self):
+        """The number of decisions currently cached."""
+        with self._lock:
+            return len(self._cache)
+
+    def evaluate(self, controller, item, handle_item_function=None):
+        """
+        Runs a controller's handler on an item ahead of its turn, caching the decision.
+
+        Nothing is done if a decision for the item's current fields is already cached. Handler
+        errors other than Rejection are logged and not cached, leaving the item to be handled on its
+        turn.
+
+        Args:
+            controller: The controller to evaluate the item with.
+            item: The item to evaluate. This may be modified by the handler.
+            handle_item_function: The function to run the handler with. Defaults to the controller's
+                handle_item.
+        """
+        key = (controller.name, item.metadata.uid)
+        serialized = self._api_client.sanitize_for_serialization(item)
+        fields_hash = self._hash_fields(serialized)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[1] == fields_hash and entry[0] > time.monotonic():
+                return
+
+        handle_item_function = handle_item_function or controller.handle_item
+        if self.metrics:
+            self.metrics.increment(SPECULATIVE_EVALUATIONS, controller.name)
+        try:
+            result = handle_item_function(copy.deepcopy(item))
+        except Rejection as rejection:
+            self._store(key, fields_hash, rejection.status)
+            return
+        except Exception as e:
+            logger.debug('Speculative evaluation of %s %s:%s failed: %s', controller.name,
+                         item.metadata.namespace, item.metadata.name, e)
+            return
+        patch = json_patch_diff(serialized, self._api_client.sanitize_for_serialization(result))
+        if not any(op['path'].startswith(IDENTITY_PATHS) for op in patch):
+            self._store(key, fields_hash, patch)
+
+    def lookup(self, controller, item):
+        """
+        Returns the cached decision for an item whose fields are unchanged, consuming it.
+
+        Args:
+            controller: The controller the item is being handled with.
+            item: The item, now pending first on our initializer.
+
+        Returns:
+            The handled item, a Rejection, or None if there's no usable decision.
+        """
+        key = (controller.name, item.metadata.uid)
+        with self._lock:
+            entry = self._cache.pop(key, None)
+        result = None
+        if entry is not None and entry[0] > time.monotonic():
+            serialized = self._api_client.sanitize_for_serialization(item)
+            if entry[1] == self._hash_fields(serialized):
+                result = self._replay(item, serialized, entry[2])
+        if self.metrics:
+            self.metrics.increment(
+                SPECULATION_LOOKUPS, controller.name, result='miss' if result is None else 'hit')
+        return result
+
+    def _hash_fields(self, serialized):
+        """Returns a hash of the fields of a serialized item which decisions depend on."""
+        fields = json.dumps(self._fields_function(serialized), sort_keys=True)
+        return hashlib.sha256(fields.encode('utf8')).hexdigest()
+
+    def _store(self, key, fields_hash, decision):
+        """Caches a decision, evicting the least-recently-used decisions if over max_size."""
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self._ttl_seconds, fields_hash, decision)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+
+    def _replay(self, item, serialized, decision):
+        """Returns the result of a cached decision for an item, or None if it no longer applies."""
+        if not isinstance(decision, list):
+            return Rejection(
+                message=decision.message,
+                reason=decision.reason,
+                code=decision.code,
+                details=decision.details)
+        if not decision:
+            return item
+        try:
+            patched = json_patch_apply(serialized, decision)
+        except ValueError as e:
+            logger.debug('Speculative decision no longer applies: %s', e)
+            return None
+        return item_from_json(self._api_client, json.dumps(patched), type(item).__name__)
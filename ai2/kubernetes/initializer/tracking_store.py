@@ -0,0 +1,411 @@
+"""
+TrackingStore remembers the few fields of each in-flight object which an initializer needs, instead
+of whole models. ItemTracker decides which objects an initializer tracks. This module also holds
+the helpers reading an object's pending initializers and age, from either models or raw (dict)
+metadata, and those updating them and recording the latency once an object is handled.
+"""
+
+import collections
+import datetime
+import heapq
+import itertools
+import logging
+import sys
+import threading
+import time
+
+from .metrics import EVENTS_FILTERED, EVENTS_RECEIVED, INITIALIZATION_LATENCY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class TrackedObject(object):
+    """
+    The tracked state of one object.
+
+    Records use __slots__, and share interned strings for their source, namespace, and pending
+    initializer, so each costs about a hundred bytes plus its uid, name, and resourceVersion.
+
+    Times are in seconds since the epoch: `first_seen` is when the object was first observed, and
+    `created` its creationTimestamp, if known. `observed` orders the object's latest observation
+    among all the store's observations.
+    """
+
+    __slots__ = ('uid', 'source', 'namespace', 'name', 'resource_version', 'pending_head',
+                 'first_seen', 'created', 'observed')
+
+    def __init__(self,
+                 uid,
+                 source,
+                 namespace,
+                 name,
+                 resource_version,
+                 pending_head,
+                 first_seen,
+                 created=None):
+        self.uid = uid
+        self.source = source
+        self.namespace = namespace
+        self.name = name
+        self.resource_version = resource_version
+        self.pending_head = pending_head
+        self.first_seen = first_seen
+        self.created = created
+        self.observed = None
+
+    @property
+    def since(self):
+        """The time the object has been waiting since: its creation if known, else first_seen."""
+        return self.created if self.created is not None else self.first_seen
+
+    def __repr__(self):
+        return 'TrackedObject({}/{} {} rv={} head={})'.format(
+            self.namespace, self.name, self.uid, self.resource_version, self.pending_head)
+
+
+def _intern(value):
+    """Interns a string, so that all records share one copy; None is returned as-is."""
+    return sys.intern(value) if value is not None else None
+
+
+def _epoch_seconds(created):
+    """
+    Returns a creationTimestamp in seconds since the epoch, or None if it's missing or invalid.
+
+    Args:
+        created: The timestamp, as a datetime from a model, or an RFC 3339 string from a raw object.
+    """
+    if isinstance(created, str):
+        try:
+            created = datetime.datetime.strptime(created, '%Y-%m-%dT%H:%M:%SZ')
+        except ValueError:
+            return None
+    if not isinstance(created, datetime.datetime):
+        return None
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=datetime.timezone.utc)
+    return created.timestamp()
+
+
+def creation_age_seconds(item):
+    """Returns the number of seconds since the given item was created, or None if unknown."""
+    created = _epoch_seconds(item.metadata.creation_timestamp)
+    return time.time() - created if created is not None else None
+
+
+def raw_pending_head(raw_metadata):
+    """Returns the name of the first pending initializer in raw (dict) metadata, or None."""
+    names = raw_pending_names(raw_metadata)
+    return names[0] if names else None
+
+
+def raw_pending_names(raw_metadata):
+    """Returns the names of the pending initializers in raw (dict) metadata."""
+    initializers = raw_metadata.get('initializers') or {}
+    return [initializer.get('name') for initializer in initializers.get('pending') or []]
+
+
+def is_pending_on(item, initializer_name):
+    """Returns True if the given initializer is first in the item's pending initializers."""
+    initializers = item.metadata.initializers
+    return bool(initializers and initializers.pending
+                and initializers.pending[0].name == initializer_name)
+
+
+def is_pending_later(item, initializer_name):
+    """Returns True if the given initializer is pending on the item, behind other initializers."""
+    initializers = item.metadata.initializers
+    return bool(initializers and initializers.pending
+                and any(pending.name == initializer_name for pending in initializers.pending[1:]))
+
+
+def observe_latency(metrics, controller, item):
+    """Records the initialization latency of the given item, which was just saved."""
+    age = creation_age_seconds(item)
+    if age is not None:
+        metrics.observe(INITIALIZATION_LATENCY_SECONDS, controller.name, age)
+
+
+def pop_pending_head(initializers, updated_item):
+    """
+    Updates a handled item's initializers, removing the first pending initializer.
+
+    Args:
+        initializers: The initializers of the item, as found before handling.
+        updated_item: The handled item to be saved. If handling was rejected, its
+            `initializers.result` should already be set.
+    """
+    # The API contract is to clear `initializers` completely if we had a successful run and we're
+    # the last initializer.
+    updated_initializers = updated_item.metadata.initializers
+    if not updated_initializers.result and len(initializers.pending) == 1:
+        # Successful run and no more initializers; clear the initializers object.
+        updated_item.metadata.initializers = None
+    else:
+        # There are more initializers, or we saw an error. Update the list to remove the first item.
+        updated_initializers.pending = initializers.pending[1:]
+
+
+class TrackingStore(object):
+    """
+    A thread-safe store of TrackedObjects, keyed by uid.
+
+    Each object is tracked from when it's first seen with our initializer pending until it's
+    discarded, once it's initialized, deleted, or no longer pending on us. The resourceVersion each
+    source's watch resumes from is kept alongside. Counts of tracked objects
+    by source (the controller name) and pending initializer are kept up to date on every change, as
+    are heaps ordering them by how long they've been waiting, so backlog checks don't scan the
+    store.
+    """
+
+    def __init__(self, clock=time.time):
+        """
+        Args:
+            clock: The function returning the current time in seconds since the epoch.
+        """
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Map of uid to TrackedObject.
+        self._objects = {}
+        # Map of (source, pending_head) to the number of tracked objects.
+        self._counts = collections.Counter()
+        # Map of (source, pending_head) to a heap of (since, sequence number, uid) for the tracked
+        # objects. Entries for objects which have since been discarded or moved are dropped once
+        # they reach the top, or when the heap is rebuilt.
+        self._heaps = collections.defaultdict(list)
+        # Sequence numbers for heap entries, which also order observations for retain.
+        self._sequence = itertools.count()
+        # Map of source to the resourceVersion its watch resumes from.
+        self._resume_versions = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._objects)
+
+    def __contains__(self, uid):
+        with self._lock:
+            return uid in self._objects
+
+    def get(self, uid):
+        """Returns the TrackedObject with the given uid, or None."""
+        with self._lock:
+            return self._objects.get(uid)
+
+    def observe(self, source, uid, namespace, name, resource_version, pending_head, created=None):
+        """
+        Records the latest state of an object, keeping its first_seen time if already tracked.
+
+        Args:
+            source: The name of the controller which found the object.
+            uid: The object's uid.
+            namespace: The object's namespace.
+            name: The object's name.
+            resource_version: The object's resourceVersion.
+            pending_head: The name of the first pending initializer on the object.
+            created: The object's creationTimestamp, as a datetime or RFC 3339 string. This is only
+                parsed the first time the object is seen.
+
+        Returns:
+            True if the object was already tracked at this resourceVersion, which makes this a
+            duplicate observation.
+        """
+        source = _intern(source)
+        pending_head = _intern(pending_head)
+        with self._lock:
+            tracked = self._objects.get(uid)
+            if tracked is None:
+                tracked = TrackedObject(uid, source, _intern(namespace), name, resource_version,
+                                        pending_head, self._clock(), _epoch_seconds(created))
+                tracked.observed = next(self._sequence)
+                self._objects[uid] = tracked
+                self._counts[(source, pending_head)] += 1
+                self._push(tracked)
+                return False
+            tracked.observed = next(self._sequence)
+            duplicate = tracked.resource_version == resource_version
+            tracked.resource_version = resource_version
+            if (tracked.source, tracked.pending_head) != (source, pending_head):
+                self._counts[(tracked.source, tracked.pending_head)] -= 1
+                self._counts[(source, pending_head)] += 1
+                tracked.source = source
+                tracked.pending_head = pending_head
+                self._push(tracked)
+            return duplicate
+
+    def observe_item(self, source, item):
+        """Records the latest state of an object model. See observe."""
+        metadata = item.metadata
+        initializers = metadata.initializers
+        pending_head = None
+        if initializers and initializers.pending:
+            pending_head = initializers.pending[0].name
+        return self.observe(source, metadata.uid, metadata.namespace, metadata.name,
+                            metadata.resource_version, pending_head, metadata.creation_timestamp)
+
+    def discard(self, uid):
+        """Stops tracking the object with the given uid, if tracked."""
+        with self._lock:
+            tracked = self._objects.pop(uid, None)
+            if tracked is not None:
+                self._counts[(tracked.source, tracked.pending_head)] -= 1
+
+    def mark(self):
+        """Returns a marker which all later observations are ordered after, for retain."""
+        with self._lock:
+            return next(self._sequence)
+
+    def retain(self, source, uids, since=None):
+        """
+        Stops tracking all objects from a source other than those with the given uids.
+
+        This drops objects which were deleted or initialized while no watch was running, after a
+        full list of the source.
+
+        Args:
+            source: The controller name the uids were listed from.
+            uids: A set of uids to keep.
+            since: A marker from mark, taken before the list began. If set, objects observed after
+                it are kept too, since a concurrent watch saw them after the list's snapshot.
+        """
+        with self._lock:
+            stale = [
+                uid for uid, tracked in self._objects.items()
+                if tracked.source == source and uid not in uids
+                and (since is None or tracked.observed < since)
+            ]
+            for uid in stale:
+                tracked = self._objects.pop(uid)
+                self._counts[(tracked.source, tracked.pending_head)] -= 1
+
+    def count(self, source, pending_head):
+        """Returns the number of tracked objects from a source with the given first initializer."""
+        with self._lock:
+            return self._counts[(source, pending_head)]
+
+    def resume_version(self, source):
+        """Returns the resourceVersion to resume a source's watch from, or None to relist first."""
+        with self._lock:
+            return self._resume_versions.get(source)
+
+    def set_resume_version(self, source, resource_version):
+        """Records the latest resourceVersion seen from a source. None is ignored."""
+        if resource_version:
+            with self._lock:
+                self._resume_versions[source] = resource_version
+
+    def reset_resume_version(self, source):
+        """Forgets a source's resourceVersion, before relisting it."""
+        with self._lock:
+            self._resume_versions.pop(source, None)
+
+    def oldest_age_seconds(self, source, pending_head):
+        """
+        Returns how long the longest-waiting tracked object from a source with the given first
+        initializer has been waiting, in seconds, or None if there are no such objects.
+
+        Objects are timed from their creation if known, else from when they were first observed.
+        """
+        key = (source, pending_head)
+        with self._lock:
+            heap = self._heaps.get(key)
+            while heap:
+                since, _, uid = heap[0]
+                if self._is_current(key, since, uid):
+                    return self._clock() - since
+                heapq.heappop(heap)
+            return None
+
+    def _push(self, tracked):
+        """Adds a heap entry for a new or moved object. Must be called with the lock held."""
+        key = (tracked.source, tracked.pending_head)
+        heap = self._heaps[key]
+        heapq.heappush(heap, (tracked.since, next(self._sequence), tracked.uid))
+        # Bound the stale entries left by objects which were discarded or moved.
+        if len(heap) > 2 * self._counts[key] + 16:
+            heap[:] = [entry for entry in heap if self._is_current(key, entry[0], entry[2])]
+            heapq.heapify(heap)
+
+    def _is_current(self, key, since, uid):
+        """Returns whether a heap entry is current. Must be called with the lock held."""
+        tracked = self._objects.get(uid)
+        return (tracked is not None and (tracked.source, tracked.pending_head) == key
+                and tracked.since == since)
+
+
+class ItemTracker(object):
+    """
+    Decides which watch events and listed items concern an initializer, keeping a TrackingStore up
+    to date with them.
+
+    Watch events are judged from their raw (dict) form, so that only items which will be handled
+    (or evaluated early) are unmarshalled into full models; this is much more expensive than the
+    raw parse.
+    """
+
+    def __init__(self, store, initializer_name, owns, metrics, include_later=False):
+        """
+        Args:
+            store: The TrackingStore to update.
+            initializer_name: The name of our initializer.
+            owns: A function from an item's namespace and uid to whether this replica handles it.
+            metrics: The Metrics to count received and filtered events in.
+            include_later: If true, events for items pending on our initializer behind other
+                initializers are accepted too, instead of only those pending first on ours.
+        """
+        self._store = store
+        self._initializer_name = initializer_name
+        self._owns = owns
+        self._metrics = metrics
+        self._include_later = include_later
+
+    def accept_event(self, source, raw_event):
+        """
+        Records a raw watch event, and returns whether its item needs to be unmarshalled.
+
+        Args:
+            source: The name of the controller whose watch returned the event.
+            raw_event: The parsed (dict) event.
+        """
+        event_type = raw_event['type']
+        raw_metadata = raw_event['object'].get('metadata') or {}
+        self._store.set_resume_version(source, raw_metadata.get('resourceVersion'))
+        self._metrics.increment(EVENTS_RECEIVED, source)
+        if event_type != 'MODIFIED' and event_type != 'ADDED':
+            if event_type == 'DELETED':
+                self._store.discard(raw_metadata.get('uid'))
+            self._metrics.increment(EVENTS_FILTERED, source)
+            logger.debug('Ignored event type %s for item %s:%s', event_type,
+                         raw_metadata.get('namespace'), raw_metadata.get('name'))
+            return False
+        pending_names = raw_pending_names(raw_metadata)
+        if (self._initializer_name in pending_names
+                and self._owns(raw_metadata.get('namespace'), raw_metadata.get('uid'))):
+            duplicate = self._store.observe(
+                source, raw_metadata.get('uid'), raw_metadata.get('namespace'),
+                raw_metadata.get('name'), raw_metadata.get('resourceVersion'), pending_names[0],
+                raw_metadata.get('creationTimestamp'))
+            if duplicate:
+                logger.debug('Ignored repeated event for item %s:%s', raw_metadata.get('namespace'),
+                             raw_metadata.get('name'))
+            elif self._include_later or pending_names[0] == self._initializer_name:
+                return True
+        else:
+            self._store.discard(raw_metadata.get('uid'))
+        self._metrics.increment(EVENTS_FILTERED, source)
+        return False
+
+    def track_item(self, source, item):
+        """
+        Records a listed item if it's pending on our initializer and owned, or stops tracking it.
+
+        Returns:
+            Whether the item is tracked.
+        """
+        metadata = item.metadata
+        if ((is_pending_on(item, self._initializer_name)
+             or is_pending_later(item, self._initializer_name))
+                and self._owns(metadata.namespace, metadata.uid)):
+            self._store.observe_item(source, item)
+            return True
+        self._store.discard(metadata.uid)
+        return False
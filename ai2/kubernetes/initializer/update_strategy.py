@@ -0,0 +1,161 @@
+"""
+Update strategies control how a ResourceHandler saves handled items back to the Kubernetes API.
+
+Exports:
+    ReplaceUpdateStrategy: Sends the whole item with a replace call. This is the default.
+    JsonPatchUpdateStrategy: Sends a minimal JSON Patch of the changes made during handling.
+"""
+
+import copy
+
+import kubernetes
+
+
+class ReplaceUpdateStrategy(object):
+    """Saves items by replacing the whole object."""
+
+    def snapshot(self, item):
+        """
+        Captures whatever state of an unhandled item this strategy needs in order to update it.
+
+        Args:
+            item: The item, before it's handled.
+
+        Returns:
+            A value to pass to update as `snapshot`. Replace needs no snapshot, so this is None.
+        """
+        return None
+
+    def update(self, resource_handler, item, snapshot):
+        """
+        Saves the given handled item.
+
+        Args:
+            resource_handler: The ResourceHandler for the item's type.
+            item: The handled item to save.
+            snapshot: The value returned from snapshot before the item was handled.
+
+        Returns:
+            The response from the API server to the request.
+        """
+        return resource_handler.replace_item(item)
+
+
+class JsonPatchUpdateStrategy(object):
+    """
+    Saves items by sending a JSON Patch (RFC 6902) holding only the changes made during handling.
+
+    This is typically the `metadata.initializers` change, plus any changes made by the handler, so
+    large objects aren't resent in full. The patch always sets `metadata.resourceVersion`, so a
+    concurrently-modified item results in a 409 Conflict, as a replace would.
+
+    IMPORTANT NOTE: Per issue https://github.com/kubernetes/kubernetes/issues/49814, patching
+    uninitialized objects fails on Kubernetes 1.7 API servers. Only use this with servers including
+    the fix.
+    """
+
+    def __init__(self, api_client=None):
+        """
+        Args:
+            api_client: The ApiClient used to serialize items. This should be the client the
+                ResourceHandler was built with. Defaults to a new kubernetes.client.ApiClient.
+        """
+        self._api_client = api_client
+
+    def snapshot(self, item):
+        """Returns the serialized form of the unhandled item, to diff against after handling."""
+        return self._serialize(item)
+
+    def update(self, resource_handler, item, snapshot):
+        """Saves the given handled item by patching the differences from `snapshot`."""
+        serialized = self._serialize(item)
+        patch = [{
+            'op': 'replace',
+            'path': '/metadata/resourceVersion',
+            'value': item.metadata.resource_version
+        }]
+        patch.extend(json_patch_diff(snapshot, serialized))
+        return resource_handler.patch_item(item, patch)
+
+    def _serialize(self, item):
+        """Returns the given model as a JSON-compatible dict."""
+        if self._api_client is None:
+            self._api_client = kubernetes.client.ApiClient()
+        return self._api_client.sanitize_for_serialization(item)
+
+
+def _escape_path_segment(segment):
+    """Escapes a key for use in a JSON Pointer (RFC 6901)."""
+    return str(segment).replace('~', '~0').replace('/', '~1')
+
+
+def json_patch_diff(original, updated, path=''):
+    """
+    Returns a list of JSON Patch operations transforming `original` into `updated`.
+
+    Dicts are diffed key by key; any other changed value (including lists) is replaced whole.
+
+    Args:
+        original: The JSON-compatible value before changes.
+        updated: The JSON-compatible value after changes.
+        path: The JSON Pointer of the given values.
+    """
+    if original == updated:
+        return []
+    if not isinstance(original, dict) or not isinstance(updated, dict):
+        return [{'op': 'replace', 'path': path, 'value': updated}]
+
+    operations = []
+    for key, original_value in original.items():
+        key_path = '{}/{}'.format(path, _escape_path_segment(key))
+        if key not in updated:
+            operations.append({'op': 'remove', 'path': key_path})
+        else:
+            operations.extend(json_patch_diff(original_value, updated[key], key_path))
+    for key, updated_value in updated.items():
+        if key not in original:
+            key_path = '{}/{}'.format(path, _escape_path_segment(key))
+            operations.append({'op': 'add', 'path': key_path, 'value': updated_value})
+    return operations
+
+
+def _unescape_path_segment(segment):
+    """Unescapes a key from a JSON Pointer (RFC 6901)."""
+    return segment.replace('~1', '/').replace('~0', '~')
+
+
+def json_patch_apply(document, patch):
+    """
+    Returns a copy of `document` with the given JSON Patch operations applied.
+
+    This supports the operations produced by json_patch_diff: add, replace, and remove, with paths
+    through dicts only.
+
+    Args:
+        document: The JSON-compatible value to patch.
+        patch: The list of JSON Patch operations to apply.
+
+    Raises:
+        ValueError: If an operation can't be applied to the document.
+    """
+    document = copy.deepcopy(document)
+    for operation in patch:
+        path = operation['path']
+        if not path:
+            if operation['op'] == 'remove':
+                raise ValueError('Cannot remove the whole document.')
+            document = copy.deepcopy(operation['value'])
+            continue
+        keys = [_unescape_path_segment(segment) for segment in path.split('/')[1:]]
+        parent = document
+        for key in keys[:-1]:
+            if not isinstance(parent, dict) or key not in parent:
+                raise ValueError('Path {} does not exist.'.format(path))
+            parent = parent[key]
+        if not isinstance(parent, dict):
+            raise ValueError('Path {} does not exist.'.format(path))
+        if operation['op'] == 'remove':
+            parent.pop(keys[-1], None)
+        else:
+            parent[keys[-1]] = copy.deepcopy(operation['value'])
+    return document
@@ -0,0 +1,199 @@
+"""
+WatchMultiplexer runs many watch streams on a fixed number of I/O threads, feeding one dispatch
+queue.
+"""
+
+import logging
+import queue
+import threading
+
+from kubernetes.watch.watch import iter_resp_lines
+import urllib3
+
+logger = logging.getLogger(__name__)
+
+# Returned from a line function to close the current connection and open a new one.
+RECONNECT = object()
+
+
+class ReconnectAfter(object):
+    """
+    Returned from a line function to close the current connection, and dispatch a value before
+    opening a new one.
+
+    The watch isn't put back in the run queue until the value has been dispatched, so slow work
+    needed before reconnecting (like a relist) runs on the dispatch thread, in order with the
+    watch's earlier values, without holding an I/O thread.
+    """
+
+    def __init__(self, value):
+        """
+        Args:
+            value: The value to dispatch.
+        """
+        self.value = value
+
+
+class WatchMultiplexer(object):
+    """
+    Reads a set of watch streams on a fixed pool of I/O threads.
+
+    Watches wait in a run queue. An I/O thread takes the next watch, opens a connection, and reads
+    it line by line until the connection ends, then puts the watch back at the end of the queue and
+    takes the next one. Reconnects are iterations of this loop, not new threads or callbacks.
+
+    With at least as many threads as watches, every watch keeps a connection open. With fewer, each
+    connection should be opened with a server-side timeout (`slice_seconds`) so that the watches
+    take turns; events on a watch without an open connection are delivered once its turn comes,
+    since watches resume from the last resourceVersion seen.
+
+    Each line is passed to the watch's line function on the I/O thread, which should be cheap (a raw
+    parse and filter). Anything it returns is put on a single bounded dispatch queue, which one
+    dispatch thread drains in order, calling the dispatch function with the watch's key.
+    """
+
+    def __init__(self,
+                 io_threads,
+                 dispatch_function,
+                 error_callback,
+                 slice_seconds=None,
+                 max_queued_events=1000,
+                 retry_delay_seconds=1):
+        """
+        Args:
+            io_threads: The number of threads reading watch streams.
+            dispatch_function: The function to call on the dispatch thread with each watch key and
+                dispatched value.
+            error_callback: The function to invoke with any exception caught, on either kind of
+                thread.
+            slice_seconds: If set, the server-side timeout to pass when opening a connection, after
+                which the watch yields its thread. Required if there are more watches than threads.
+            max_queued_events: The maximum number of values waiting for dispatch. Reading blocks
+                when the queue is full.
+            retry_delay_seconds: The time an I/O thread waits after a failed connection.
+        """
+        self._io_threads = io_threads
+        self._dispatch_function = dispatch_function
+        self._error_callback = error_callback
+        self.slice_seconds = slice_seconds
+        self._retry_delay_seconds = retry_delay_seconds
+        # Map of watch key to (open function, line function).
+        self._watches = {}
+        self._run_queue = queue.Queue()
+        self._dispatch_queue = queue.Queue(max_queued_events)
+        self._stopped = threading.Event()
+
+    def add_watch(self, key, open_function, line_function):
+        """
+        Adds a watch, to be read once the multiplexer is started.
+
+        Args:
+            key: A unique key for the watch, passed to the dispatch function.
+            open_function: A function from the server-side timeout in seconds (or None) to a new
+                streaming urllib3 response for the watch.
+            line_function: A function from a raw line of the watch to the value to dispatch, None
+                to drop the line, RECONNECT to close the connection and reopen it, or a
+                ReconnectAfter to close the connection and reopen it after a final dispatch.
+        """
+        self._watches[key] = (open_function, line_function)
+        self._run_queue.put(key)
+
+    @property
+    def queued_event_count(self):
+        """The number of values waiting for dispatch."""
+        return self._dispatch_queue.qsize()
+
+    def start(self):
+        """Starts the I/O threads and the dispatch thread."""
+        self._stopped.clear()
+        for _ in range(self._io_threads):
+            threading.Thread(target=self._run_io, daemon=True).start()
+        threading.Thread(target=self._run_dispatch, daemon=True).start()
+
+    def stop(self):
+        """Stops reading and dispatching. Open connections are closed after their next line."""
+        self._stopped.set()
+
+    def _run_io(self):
+        """Reads watches from the run queue until stopped."""
+        while not self._stopped.is_set():
+            try:
+                # Wake up periodically to check for a stop.
+                key = self._run_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            requeue = True
+            try:
+                # Watches reconnecting after a dispatch are requeued by the dispatch thread.
+                requeue = not self._read_watch(key)
+            except Exception as e:
+                self._error_callback(e)
+                self._stopped.wait(self._retry_delay_seconds)
+            finally:
+                if requeue:
+                    self._run_queue.put(key)
+
+    def _read_watch(self, key):
+        """
+        Opens one connection for a watch, and reads it until it ends.
+
+        Returns:
+            True if the connection ended with a ReconnectAfter, whose value will requeue the watch
+            once dispatched.
+        """
+        open_function, line_function = self._watches[key]
+        response = open_function(self.slice_seconds)
+        try:
+            for line in iter_resp_lines(response):
+                if self._stopped.is_set():
+                    return
+                value = line_function(line)
+                if value is RECONNECT:
+                    return False
+                if isinstance(value, ReconnectAfter):
+                    return self._put(key, value.value, requeue=True)
+                if value is not None:
+                    self._put(key, value)
+        except urllib3.exceptions.ReadTimeoutError:
+            # The connection was idle for its whole request timeout; reconnect.
+            logger.debug('Request timeout on %s; reconnecting.', key)
+        finally:
+            response.close()
+            response.release_conn()
+        return False
+
+    def _put(self, key, value, requeue=False):
+        """
+        Adds a value to the dispatch queue, waiting for space unless stopped.
+
+        Args:
+            key: The key of the watch the value is from.
+            value: The value to dispatch.
+            requeue: If true, the dispatch thread puts the watch back in the run queue after
+                dispatching the value.
+
+        Returns:
+            True if the value was queued.
+        """
+        while not self._stopped.is_set():
+            try:
+                self._dispatch_queue.put((key, value, requeue), timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run_dispatch(self):
+        """Dispatches queued values until stopped."""
+        while not self._stopped.is_set():
+            try:
+                key, value, requeue = self._dispatch_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                self._dispatch_function(key, value)
+            except Exception as e:
+                self._error_callback(e)
+            finally:
+                if requeue:
+                    self._run_queue.put(key)
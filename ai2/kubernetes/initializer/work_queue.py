@@ -0,0 +1,153 @@
+"""
+WorkQueue is a deduplicating queue of items awaiting initialization, with per-item retry backoff.
+"""
+
+import collections
+import heapq
+import itertools
+import threading
+import time
+
+
+class WorkQueue(object):
+    """
+    A thread-safe queue of keyed work, which collapses duplicate keys and retries with backoff.
+
+    Each key is queued at most once. Adding a key which is already queued replaces its value with
+    the newer one, without changing its place in the queue. Adding a key which is currently being
+    processed (returned from get, but not yet passed to done) holds the new value until done is
+    called, so a key is never processed concurrently; if the new value has the same version as the
+    value being processed, it's a duplicate and is dropped.
+
+    Failed work may be re-added with add_after_failure, which delays it exponentially in the number
+    of consecutive failures for its key.
+    """
+
+    def __init__(self, base_retry_delay_seconds=0.05, max_retry_delay_seconds=30, max_retries=None):
+        """
+        Args:
+            base_retry_delay_seconds: The delay before the first retry of a failed key. Each further
+                consecutive failure doubles the delay.
+            max_retry_delay_seconds: The maximum delay before retrying a failed key.
+            max_retries: If set, the number of consecutive failures after which a key is no longer
+                retried.
+        """
+        self._base_retry_delay_seconds = base_retry_delay_seconds
+        self._max_retry_delay_seconds = max_retry_delay_seconds
+        self._max_retries = max_retries
+        self._condition = threading.Condition()
+        # Keys ready to process, in order.
+        self._ready = collections.deque()
+        # Map of queued (ready or delayed) key to its (value, version).
+        self._queued = {}
+        # Heap of (ready time, sequence number, key) for delayed keys.
+        self._delayed = []
+        self._sequence = itertools.count()
+        # Map of key being processed to its version.
+        self._processing = {}
+        # Map of key being processed to the (value, version) added while it was processing.
+        self._dirty = {}
+        # Map of key to its number of consecutive failures.
+        self._failures = {}
+
+    @property
+    def depth(self):
+        """The number of keys queued, including those waiting out a retry delay."""
+        with self._condition:
+            return len(self._queued) + len(self._dirty)
+
+    def add(self, key, value, version=None):
+        """
+        Adds the given value to the queue, replacing any queued value for the same key.
+
+        Args:
+            key: The (hashable) key identifying the work.
+            value: The value to return from get.
+            version: An optional version of the value, used to drop duplicates of the value being
+                processed.
+        """
+        with self._condition:
+            if key in self._processing:
+                if version is None or version != self._processing[key]:
+                    self._dirty[key] = (value, version)
+            elif key in self._queued:
+                self._queued[key] = (value, version)
+            else:
+                self._queued[key] = (value, version)
+                self._ready.append(key)
+                self._condition.notify()
+
+    def add_after_failure(self, key, value, version=None):
+        """
+        Re-adds a failed key after its backoff delay.
+
+        This should be called after done for the failed key. If a newer value for the key has
+        already been queued, that value is kept instead of retrying this one.
+
+        Returns:
+            False if the key has exceeded max_retries and was not re-added, else True.
+        """
+        with self._condition:
+            failures = self._failures.get(key, 0) + 1
+            if self._max_retries is not None and failures > self._max_retries:
+                self._failures.pop(key, None)
+                return False
+            self._failures[key] = failures
+            if key in self._queued or key in self._processing:
+                return True
+            delay = min(self._base_retry_delay_seconds * 2**(failures - 1),
+                        self._max_retry_delay_seconds)
+            self._queued[key] = (value, version)
+            heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._sequence), key))
+            self._condition.notify()
+            return True
+
+    def forget(self, key):
+        """Resets the failure count for the given key, after it's processed successfully."""
+        with self._condition:
+            self._failures.pop(key, None)
+
+    def get(self, timeout=None):
+        """
+        Removes and returns the next ready key and its value.
+
+        The caller must call done with the key once processing finishes.
+
+        Args:
+            timeout: The maximum number of seconds to wait for a ready key. If zero, this doesn't
+                block. If None, this waits indefinitely.
+
+        Returns:
+            A (key, value) tuple, or None if no key was ready within the timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    self._ready.append(heapq.heappop(self._delayed)[2])
+                if self._ready:
+                    key = self._ready.popleft()
+                    value, version = self._queued.pop(key)
+                    self._processing[key] = version
+                    return key, value
+
+                wait_seconds = None
+                if self._delayed:
+                    wait_seconds = self._delayed[0][0] - now
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        return None
+                    wait_seconds = remaining if wait_seconds is None else min(
+                        wait_seconds, remaining)
+                self._condition.wait(wait_seconds)
+
+    def done(self, key):
+        """Marks the given key as finished processing, queueing any value added meanwhile."""
+        with self._condition:
+            del self._processing[key]
+            if key in self._dirty:
+                self._queued[key] = self._dirty.pop(key)
+                self._ready.append(key)
+                self._condition.notify()
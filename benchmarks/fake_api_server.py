@@ -0,0 +1,330 @@
+"""
+An in-process stand-in for the Kubernetes API server, for benchmarking initializers.
+
+This serves just enough of the API for InitializerController: chunked lists, watches, reads, and
+replaces of pods, jobs, and deployments. It can inject latency and 409 Conflict errors, and it
+records how long each object took to be initialized.
+"""
+
+import datetime
+import http.server
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+import urllib.parse
+import uuid
+
+# Map of resource path prefix to (plural, kind).
+RESOURCES = {
+    '/api/v1': [('pods', 'Pod')],
+    '/apis/batch/v1': [('jobs', 'Job')],
+    '/apis/extensions/v1beta1': [('deployments', 'Deployment')],
+}
+
+_API_VERSIONS = {'Pod': 'v1', 'Job': 'batch/v1', 'Deployment': 'extensions/v1beta1'}
+
+_POD_SPEC = {'containers': [{'name': 'main', 'image': 'busybox'}]}
+
+_TEMPLATE = {'metadata': {'labels': {'app': 'bench'}}, 'spec': _POD_SPEC}
+
+_SPECS = {
+    'Pod': _POD_SPEC,
+    'Job': {'template': _TEMPLATE},
+    'Deployment': {'template': _TEMPLATE},
+}
+
+
+def _percentile(values, percentile):
+    """Returns the given percentile (0-100) of a non-empty list of values."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percentile / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class FakeApiServer(object):
+    """
+    A fake Kubernetes API server holding uninitialized objects.
+
+    Objects are created pending on `initializer_name`. An object counts as initialized once a
+    replace removes that initializer from its pending list.
+    """
+
+    def __init__(self,
+                 initializer_name,
+                 replace_latency_seconds=0,
+                 list_latency_seconds=0,
+                 conflict_rate=0,
+                 seed=0):
+        """
+        Args:
+            initializer_name: The initializer that created objects are pending on.
+            replace_latency_seconds: Latency added to every replace request.
+            list_latency_seconds: Latency added to every list request, and to the start of every
+                watch.
+            conflict_rate: The probability that a replace request fails with a 409 Conflict.
+            seed: The seed for conflict injection.
+        """
+        self.initializer_name = initializer_name
+        self.replace_latency_seconds = replace_latency_seconds
+        self.list_latency_seconds = list_latency_seconds
+        self.conflict_rate = conflict_rate
+        self._random = random.Random(seed)
+        self._condition = threading.Condition()
+        self._resource_version = 0
+        # Map of (plural, namespace, name) to the stored object.
+        self._objects = {}
+        # List of (resourceVersion, plural, event type, object), in resourceVersion order.
+        self._events = []
+        self._stopped = False
+        # Map of (plural, namespace, name) to creation time, for objects not yet initialized.
+        self._created_at = {}
+        self.latencies = []
+        self.replace_count = 0
+        self.conflict_count = 0
+        self._server = None
+
+    @property
+    def url(self):
+        """The base URL of the running server."""
+        return 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    @property
+    def pending_count(self):
+        """The number of created objects which haven't been initialized."""
+        with self._condition:
+            return len(self._created_at)
+
+    def start(self):
+        """Starts serving on a free local port, on a background thread."""
+        server = self
+
+        class Handler(_RequestHandler):
+            fake_server = server
+
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        """Stops the server, closing open watches."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def create(self, plural, count, namespace='bench'):
+        """Creates `count` uninitialized objects of the given resource type."""
+        kind = dict(kind for kinds in RESOURCES.values() for kind in kinds)[plural]
+        with self._condition:
+            for _ in range(count):
+                name = '{}-{}'.format(kind.lower(), uuid.uuid4().hex[:12])
+                now = datetime.datetime.now(datetime.timezone.utc)
+                obj = {
+                    'apiVersion': _API_VERSIONS[kind],
+                    'kind': kind,
+                    'metadata': {
+                        'name': name,
+                        'namespace': namespace,
+                        'uid': str(uuid.uuid4()),
+                        'creationTimestamp': now.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                        'labels': {
+                            'app': 'bench'
+                        },
+                        'initializers': {
+                            'pending': [{
+                                'name': self.initializer_name
+                            }]
+                        },
+                    },
+                    'spec': _SPECS[kind],
+                }
+                key = (plural, namespace, name)
+                self._created_at[key] = time.monotonic()
+                self._store(plural, key, obj, 'ADDED')
+            self._condition.notify_all()
+
+    def wait_for_initialized(self, timeout_seconds):
+        """Waits until no objects are pending, returning False on timeout."""
+        deadline = time.monotonic() + timeout_seconds
+        with self._condition:
+            while self._created_at:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def latency_summary(self):
+        """Returns a dict of p50 and p99 initialization latency, in seconds."""
+        with self._condition:
+            latencies = list(self.latencies)
+        if not latencies:
+            return {'p50': None, 'p99': None}
+        return {'p50': _percentile(latencies, 50), 'p99': _percentile(latencies, 99)}
+
+    def _store(self, plural, key, obj, event_type):
+        """Stores an object with a new resourceVersion. The caller must hold the lock."""
+        self._resource_version += 1
+        obj['metadata']['resourceVersion'] = str(self._resource_version)
+        self._objects[key] = obj
+        self._events.append((self._resource_version, plural, event_type, obj))
+
+    def list(self, plural, limit=None, continue_token=None):
+        """Returns a list response body for the given resource type."""
+        with self._condition:
+            items = [obj for (obj_plural, _, _), obj in self._objects.items() if obj_plural == plural]
+            resource_version = str(self._resource_version)
+        start = int(continue_token) if continue_token else 0
+        end = start + limit if limit else len(items)
+        metadata = {'resourceVersion': resource_version}
+        if end < len(items):
+            metadata['continue'] = str(end)
+        return {'kind': 'List', 'apiVersion': 'v1', 'metadata': metadata, 'items': items[start:end]}
+
+    def read(self, plural, namespace, name):
+        """Returns the stored object, or None."""
+        with self._condition:
+            return self._objects.get((plural, namespace, name))
+
+    def replace(self, plural, namespace, name, obj):
+        """Replaces a stored object, returning (status code, response body)."""
+        if self.replace_latency_seconds:
+            time.sleep(self.replace_latency_seconds)
+        key = (plural, namespace, name)
+        with self._condition:
+            self.replace_count += 1
+            current = self._objects.get(key)
+            if current is None:
+                return 404, _status(404, 'NotFound')
+            sent_version = obj.get('metadata', {}).get('resourceVersion')
+            if (sent_version != current['metadata']['resourceVersion']
+                    or self._random.random() < self.conflict_rate):
+                self.conflict_count += 1
+                return 409, _status(409, 'Conflict')
+
+            self._store(plural, key, obj, 'MODIFIED')
+            pending = (obj['metadata'].get('initializers') or {}).get('pending') or []
+            if key in self._created_at and all(
+                    initializer.get('name') != self.initializer_name for initializer in pending):
+                self.latencies.append(time.monotonic() - self._created_at.pop(key))
+            self._condition.notify_all()
+            return 200, obj
+
+    def watch_events(self, plural, resource_version, deadline):
+        """Yields (type, object) watch events after the given resourceVersion until the deadline."""
+        if resource_version is None:
+            # A watch without a resourceVersion starts with the current state, as ADDED events.
+            with self._condition:
+                current = [obj for (obj_plural, _, _), obj in self._objects.items()
+                           if obj_plural == plural]
+                resource_version = self._resource_version
+            for obj in current:
+                yield 'ADDED', obj
+        resource_version = int(resource_version)
+        while True:
+            with self._condition:
+                # Events are stored in resourceVersion order, starting at 1.
+                pending = [(version, event_type, obj)
+                           for version, event_plural, event_type, obj in
+                           self._events[resource_version:] if event_plural == plural]
+                if not pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self._stopped:
+                        return
+                    self._condition.wait(min(remaining, 1))
+                    continue
+            for version, event_type, obj in pending:
+                resource_version = version
+                yield event_type, obj
+
+
+def _status(code, reason):
+    """Returns a Status response body."""
+    return {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure', 'code': code,
+            'reason': reason, 'message': reason}
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    """Routes API requests to the FakeApiServer set as `fake_server` on subclasses."""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and bodies are written separately, so Nagle's algorithm would add ~40ms per request.
+    disable_nagle_algorithm = True
+    fake_server = None
+
+    _COLLECTION = re.compile(r'^(?P<prefix>/apis?(?:/[^/]+)+?)/(?P<plural>pods|jobs|deployments)$')
+    _ITEM = re.compile(r'^(?P<prefix>/apis?(?:/[^/]+)+?)/namespaces/(?P<namespace>[^/]+)/'
+                       r'(?P<plural>pods|jobs|deployments)/(?P<name>[^/]+)$')
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        collection = self._COLLECTION.match(url.path)
+        item = self._ITEM.match(url.path)
+        if collection:
+            plural = collection.group('plural')
+            if self.fake_server.list_latency_seconds:
+                time.sleep(self.fake_server.list_latency_seconds)
+            if query.get('watch', ['false'])[0] in ('true', 'True', '1'):
+                self._watch(plural, query)
+            else:
+                limit = int(query['limit'][0]) if 'limit' in query else None
+                self._send_json(200, self.fake_server.list(plural, limit,
+                                                           query.get('continue', [None])[0]))
+        elif item:
+            obj = self.fake_server.read(item.group('plural'), item.group('namespace'),
+                                        item.group('name'))
+            if obj is None:
+                self._send_json(404, _status(404, 'NotFound'))
+            else:
+                self._send_json(200, obj)
+        else:
+            self._send_json(404, _status(404, 'NotFound'))
+
+    def do_PUT(self):
+        item = self._ITEM.match(urllib.parse.urlparse(self.path).path)
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if not item:
+            self._send_json(404, _status(404, 'NotFound'))
+            return
+        code, response = self.fake_server.replace(item.group('plural'), item.group('namespace'),
+                                                   item.group('name'), body)
+        self._send_json(code, response)
+
+    def _send_json(self, code, body):
+        data = json.dumps(body).encode('utf8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _watch(self, plural, query):
+        """Streams watch events with chunked encoding until the watch times out."""
+        timeout_seconds = int(query.get('timeoutSeconds', ['300'])[0])
+        resource_version = query.get('resourceVersion', [None])[0]
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for event_type, obj in self.fake_server.watch_events(
+                    plural, resource_version, time.monotonic() + timeout_seconds):
+                line = (json.dumps({'type': event_type, 'object': obj}) + '\n').encode('utf8')
+                self.wfile.write('{:x}\r\n'.format(len(line)).encode('ascii') + line + b'\r\n')
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up, usually on its request timeout.
+            pass
+        self.close_connection = True
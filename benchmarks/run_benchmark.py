@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Benchmarks InitializerController against a FakeApiServer.
+
+Each mode runs in its own process, so that its CPU time and peak RSS exclude the fake server. For
+example, from the project root:
+
+    python3 -m benchmarks.run_benchmark --pods 2000 --jobs 200 --deployments 200 \\
+        --replace-latency 0.002 --conflict-rate 0.01
+"""
+
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import time
+
+import kubernetes
+
+from ai2.kubernetes.initializer import (InitializerController, ResourceHandler,
+                                        SimpleResourceController)
+from ai2.kubernetes.initializer.connection_pool import build_api_client
+
+from .fake_api_server import FakeApiServer
+
+INITIALIZER_NAME = 'bench.initializer'
+
+MODES = ('handle_update', 'async_handle_updates')
+
+
+def _build_initializer(url, controller_kwargs, handler_kwargs):
+    """Builds an InitializerController for pods, jobs, and deployments, talking to `url`."""
+    configuration = kubernetes.client.Configuration()
+    configuration.host = url
+    # One watch per controller, plus the updates in flight.
+    api_client = build_api_client(
+        configuration, watches=3, concurrent_requests=controller_kwargs.get('max_workers') or 1)
+
+    def handle_item(item):
+        return item
+
+    controllers = [
+        SimpleResourceController(factory(api_client, **handler_kwargs), handle_item)
+        for factory in (ResourceHandler.pod_handler, ResourceHandler.job_handler,
+                        ResourceHandler.deployment_handler)
+    ]
+    return InitializerController(INITIALIZER_NAME, controllers, **controller_kwargs)
+
+
+def _run_mode(mode, url, controller_kwargs, handler_kwargs, stop_event, results):
+    """Runs the initializer in the given mode until stop_event is set, reporting resource usage."""
+    start_cpu = time.process_time()
+    if mode == 'async_handle_updates':
+        # Watch callbacks (`callback=`) aren't supported by kubernetes>=4 clients, so read the
+        # watches on a WatchMultiplexer, with a thread per controller unless set otherwise.
+        controller_kwargs = dict(
+            controller_kwargs, watch_threads=controller_kwargs.get('watch_threads') or 3)
+    initializer = _build_initializer(url, controller_kwargs, handler_kwargs)
+    errors = []
+    if mode == 'handle_update':
+        while not stop_event.is_set():
+            try:
+                initializer.handle_update()
+            except Exception as e:
+                errors.append(repr(e))
+    else:
+        try:
+            initializer.async_handle_updates(lambda e: errors.append(repr(e)))
+        except Exception as e:
+            errors.append(repr(e))
+        stop_event.wait()
+        initializer.halt_async_handle_updates()
+    initializer.close()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    results.put({
+        'cpu_seconds': time.process_time() - start_cpu,
+        # ru_maxrss is in kilobytes on Linux, and bytes on OS X.
+        'peak_rss_mb': usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+    })
+
+
+def run_benchmark(mode,
+                  counts,
+                  timeout_seconds=300,
+                  controller_kwargs=None,
+                  handler_kwargs=None,
+                  **server_kwargs):
+    """
+    Runs a single benchmark.
+
+    Args:
+        mode: One of MODES.
+        counts: A dict of resource plural ('pods', 'jobs', 'deployments') to the number of
+            uninitialized objects to create.
+        timeout_seconds: The maximum time to wait for all objects to be initialized.
+        controller_kwargs: Keyword arguments for the InitializerController.
+        handler_kwargs: Keyword arguments for the ResourceHandler factories.
+        server_kwargs: Keyword arguments for the FakeApiServer.
+
+    Returns:
+        A dict of results.
+    """
+    server = FakeApiServer(INITIALIZER_NAME, **server_kwargs)
+    server.start()
+    try:
+        total = 0
+        for plural, count in counts.items():
+            server.create(plural, count)
+            total += count
+
+        context = multiprocessing.get_context('spawn')
+        stop_event = context.Event()
+        results = context.Queue()
+        process = context.Process(
+            target=_run_mode,
+            args=(mode, server.url, controller_kwargs or {}, handler_kwargs or {}, stop_event,
+                  results))
+        start = time.monotonic()
+        process.start()
+        completed = server.wait_for_initialized(timeout_seconds)
+        elapsed = time.monotonic() - start
+        stop_event.set()
+        try:
+            usage = results.get(timeout=60)
+        finally:
+            process.join(10)
+            if process.is_alive():
+                process.terminate()
+    finally:
+        server.stop()
+
+    initialized = total - server.pending_count
+    result = {
+        'mode': mode,
+        'items': total,
+        'initialized': initialized,
+        'completed': completed,
+        'seconds': elapsed,
+        'items_per_second': initialized / elapsed if elapsed else None,
+        'replaces': server.replace_count,
+        'conflicts': server.conflict_count,
+    }
+    result.update({'latency_' + key: value for key, value in server.latency_summary().items()})
+    result.update(usage)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--mode', choices=MODES, action='append', help='Modes to run (default: all)')
+    parser.add_argument('--pods', type=int, default=1000)
+    parser.add_argument('--jobs', type=int, default=100)
+    parser.add_argument('--deployments', type=int, default=100)
+    parser.add_argument('--replace-latency', type=float, default=0, help='Seconds per replace')
+    parser.add_argument('--list-latency', type=float, default=0, help='Seconds per list or watch')
+    parser.add_argument(
+        '--conflict-rate', type=float, default=0, help='Chance of a 409 per replace')
+    parser.add_argument('--max-workers', type=int, default=None)
+    parser.add_argument(
+        '--watch-threads', type=int, default=None, help='I/O threads for async_handle_updates')
+    parser.add_argument('--page-size', type=int, default=None, help='Items per list page')
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    controller_kwargs = {}
+    if args.max_workers:
+        controller_kwargs['max_workers'] = args.max_workers
+    if args.watch_threads:
+        controller_kwargs['watch_threads'] = args.watch_threads
+    handler_kwargs = {}
+    if args.page_size:
+        handler_kwargs['page_size'] = args.page_size
+    counts = {'pods': args.pods, 'jobs': args.jobs, 'deployments': args.deployments}
+    for mode in args.mode or MODES:
+        result = run_benchmark(
+            mode,
+            counts,
+            timeout_seconds=args.timeout,
+            controller_kwargs=controller_kwargs,
+            handler_kwargs=handler_kwargs,
+            replace_latency_seconds=args.replace_latency,
+            list_latency_seconds=args.list_latency,
+            conflict_rate=args.conflict_rate)
+        print(json.dumps(result, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,6 @@
 """Contains the main method for example handlers."""
 
 import logging
-import time
 
 import kubernetes
 
@@ -13,7 +12,8 @@ def main_loop(controller_constructor, run_async=False):
     This looks for a local kubernetes config file. If you wish to run on a cluster, you'll want to
     replace the load_kube_config call with a load_incluster_config call.
 
-    The update loop is run every 5 seconds. Since create resource requests will block until all
+    The update loop polls again immediately while there are items to initialize, and backs off to
+    polling every 5 seconds when idle. Since create resource requests will block until all
     initializers complete, we want this to be frequent.
 
     Args:
@@ -46,14 +46,16 @@ def main_loop(controller_constructor, run_async=False):
 
         controller.async_handle_updates(error_handler)
     else:
-        # We want this loop to run frequently enough that clients aren't timing out while waiting
-        # for the initializer to complete.
-        # This uses a 5-second loop period, but you may wish for a shorter loop.
-        # A production-quality handler should catch exceptions here.
-        while True:
-            # A production-quality handler should catch exceptions here.
-            controller.handle_update()
-            time.sleep(5)
+        # We want polls to be frequent enough that clients aren't timing out while waiting for the
+        # initializer to complete. This waits at most 5 seconds between polls, but you may wish for
+        # a lower latency target.
+        # A production-quality handler should pass an error_callback which logs errors, so that
+        # the loop keeps running after them.
+        try:
+            controller.run_forever(latency_target_seconds=5)
+        finally:
+            # Stop any worker threads and handler processes.
+            controller.close()
 
 
 if __name__ == "__main__":
@@ -35,4 +35,8 @@ setup(
     ],
     keywords='kubernetes initializer',
     packages=find_packages(exclude=['test']),
-    install_requires=['kubernetes>=3.0.0b1', 'requests[security]', 'urllib3'])
+    install_requires=['kubernetes>=3.0.0b1', 'requests[security]', 'urllib3'],
+    extras_require={
+        # Required for AsyncInitializerController.
+        'asyncio': ['kubernetes_asyncio'],
+    })
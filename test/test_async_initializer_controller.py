@@ -0,0 +1,149 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import Mock, patch
+
+import kubernetes
+from kubernetes.client.models.v1_initializer import V1Initializer
+from kubernetes.client.models.v1_initializers import V1Initializers
+
+from ai2.kubernetes.initializer.async_initializer_controller import AsyncInitializerController
+from ai2.kubernetes.initializer.rejection import Rejection
+
+
+class FakeWatchResponse(object):
+    """A fake aiohttp response streaming the given watch events."""
+
+    def __init__(self, events):
+        self.content = self
+        self._lines = [(json.dumps(event) + '\n').encode('utf8') for event in events]
+        self.released = False
+
+    async def readline(self):
+        return self._lines.pop(0) if self._lines else b''
+
+    def release(self):
+        self.released = True
+
+
+def pod_event(name, uid, pending, event_type='ADDED'):
+    """Returns a raw watch event for a pod with the given pending initializers."""
+    return {
+        'type': event_type,
+        'object': {
+            'metadata': {
+                'name': name,
+                'namespace': 'default',
+                'uid': uid,
+                'resourceVersion': '9',
+                'initializers': {
+                    'pending': [{
+                        'name': pending_name
+                    } for pending_name in pending]
+                }
+            }
+        }
+    }
+
+
+# Unmarshal with the synchronous client's Watch, which has the same interface as
+# kubernetes_asyncio's.
+@patch.object(AsyncInitializerController, '_new_watch', lambda self: kubernetes.watch.Watch())
+class TestAsyncInitializerController(unittest.TestCase):
+    def mock_async_controller(self, list_items, watch_responses, test_controller_ref):
+        """Returns a mocked controller with asyncio list and watch functions."""
+        mock_controller = Mock()
+        mock_controller.name = 'ctrl'
+        mock_controller.selector_kwargs = {}
+        mock_controller.snapshot_item.return_value = None
+        mock_controller.watch_calls = []
+
+        async def aiter_items(resource_version=None, metadata_callback=None):
+            list_metadata = Mock()
+            list_metadata.resource_version = '1'
+            metadata_callback(list_metadata)
+            for item in list_items:
+                yield item
+
+        async def list_all_items_fn(**kwargs):
+            mock_controller.watch_calls.append(kwargs)
+            if not watch_responses:
+                test_controller_ref[0].halt_handle_updates()
+                return FakeWatchResponse([])
+            return FakeWatchResponse(watch_responses.pop(0))
+
+        list_all_items_fn.__doc__ = ':return: V1PodList'
+        mock_controller.aiter_items = aiter_items
+        mock_controller.list_all_items_fn = list_all_items_fn
+        return mock_controller
+
+    def run_controller(self, test_controller):
+        """Runs the given controller until halted, returning the mocked error callback."""
+        error_callback = Mock()
+        asyncio.new_event_loop().run_until_complete(
+            asyncio.wait_for(test_controller.handle_updates(error_callback), 5))
+        return error_callback
+
+    def test_handles_listed_and_watched_items(self):
+        """Tests that listed and watched items pending on our initializer are handled."""
+        listed_item = Mock()
+        listed_item.metadata.uid = 'listed'
+        listed_item.metadata.namespace = 'default'
+        listed_item.metadata.name = 'listed'
+        listed_item.metadata.resource_version = '1'
+        listed_item.metadata.creation_timestamp = None
+        listed_item.metadata.initializers = V1Initializers(
+            pending=[V1Initializer(name='fooey'), V1Initializer(name='next')])
+        events = [
+            pod_event('skipped', 'a', ['other', 'fooey']),
+            pod_event('watched', 'b', ['fooey']),
+        ]
+        test_controller_ref = []
+        mock_controller = self.mock_async_controller([listed_item], [events],
+                                                     test_controller_ref)
+
+        async def handle_item(item):
+            return item
+
+        updated = []
+
+        async def update_item(item, snapshot):
+            updated.append(item)
+
+        mock_controller.handle_item = handle_item
+        mock_controller.update_item = update_item
+
+        test_controller = AsyncInitializerController('fooey', [mock_controller])
+        test_controller_ref.append(test_controller)
+        error_callback = self.run_controller(test_controller)
+
+        error_callback.assert_not_called()
+        self.assertEqual(len(updated), 2)
+        self.assertEqual(updated[0].metadata.initializers.pending, [V1Initializer(name='next')])
+        self.assertEqual(updated[1].metadata.name, 'watched')
+        self.assertEqual(updated[1].metadata.initializers, None)
+        # Watches resume from the list, then from the last event.
+        self.assertEqual(mock_controller.watch_calls[0]['resource_version'], '1')
+        self.assertEqual(mock_controller.watch_calls[1]['resource_version'], '9')
+        self.assertEqual(test_controller.tracking_store.resume_version('ctrl'), '9')
+        # Saved items stop being tracked; the item pending behind another initializer stays.
+        self.assertEqual(len(test_controller.tracking_store), 1)
+        self.assertIn('a', test_controller.tracking_store)
+
+    def test_sync_handler_rejection(self):
+        """Tests that synchronous handlers and rejections are supported."""
+        test_controller_ref = []
+        mock_controller = self.mock_async_controller(
+            [], [[pod_event('rejected', 'a', ['fooey'])]], test_controller_ref)
+        fake_rejection = Rejection(message='failure!')
+        mock_controller.handle_item.side_effect = fake_rejection
+        mock_controller.update_item.return_value = None
+
+        test_controller = AsyncInitializerController(
+            'fooey', [mock_controller], max_concurrent_items=1)
+        test_controller_ref.append(test_controller)
+        error_callback = self.run_controller(test_controller)
+
+        error_callback.assert_not_called()
+        updated_item = mock_controller.update_item.call_args[0][0]
+        self.assertEqual(updated_item.metadata.initializers.result, fake_rejection.status)
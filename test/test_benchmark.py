@@ -0,0 +1,49 @@
+import queue
+import threading
+import time
+import unittest
+
+from benchmarks.fake_api_server import FakeApiServer
+from benchmarks.run_benchmark import INITIALIZER_NAME, _build_initializer, _run_mode
+
+
+class TestBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeApiServer(INITIALIZER_NAME, conflict_rate=0.2)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_handle_update_initializes_everything(self):
+        """Tests that a polling initializer initializes all fake objects, despite conflicts."""
+        self.server.create('pods', 25)
+        self.server.create('jobs', 5)
+        self.server.create('deployments', 5)
+
+        initializer = _build_initializer(self.server.url, {}, {'page_size': 10})
+        initializer.handle_update()
+
+        self.assertEqual(self.server.pending_count, 0)
+        self.assertEqual(len(self.server.latencies), 35)
+        self.assertGreater(self.server.conflict_count, 0)
+
+    def test_async_mode_initializes_watched_objects(self):
+        """Tests that the async mode runs on this client, initializing objects as they appear."""
+        stop_event = threading.Event()
+        results = queue.Queue()
+        thread = threading.Thread(
+            target=_run_mode,
+            args=('async_handle_updates', self.server.url, {}, {}, stop_event, results))
+        thread.start()
+        try:
+            self.server.create('pods', 5)
+            # Give the watches time to open, so that these are found by watch rather than list.
+            time.sleep(0.5)
+            self.server.create('jobs', 5)
+            self.assertTrue(self.server.wait_for_initialized(10))
+        finally:
+            stop_event.set()
+            thread.join(10)
+
+        self.assertEqual(results.get(timeout=1)['errors'], 0)
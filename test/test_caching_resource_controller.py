@@ -0,0 +1,136 @@
+import time
+import unittest
+from unittest.mock import Mock
+
+from kubernetes.client.models.v1_container import V1Container
+from kubernetes.client.models.v1_initializer import V1Initializer
+from kubernetes.client.models.v1_initializers import V1Initializers
+from kubernetes.client.models.v1_object_meta import V1ObjectMeta
+from kubernetes.client.models.v1_owner_reference import V1OwnerReference
+from kubernetes.client.models.v1_pod import V1Pod
+from kubernetes.client.models.v1_pod_spec import V1PodSpec
+
+from ai2.kubernetes.initializer.caching_resource_controller import CachingResourceController
+from ai2.kubernetes.initializer.metrics import DECISION_CACHE_LOOKUPS, Metrics
+from ai2.kubernetes.initializer.rejection import Rejection
+
+
+class TestCachingResourceController(unittest.TestCase):
+    def pod(self, name, image='busybox', owner_uid='rs-uid'):
+        """Returns a pending pod with the given name, owned by the given ReplicaSet."""
+        return V1Pod(
+            kind='Pod',
+            metadata=V1ObjectMeta(
+                name=name,
+                namespace='space',
+                uid='{}-uid'.format(name),
+                resource_version='1',
+                labels={'app': 'web'},
+                owner_references=[
+                    V1OwnerReference(
+                        api_version='apps/v1',
+                        kind='ReplicaSet',
+                        name='rs',
+                        uid=owner_uid,
+                        controller=True)
+                ],
+                initializers=V1Initializers(pending=[V1Initializer(name='fooey')])),
+            spec=V1PodSpec(containers=[V1Container(name='main', image=image)]))
+
+    def caching_controller(self, handle_item, **kwargs):
+        """Returns a CachingResourceController wrapping a mock with the given handle_item."""
+        mock_controller = Mock()
+        mock_controller._resource_handler.name = 'pods'
+        mock_controller.handle_item.side_effect = handle_item
+        return mock_controller, CachingResourceController(mock_controller, **kwargs)
+
+    def test_replays_mutations(self):
+        """Tests that changes made to one item are replayed onto a look-alike item."""
+
+        def handle_item(item):
+            item.metadata.labels['checked'] = 'true'
+            item.spec.containers[0].image = 'registry/busybox'
+            return item
+
+        mock_controller, controller = self.caching_controller(handle_item)
+        controller.handle_item(self.pod('first'))
+        result = controller.handle_item(self.pod('second'))
+
+        mock_controller.handle_item.assert_called_once()
+        self.assertEqual(result.metadata.name, 'second')
+        self.assertEqual(result.metadata.uid, 'second-uid')
+        self.assertEqual(result.metadata.labels, {'app': 'web', 'checked': 'true'})
+        self.assertEqual(result.spec.containers[0].image, 'registry/busybox')
+        self.assertEqual(result.metadata.initializers.pending, [V1Initializer(name='fooey')])
+        self.assertEqual((controller.hits, controller.misses), (1, 1))
+
+    def test_unreplayable_decisions_miss(self):
+        """Tests that a cached patch which doesn't fit a look-alike item falls back to handling."""
+
+        def handle_item(item):
+            item.metadata.annotations = dict(item.metadata.annotations or {}, checked='true')
+            return item
+
+        mock_controller, controller = self.caching_controller(handle_item)
+        first = self.pod('first')
+        first.metadata.annotations = {'note': 'hi'}
+        controller.handle_item(first)
+        # The cached patch adds to existing annotations, which this item doesn't have.
+        result = controller.handle_item(self.pod('second'))
+
+        self.assertEqual(mock_controller.handle_item.call_count, 2)
+        self.assertEqual(result.metadata.annotations, {'checked': 'true'})
+        self.assertEqual((controller.hits, controller.misses), (0, 2))
+
+    def test_different_items_miss(self):
+        """Tests that items with different specs or owners aren't served from the cache."""
+        mock_controller, controller = self.caching_controller(lambda item: item)
+        controller.handle_item(self.pod('first'))
+        controller.handle_item(self.pod('second', image='nginx'))
+        controller.handle_item(self.pod('third', owner_uid='other-rs'))
+        self.assertEqual(mock_controller.handle_item.call_count, 3)
+        self.assertEqual(controller.misses, 3)
+
+    def test_replays_rejections(self):
+        """Tests that rejections are cached and raised again."""
+
+        def handle_item(item):
+            raise Rejection(message='no', reason='Nope', code=403)
+
+        metrics = Metrics()
+        mock_controller, controller = self.caching_controller(handle_item, metrics=metrics)
+        for name in ('first', 'second'):
+            with self.assertRaises(Rejection) as context:
+                controller.handle_item(self.pod(name))
+            self.assertEqual(context.exception.status.reason, 'Nope')
+            self.assertEqual(context.exception.status.code, 403)
+        mock_controller.handle_item.assert_called_once()
+        self.assertEqual(metrics.get(DECISION_CACHE_LOOKUPS, 'pods', result='hit'), 1)
+        self.assertEqual(metrics.get(DECISION_CACHE_LOOKUPS, 'pods', result='miss'), 1)
+
+    def test_skips_identity_changes(self):
+        """Tests that decisions changing an item's identity aren't cached."""
+
+        def handle_item(item):
+            item.metadata.name = item.metadata.name + '-renamed'
+            return item
+
+        mock_controller, controller = self.caching_controller(handle_item)
+        controller.handle_item(self.pod('first'))
+        controller.handle_item(self.pod('second'))
+        self.assertEqual(mock_controller.handle_item.call_count, 2)
+        self.assertEqual(controller.cache_size, 0)
+
+    def test_evicts_expired_and_least_recently_used(self):
+        """Tests that the cache is bounded by size and age."""
+        mock_controller, controller = self.caching_controller(
+            lambda item: item, max_size=2, ttl_seconds=0.05)
+        for image in ('a', 'b', 'c'):
+            controller.handle_item(self.pod(image, image=image))
+        self.assertEqual(controller.cache_size, 2)
+        controller.handle_item(self.pod('a2', image='a'))
+        self.assertEqual(mock_controller.handle_item.call_count, 4)
+
+        time.sleep(0.1)
+        controller.handle_item(self.pod('c2', image='c'))
+        self.assertEqual(mock_controller.handle_item.call_count, 5)
@@ -0,0 +1,62 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import threading
+import unittest
+
+import kubernetes
+
+from ai2.kubernetes.initializer.connection_pool import build_api_client, connection_pool_stats
+
+POD_NAMES = ['pod0', 'pod1', 'pod2']
+
+
+def pod(name):
+    """Returns a raw pod with the given name."""
+    return {'metadata': {'name': name, 'namespace': 'default'}}
+
+
+class PodHandler(BaseHTTPRequestHandler):
+    """Serves a fixed pod list and its pods over keep-alive connections."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path.startswith('/api/v1/pods'):
+            body = {'kind': 'PodList', 'metadata': {}, 'items': [pod(name) for name in POD_NAMES]}
+        else:
+            body = pod(self.path.split('?')[0].rsplit('/', 1)[-1])
+        data = json.dumps(body).encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestConnectionPool(unittest.TestCase):
+    def test_pool_is_sized_and_reused(self):
+        """Tests that the pool is sized for the workload, and connections are reused."""
+        server = HTTPServer(('127.0.0.1', 0), PodHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        configuration = kubernetes.client.Configuration()
+        configuration.host = 'http://127.0.0.1:{}'.format(server.server_port)
+        api_client = build_api_client(configuration, watches=2, concurrent_requests=3)
+        self.assertEqual(connection_pool_stats(api_client)['maxsize'], 0)
+
+        core_client = kubernetes.client.CoreV1Api(api_client)
+        for item in core_client.list_pod_for_all_namespaces().items:
+            core_client.read_namespaced_pod(item.metadata.name, item.metadata.namespace)
+
+        stats = connection_pool_stats(api_client)
+        self.assertEqual(stats['maxsize'], 5)
+        self.assertEqual(stats['requests'], 4)
+        self.assertEqual(stats['connections_created'], 1)
+        self.assertEqual(stats['idle'], 1)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(stats['saturation'], 0.0)
@@ -1,11 +1,26 @@
+import datetime
+import json
+import threading
+import time
 import unittest
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 from kubernetes.client.models.v1_initializer import V1Initializer
+from kubernetes.client.rest import ApiException
 from kubernetes.client.models.v1_initializers import V1Initializers
+from kubernetes.client.models.v1_object_meta import V1ObjectMeta
+from kubernetes.client.models.v1_pod import V1Pod
 
+from ai2.kubernetes.initializer.exceptions import InitializerError
 from ai2.kubernetes.initializer.initializer_controller import InitializerController
+from ai2.kubernetes.initializer.load_shedding import FAIL_CLOSED, LoadSheddingPolicy
+from ai2.kubernetes.initializer.metrics import (EVENTS_FILTERED, EVENTS_RECEIVED, HANDLE_SECONDS,
+                                                ITEMS_EXPIRED, ITEMS_SHED, LOAD_SHEDDING_ACTIVE,
+                                                LOAD_SHEDDING_TRANSITIONS, RESULTS,
+                                                UPDATE_SECONDS)
 from ai2.kubernetes.initializer.rejection import Rejection
+from ai2.kubernetes.initializer.speculation_cache import SpeculationCache
+from ai2.kubernetes.initializer.work_queue import WorkQueue
 
 
 class TestInitializerController(unittest.TestCase):
@@ -15,7 +30,17 @@ class TestInitializerController(unittest.TestCase):
         mock_controller.name = name
         mock_list_result = Mock()
         mock_list_result.items = list_results
+        mock_list_result.metadata.resource_version = '1'
         mock_controller.list_all_items.return_value = mock_list_result
+
+        def iter_items(resource_version=None, metadata_callback=None):
+            if metadata_callback:
+                metadata_callback(mock_list_result.metadata)
+            return iter(list_results)
+
+        mock_controller.iter_items.side_effect = iter_items
+        mock_controller.selector_kwargs = {}
+        mock_controller.snapshot_item.return_value = None
         return mock_controller
 
     def mock_item(self, name):
@@ -43,7 +68,7 @@ class TestInitializerController(unittest.TestCase):
         test_controller = InitializerController(initializer_name, [mock_controller])
         test_controller.handle_update()
 
-        mock_controller.update_item.assert_called_once_with(mock_result)
+        mock_controller.update_item.assert_called_once_with(mock_result, None)
         # mock_result should've had the pending list updated.
         self.assertEqual(mock_result.metadata.initializers.pending, [V1Initializer(name='foo')])
 
@@ -78,14 +103,14 @@ class TestInitializerController(unittest.TestCase):
             initializer_name, [mock_controller_1, mock_controller_2, mock_controller_3])
         test_controller.handle_update()
 
-        mock_controller_2.update_item.assert_called_once_with(mock_result)
+        mock_controller_2.update_item.assert_called_once_with(mock_result, None)
         # mock_result should've had its initializers wiped.
         self.assertEqual(mock_result.metadata.initializers, None)
 
         # Other controllers should have had items listed, but no items updated.
-        mock_controller_1.list_all_items.assert_called()
+        mock_controller_1.iter_items.assert_called()
         mock_controller_1.update_item.assert_not_called()
-        mock_controller_3.list_all_items.assert_called()
+        mock_controller_3.iter_items.assert_called()
         mock_controller_3.update_item.assert_not_called()
 
     def test_updates_with_rejections(self):
@@ -108,6 +133,842 @@ class TestInitializerController(unittest.TestCase):
         test_controller = InitializerController(initializer_name, [mock_controller])
         test_controller.handle_update()
 
-        mock_controller.update_item.assert_called_once_with(mock_handled)
+        mock_controller.update_item.assert_called_once_with(mock_handled, None)
         # mock_handled should've had its initializers updated with the status.
         self.assertEqual(mock_handled.metadata.initializers.result, fake_rejection.status)
+
+        # The two skipped items are filtered, and the handled one is rejected.
+        metrics = test_controller.metrics
+        self.assertEqual(metrics.get(EVENTS_RECEIVED, 'ctrl'), 3)
+        self.assertEqual(metrics.get(EVENTS_FILTERED, 'ctrl'), 2)
+        self.assertEqual(metrics.get(RESULTS, 'ctrl', result='rejected'), 1)
+        self.assertEqual(metrics.get(HANDLE_SECONDS, 'ctrl'), 1)
+        self.assertEqual(metrics.get(UPDATE_SECONDS, 'ctrl'), 1)
+
+    def mock_watch_response(self, events):
+        """Return a mocked streaming response containing the given watch events."""
+        mock_response = Mock()
+        mock_response.read_chunked.return_value = [
+            (json.dumps(event) + '\n').encode('utf8') for event in events
+        ]
+        return mock_response
+
+    def test_watch_resumes_from_resource_version(self):
+        """Tests that watches reconnect from the latest resourceVersion seen."""
+        mock_controller = self.mock_resource_controller('ctrl', [])
+        pod_event = {
+            'type': 'ADDED',
+            'object': {
+                'metadata': {
+                    'name': 'pod',
+                    'namespace': 'default',
+                    'resourceVersion': '42'
+                }
+            }
+        }
+        watch_calls = []
+
+        def list_all_items_fn(**kwargs):
+            watch_calls.append(kwargs)
+            if len(watch_calls) == 1:
+                kwargs['callback'](self.mock_watch_response([pod_event]))
+            else:
+                test_controller.halt_async_handle_updates()
+
+        list_all_items_fn.__doc__ = ':return: V1PodList'
+        mock_controller.list_all_items_fn = list_all_items_fn
+
+        test_controller = InitializerController('fooey', [mock_controller])
+        error_callback = Mock()
+        test_controller.async_handle_updates(error_callback)
+
+        error_callback.assert_not_called()
+        # The first watch starts from the initial list, and the second from the watched event.
+        self.assertEqual(watch_calls[0]['resource_version'], '1')
+        self.assertEqual(watch_calls[1]['resource_version'], '42')
+
+    def test_watch_relists_on_gone(self):
+        """Tests that an expired resourceVersion results in a fresh list."""
+        mock_controller = self.mock_resource_controller('ctrl', [])
+        gone_event = {'type': 'ERROR', 'object': {'kind': 'Status', 'code': 410}}
+        watch_calls = []
+
+        def list_all_items_fn(**kwargs):
+            watch_calls.append(kwargs)
+            if len(watch_calls) == 1:
+                kwargs['callback'](self.mock_watch_response([gone_event]))
+            else:
+                test_controller.halt_async_handle_updates()
+
+        list_all_items_fn.__doc__ = ':return: V1PodList'
+        mock_controller.list_all_items_fn = list_all_items_fn
+
+        test_controller = InitializerController('fooey', [mock_controller])
+        test_controller.async_handle_updates(Mock())
+
+        # One list at startup, and one after the 410.
+        self.assertEqual(mock_controller.iter_items.call_count, 2)
+        self.assertEqual(len(watch_calls), 2)
+
+    def test_watch_retries_failed_items(self):
+        """Tests that a watched item which fails to save is re-read and handled again."""
+        pod_event = {
+            'type': 'ADDED',
+            'object': {
+                'metadata': {
+                    'name': 'pod',
+                    'namespace': 'default',
+                    'resourceVersion': '42',
+                    'initializers': {
+                        'pending': [{
+                            'name': 'fooey'
+                        }]
+                    }
+                }
+            }
+        }
+        mock_controller = self.mock_resource_controller('ctrl', [])
+        mock_controller.handle_item.side_effect = lambda item: item
+        saved = threading.Event()
+
+        def update_item(item, snapshot):
+            if mock_controller.update_item.call_count == 1:
+                raise Exception('boom')
+            saved.set()
+
+        mock_controller.update_item.side_effect = update_item
+        mock_item = self.mock_item('pod')
+        mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+        mock_controller.read_item.return_value = mock_item
+        watch_calls = []
+
+        def list_all_items_fn(**kwargs):
+            watch_calls.append(kwargs)
+            if len(watch_calls) == 1:
+                kwargs['callback'](self.mock_watch_response([pod_event]))
+            else:
+                saved.wait(5)
+                test_controller.halt_async_handle_updates()
+
+        list_all_items_fn.__doc__ = ':return: V1PodList'
+        mock_controller.list_all_items_fn = list_all_items_fn
+
+        test_controller = InitializerController(
+            'fooey', [mock_controller], watch_retry_delay_seconds=0)
+        error_callback = Mock()
+        test_controller.async_handle_updates(error_callback)
+
+        self.assertTrue(saved.is_set())
+        error_callback.assert_called_once()
+        mock_controller.read_item.assert_called_once_with('pod', 'default')
+        self.assertEqual(mock_controller.update_item.call_count, 2)
+
+    def test_periodic_resync(self):
+        """Tests that controllers are relisted while watching, without resetting the watches."""
+        mock_controller = self.mock_resource_controller('ctrl', [])
+        watch_calls = []
+
+        def list_all_items_fn(**kwargs):
+            watch_calls.append(kwargs)
+            while mock_controller.iter_items.call_count < 3:
+                time.sleep(0.01)
+            test_controller.halt_async_handle_updates()
+
+        list_all_items_fn.__doc__ = ':return: V1PodList'
+        mock_controller.list_all_items_fn = list_all_items_fn
+
+        test_controller = InitializerController(
+            'fooey', [mock_controller], resync_interval_seconds=0.01)
+        error_callback = Mock()
+        test_controller.async_handle_updates(error_callback)
+
+        error_callback.assert_not_called()
+        self.assertEqual(len(watch_calls), 1)
+        self.assertEqual(test_controller.tracking_store.resume_version('ctrl'), '1')
+
+    def test_relist_keeps_items_watched_during_it(self):
+        """Tests that a list only stops tracking items which no watch has seen since it began."""
+        mock_controller = self.mock_resource_controller('ctrl', [])
+
+        def iter_items(resource_version=None, metadata_callback=None):
+            # A watch thread tracks a new item while the list is in progress.
+            test_controller.tracking_store.observe('ctrl', 'watched', 'space', 'new', '2', 'fooey')
+            return iter([])
+
+        mock_controller.iter_items.side_effect = iter_items
+        test_controller = InitializerController('fooey', [mock_controller])
+        test_controller.tracking_store.observe('ctrl', 'stale', 'space', 'old', '1', 'fooey')
+        test_controller.handle_update()
+
+        self.assertNotIn('stale', test_controller.tracking_store)
+        self.assertIn('watched', test_controller.tracking_store)
+
+    def test_watch_prefilters_raw_events(self):
+        """Tests that only watched items pending on our initializer are unmarshalled and handled."""
+        initializer_name = 'fooey'
+
+        def pod_event(name, pending, event_type='ADDED'):
+            return {
+                'type': event_type,
+                'object': {
+                    'metadata': {
+                        'name': name,
+                        'namespace': 'default',
+                        'resourceVersion': '7',
+                        'initializers': {
+                            'pending': [{
+                                'name': pending_name
+                            } for pending_name in pending]
+                        }
+                    }
+                }
+            }
+
+        events = [
+            pod_event('other', ['other', initializer_name]),
+            pod_event('deleted', [initializer_name], event_type='DELETED'),
+            pod_event('handled', [initializer_name]),
+        ]
+        mock_controller = self.mock_resource_controller('ctrl', [])
+        mock_controller.handle_item.side_effect = lambda item: item
+        watch_calls = []
+
+        def list_all_items_fn(**kwargs):
+            watch_calls.append(kwargs)
+            if len(watch_calls) == 1:
+                kwargs['callback'](self.mock_watch_response(events))
+            else:
+                test_controller.halt_async_handle_updates()
+
+        list_all_items_fn.__doc__ = ':return: V1PodList'
+        mock_controller.list_all_items_fn = list_all_items_fn
+        mock_json_loads = Mock(side_effect=json.loads)
+
+        test_controller = InitializerController(
+            initializer_name, [mock_controller], json_loads=mock_json_loads)
+        error_callback = Mock()
+        test_controller.async_handle_updates(error_callback)
+
+        error_callback.assert_not_called()
+        self.assertEqual(mock_json_loads.call_count, 3)
+        mock_controller.handle_item.assert_called_once()
+        handled_item = mock_controller.handle_item.call_args[0][0]
+        self.assertEqual(handled_item.metadata.name, 'handled')
+        mock_controller.update_item.assert_called_once()
+
+    def test_handles_items_on_worker_pool(self):
+        """Tests that items are handled when a worker pool is configured."""
+        initializer_name = 'fooey'
+
+        mock_items = []
+        for i in range(5):
+            mock_item = self.mock_item('pendy{}'.format(i))
+            mock_item.metadata.uid = i
+            mock_item.metadata.initializers = V1Initializers(
+                pending=[V1Initializer(name=initializer_name)])
+            mock_items.append(mock_item)
+        mock_controller = self.mock_resource_controller('ctrl', mock_items)
+        mock_controller.handle_item.side_effect = lambda item: item
+
+        test_controller = InitializerController(
+            initializer_name, [mock_controller], max_workers=2, max_pending_items=2)
+        self.addCleanup(test_controller.close)
+        test_controller.handle_update()
+
+        self.assertEqual(mock_controller.update_item.call_count, 5)
+        for mock_item in mock_items:
+            self.assertEqual(mock_item.metadata.initializers, None)
+
+    def test_worker_pool_errors_are_raised(self):
+        """Tests that errors from pooled items are raised by handle_update."""
+        mock_item = self.mock_item('pendy')
+        mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+        mock_controller = self.mock_resource_controller('ctrl', [mock_item])
+        mock_controller.handle_item.side_effect = ValueError('broken')
+
+        test_controller = InitializerController('fooey', [mock_controller], max_workers=2)
+        self.addCleanup(test_controller.close)
+        with self.assertRaises(ValueError):
+            test_controller.handle_update()
+
+    def test_close_shuts_down_pools(self):
+        """Tests that close stops the worker threads and handler processes."""
+        with patch('ai2.kubernetes.initializer.initializer_controller.ProcessHandlerPool') as pool:
+            test_controller = InitializerController('fooey', [], handler_processes=2)
+        test_controller.close()
+
+        pool.return_value.close.assert_called_once_with()
+        with self.assertRaises(RuntimeError):
+            test_controller._worker_pool.submit('key', print)
+
+    def test_work_queue_collapses_duplicates(self):
+        """Tests that the same item found twice in one pass is only handled once."""
+        mock_item = self.mock_item('pendy')
+        mock_item.metadata.uid = 'uid'
+        mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+        mock_controller = self.mock_resource_controller('ctrl', [mock_item, mock_item])
+        mock_controller.handle_item.side_effect = lambda item: item
+
+        test_controller = InitializerController(
+            'fooey', [mock_controller], work_queue=WorkQueue())
+        test_controller.handle_update()
+
+        mock_controller.update_item.assert_called_once_with(mock_item, None)
+
+    def test_work_queue_retries_failures(self):
+        """Tests that failed items are retried, and raised once out of retries."""
+        mock_item = self.mock_item('pendy')
+        mock_item.metadata.uid = 'uid'
+        mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+        mock_controller = self.mock_resource_controller('ctrl', [])
+        mock_controller.handle_item.side_effect = lambda item: item
+        mock_controller.update_item.side_effect = ValueError('conflict')
+        work_queue = WorkQueue(base_retry_delay_seconds=0.01, max_retries=1)
+        work_queue.add(('ctrl', 'pendy-space', 'pendy', 'uid'), (mock_controller, mock_item))
+
+        test_controller = InitializerController('fooey', [mock_controller], work_queue=work_queue)
+        # The first failure is retried.
+        test_controller.handle_update()
+        self.assertEqual(work_queue.depth, 1)
+        time.sleep(0.02)
+        with self.assertRaises(ValueError):
+            test_controller.handle_update()
+        self.assertEqual(work_queue.depth, 0)
+
+    def test_retries_conflicts(self):
+        """Tests that a conflicting update is re-read, re-handled, and saved again."""
+        initializer_name = 'fooey'
+        mock_item = self.mock_item('pendy')
+        mock_item.metadata.initializers = V1Initializers(
+            pending=[V1Initializer(name=initializer_name)])
+        mock_reread = self.mock_item('pendy')
+        mock_reread.metadata.initializers = V1Initializers(
+            pending=[V1Initializer(name=initializer_name)])
+        mock_controller = self.mock_resource_controller('ctrl', [mock_item])
+        mock_controller.handle_item.side_effect = lambda item: item
+        mock_controller.update_item.side_effect = [ApiException(status=409), None]
+        mock_controller.read_item.return_value = mock_reread
+
+        test_controller = InitializerController(initializer_name, [mock_controller])
+        test_controller.handle_update()
+
+        mock_controller.read_item.assert_called_once_with('pendy', 'pendy-space')
+        mock_controller.update_item.assert_called_with(mock_reread, None)
+        self.assertEqual(mock_reread.metadata.initializers, None)
+
+    def test_conflict_retries_are_bounded(self):
+        """Tests that conflicts are raised once out of retries, and other errors aren't retried."""
+        mock_item = self.mock_item('pendy')
+        mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+        mock_controller = self.mock_resource_controller('ctrl', [mock_item])
+        mock_controller.handle_item.side_effect = lambda item: item
+        mock_controller.update_item.side_effect = ApiException(status=409)
+
+        def read_item(name, namespace):
+            mock_reread = self.mock_item(name)
+            mock_reread.metadata.initializers = V1Initializers(
+                pending=[V1Initializer(name='fooey')])
+            return mock_reread
+
+        mock_controller.read_item.side_effect = read_item
+
+        test_controller = InitializerController(
+            'fooey', [mock_controller], max_conflict_retries=2)
+        with self.assertRaises(ApiException):
+            test_controller.handle_update()
+        self.assertEqual(mock_controller.update_item.call_count, 3)
+
+        mock_controller.update_item.reset_mock()
+        mock_controller.update_item.side_effect = ApiException(status=500)
+        mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+        with self.assertRaises(ApiException):
+            test_controller.handle_update()
+        mock_controller.update_item.assert_called_once()
+
+    def test_conflict_skips_items_no_longer_pending(self):
+        """Tests that a conflicting item is dropped if it's no longer pending on us."""
+        mock_item = self.mock_item('pendy')
+        mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+        mock_reread = self.mock_item('pendy')
+        mock_reread.metadata.initializers = None
+        mock_controller = self.mock_resource_controller('ctrl', [mock_item])
+        mock_controller.handle_item.side_effect = lambda item: item
+        mock_controller.update_item.side_effect = ApiException(status=409)
+        mock_controller.read_item.return_value = mock_reread
+
+        test_controller = InitializerController('fooey', [mock_controller])
+        test_controller.handle_update()
+
+        mock_controller.update_item.assert_called_once()
+
+    def test_handles_items_in_batches(self):
+        """Tests that listed items are passed to handle_items in batches, and results applied."""
+        mock_items = []
+        for i in range(5):
+            mock_item = self.mock_item('pendy{}'.format(i))
+            mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+            mock_items.append(mock_item)
+        mock_controller = self.mock_resource_controller('ctrl', mock_items)
+        rejection = Rejection(message='no', reason='Nope')
+
+        def handle_items(items):
+            return [rejection if item is mock_items[0] else item for item in items]
+
+        mock_controller.handle_items.side_effect = handle_items
+
+        test_controller = InitializerController('fooey', [mock_controller], batch_size=2)
+        test_controller.handle_update()
+
+        self.assertEqual([len(call[0][0]) for call in mock_controller.handle_items.call_args_list],
+                         [2, 2, 1])
+        mock_controller.handle_item.assert_not_called()
+        self.assertEqual(mock_controller.update_item.call_count, 5)
+        self.assertEqual(mock_items[0].metadata.initializers.result, rejection.status)
+        self.assertEqual(mock_items[1].metadata.initializers, None)
+        self.assertEqual(test_controller.metrics.get(RESULTS, 'ctrl', result='rejected'), 1)
+
+    def test_batch_saves_continue_past_errors(self):
+        """Tests that a failed save doesn't stop the rest of a batch from being saved."""
+        mock_items = []
+        for i in range(3):
+            mock_item = self.mock_item('pendy{}'.format(i))
+            mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+            mock_items.append(mock_item)
+        mock_controller = self.mock_resource_controller('ctrl', mock_items)
+        mock_controller.handle_items.side_effect = lambda items: items
+        mock_controller.update_item.side_effect = [ValueError('broken'), None, None]
+
+        test_controller = InitializerController('fooey', [mock_controller], batch_size=5)
+        with self.assertRaises(ValueError):
+            test_controller.handle_update()
+        self.assertEqual(mock_controller.update_item.call_count, 3)
+
+    def test_batch_results_must_match_items(self):
+        """Tests that handle_items returning the wrong number of results saves nothing."""
+        mock_items = []
+        for i in range(2):
+            mock_item = self.mock_item('pendy{}'.format(i))
+            mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+            mock_items.append(mock_item)
+        mock_controller = self.mock_resource_controller('ctrl', mock_items)
+        mock_controller.handle_items.side_effect = lambda items: items[:1]
+
+        test_controller = InitializerController('fooey', [mock_controller], batch_size=5)
+        with self.assertRaisesRegex(InitializerError, 'ctrl returned 1 results for 2 items'):
+            test_controller.handle_update()
+        mock_controller.update_item.assert_not_called()
+
+    def test_batch_size_excludes_workers(self):
+        """Tests that batching can't be combined with a worker pool or work queue."""
+        with self.assertRaises(ValueError):
+            InitializerController('fooey', [], batch_size=2, max_workers=2)
+        with self.assertRaises(ValueError):
+            InitializerController('fooey', [], batch_size=2, work_queue=WorkQueue())
+
+    def test_handles_only_owned_shards(self):
+        """Tests that items outside this replica's shard are skipped."""
+        mock_items = []
+        for i in range(2):
+            mock_item = self.mock_item('pendy{}'.format(i))
+            mock_item.metadata.uid = 'uid{}'.format(i)
+            mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+            mock_items.append(mock_item)
+        mock_controller = self.mock_resource_controller('ctrl', mock_items)
+        mock_controller.handle_item.side_effect = lambda item: item
+        mock_membership = Mock()
+        mock_membership.owns.side_effect = lambda namespace, uid: uid == 'uid1'
+
+        test_controller = InitializerController(
+            'fooey', [mock_controller], shard_membership=mock_membership)
+        test_controller.handle_update()
+
+        mock_controller.update_item.assert_called_once_with(mock_items[1], None)
+        mock_membership.owns.assert_any_call('pendy0-space', 'uid0')
+        self.assertEqual(test_controller.metrics.get(EVENTS_FILTERED, 'ctrl'), 1)
+
+    def test_standby_skips_items(self):
+        """Tests that items are only handled while leading."""
+        mock_item = self.mock_item('pendy')
+        mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+        mock_controller = self.mock_resource_controller('ctrl', [mock_item])
+        mock_controller.handle_item.side_effect = lambda item: item
+        mock_elector = Mock()
+        mock_elector.is_leader = False
+
+        test_controller = InitializerController(
+            'fooey', [mock_controller], leader_elector=mock_elector)
+        test_controller.handle_update()
+        mock_controller.iter_items.assert_called_once()
+        mock_controller.update_item.assert_not_called()
+
+        mock_elector.is_leader = True
+        test_controller.handle_update()
+        mock_controller.update_item.assert_called_once_with(mock_item, None)
+
+    def test_handler_processes_exclude_batching(self):
+        """Tests that process handling can't be combined with batching."""
+        with self.assertRaises(ValueError):
+            InitializerController('fooey', [], batch_size=2, handler_processes=2)
+
+    def test_handler_processes_precede_coordinator_threads(self):
+        """Tests that worker processes can't be forked once a coordinator's thread is running."""
+        leader_elector = Mock()
+        leader_elector.running = True
+        with self.assertRaises(ValueError):
+            InitializerController('fooey', [], handler_processes=2, leader_elector=leader_elector)
+
+    def test_run_forever_polls_adaptively(self):
+        """Tests that run_forever re-polls busy controllers and backs off idle ones."""
+        busy_controller = self.mock_resource_controller('busy', [])
+        idle_controller = self.mock_resource_controller('idle', [])
+        test_controller = InitializerController('fooey', [busy_controller, idle_controller])
+
+        def iter_items(resource_version=None, metadata_callback=None):
+            # Find a new pending item on each of the first few polls, then halt.
+            if busy_controller.iter_items.call_count >= 5:
+                test_controller.halt_run_forever()
+            mock_item = self.mock_item('pendy')
+            mock_item.metadata.initializers = V1Initializers(
+                pending=[V1Initializer(name='fooey')])
+            return iter([mock_item])
+
+        busy_controller.iter_items.side_effect = iter_items
+        busy_controller.handle_item.side_effect = lambda item: item
+        errors = []
+        test_controller.run_forever(
+            errors.append, latency_target_seconds=10, min_interval_seconds=10)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(busy_controller.iter_items.call_count, 5)
+        idle_controller.iter_items.assert_called_once()
+
+    def test_run_forever_backs_off_on_standby(self):
+        """Tests that pending items a standby won't handle don't count as work found."""
+        mock_item = self.mock_item('pendy')
+        mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+        mock_controller = self.mock_resource_controller('ctrl', [mock_item])
+        leader_elector = Mock()
+        leader_elector.is_leader = False
+        test_controller = InitializerController(
+            'fooey', [mock_controller], leader_elector=leader_elector)
+
+        threading.Timer(0.2, test_controller.halt_run_forever).start()
+        test_controller.run_forever(latency_target_seconds=10, min_interval_seconds=10)
+
+        mock_controller.handle_item.assert_not_called()
+        mock_controller.iter_items.assert_called_once()
+
+    def test_run_forever_backs_off_on_queued_failures(self):
+        """Tests that an item waiting out a work queue retry doesn't count as work found."""
+        mock_item = self.mock_item('pendy')
+        mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+        mock_controller = self.mock_resource_controller('ctrl', [mock_item])
+        mock_controller.handle_item.side_effect = Exception('boom')
+        test_controller = InitializerController(
+            'fooey', [mock_controller], work_queue=WorkQueue(base_retry_delay_seconds=10))
+
+        threading.Timer(0.2, test_controller.halt_run_forever).start()
+        test_controller.run_forever(latency_target_seconds=10, min_interval_seconds=10)
+
+        mock_controller.handle_item.assert_called_once()
+        mock_controller.iter_items.assert_called_once()
+
+    def test_handles_earliest_deadline_first(self):
+        """Tests that listed items are handled oldest first, with expired items last or skipped."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        mock_items = []
+        for name, age in (('new', 1), ('expired', 60), ('old', 20), ('unknown', None)):
+            mock_item = self.mock_item(name)
+            mock_item.metadata.creation_timestamp = (
+                now - datetime.timedelta(seconds=age) if age else None)
+            mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+            mock_items.append(mock_item)
+        mock_controller = self.mock_resource_controller('ctrl', mock_items)
+        handled = []
+        mock_controller.handle_item.side_effect = lambda item: handled.append(
+            item.metadata.name) or item
+
+        test_controller = InitializerController(
+            'fooey', [mock_controller], client_deadline_seconds=30)
+        test_controller.handle_update()
+        self.assertEqual(handled, ['old', 'new', 'unknown', 'expired'])
+
+        del handled[:]
+        for mock_item in mock_items:
+            mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+        test_controller = InitializerController(
+            'fooey', [mock_controller], client_deadline_seconds=30, skip_expired_items=True)
+        test_controller.handle_update()
+        self.assertEqual(handled, ['old', 'new', 'unknown'])
+        self.assertEqual(test_controller.metrics.get(ITEMS_EXPIRED, 'ctrl'), 1)
+
+    def test_deadline_order_holds_only_pending_items(self):
+        """Tests that items not pending on us are processed as they're listed, not held."""
+        observed = []
+
+        def iter_items(resource_version=None, metadata_callback=None):
+            for name, pending in (('first', 'fooey'), ('other', 'other'), ('last', 'fooey')):
+                mock_item = self.mock_item(name)
+                mock_item.metadata.creation_timestamp = None
+                mock_item.metadata.initializers = V1Initializers(
+                    pending=[V1Initializer(name=pending)])
+                yield mock_item
+                observed.append(test_controller.metrics.get(EVENTS_FILTERED, 'ctrl'))
+
+        mock_controller = self.mock_resource_controller('ctrl', [])
+        mock_controller.iter_items.side_effect = iter_items
+        mock_controller.handle_item.side_effect = lambda item: item
+        test_controller = InitializerController(
+            'fooey', [mock_controller], client_deadline_seconds=30)
+        test_controller.handle_update()
+
+        # The other item was filtered before the list finished; pending items waited for it.
+        self.assertEqual(observed, [0, 1, 1])
+        self.assertEqual(mock_controller.handle_item.call_count, 2)
+
+    def test_sheds_load_past_backlog_threshold(self):
+        """Tests that a controller with too many pending items rejects them without handling."""
+        mock_items = []
+        for i in range(3):
+            mock_item = self.mock_item('pendy{}'.format(i))
+            mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+            mock_items.append(mock_item)
+        mock_controller = self.mock_resource_controller('ctrl', mock_items)
+        policy = LoadSheddingPolicy(FAIL_CLOSED, enter_backlog=3, rejection_reason='Busy')
+
+        test_controller = InitializerController('fooey', [mock_controller], load_shedding=policy)
+        test_controller.handle_update()
+
+        mock_controller.handle_item.assert_not_called()
+        self.assertEqual(mock_controller.update_item.call_count, 3)
+        self.assertEqual(mock_items[0].metadata.initializers.result.reason, 'Busy')
+        metrics = test_controller.metrics
+        self.assertEqual(metrics.get(ITEMS_SHED, 'ctrl', mode=FAIL_CLOSED), 3)
+        self.assertEqual(metrics.get(LOAD_SHEDDING_ACTIVE, 'ctrl'), 1)
+
+        # An empty pass leaves degraded mode.
+        mock_controller.iter_items.side_effect = lambda **kwargs: iter([])
+        test_controller.handle_update()
+        self.assertEqual(metrics.get(LOAD_SHEDDING_ACTIVE, 'ctrl'), 0)
+        self.assertEqual(metrics.get(LOAD_SHEDDING_TRANSITIONS, 'ctrl', state='exited'), 1)
+
+    def test_watched_load_uses_oldest_pending_age(self):
+        """Tests that a fresh watched item doesn't end degraded mode while older items wait."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        def pod_event(name, age_seconds):
+            created = now - datetime.timedelta(seconds=age_seconds)
+            return {
+                'type': 'ADDED',
+                'object': {
+                    'metadata': {
+                        'name': name,
+                        'namespace': 'default',
+                        'uid': name,
+                        'resourceVersion': '7',
+                        'creationTimestamp': created.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                        'initializers': {
+                            'pending': [{
+                                'name': 'fooey'
+                            }]
+                        }
+                    }
+                }
+            }
+
+        mock_controller = self.mock_resource_controller('ctrl', [])
+
+        def update_item(item, snapshot):
+            if item.metadata.name == 'old':
+                raise Exception('boom')
+
+        mock_controller.update_item.side_effect = update_item
+        watch_calls = []
+
+        def list_all_items_fn(**kwargs):
+            watch_calls.append(kwargs)
+            if len(watch_calls) == 1:
+                kwargs['callback'](
+                    self.mock_watch_response([pod_event('old', 120), pod_event('new', 0)]))
+            else:
+                test_controller.halt_async_handle_updates()
+
+        list_all_items_fn.__doc__ = ':return: V1PodList'
+        mock_controller.list_all_items_fn = list_all_items_fn
+        policy = LoadSheddingPolicy(enter_age_seconds=60, exit_age_seconds=30)
+
+        test_controller = InitializerController(
+            'fooey', [mock_controller], load_shedding=policy, watch_retry_delay_seconds=60)
+        test_controller.async_handle_updates(Mock())
+
+        # The old item failed to save, so it's still waiting, and keeps the controller degraded.
+        metrics = test_controller.metrics
+        self.assertEqual(metrics.get(LOAD_SHEDDING_ACTIVE, 'ctrl'), 1)
+        self.assertEqual(metrics.get(LOAD_SHEDDING_TRANSITIONS, 'ctrl', state='exited'), 0)
+        self.assertGreaterEqual(
+            test_controller.tracking_store.oldest_age_seconds('ctrl', 'fooey'), 119)
+
+    def test_speculates_on_items_behind_other_initializers(self):
+        """Tests that items are evaluated early, and only updated once their turn comes."""
+
+        def pod(pending, resource_version):
+            return V1Pod(
+                kind='Pod',
+                metadata=V1ObjectMeta(
+                    name='pendy',
+                    namespace='space',
+                    uid='pendy-uid',
+                    resource_version=resource_version,
+                    initializers=V1Initializers(
+                        pending=[V1Initializer(name=name) for name in pending])))
+
+        def handle_item(item):
+            item.metadata.labels = {'checked': 'true'}
+            return item
+
+        mock_controller = self.mock_resource_controller('ctrl', [pod(['other', 'fooey'], '1')])
+        mock_controller.handle_item.side_effect = handle_item
+        test_controller = InitializerController(
+            'fooey', [mock_controller], speculation_cache=SpeculationCache())
+        test_controller.handle_update()
+        mock_controller.handle_item.assert_called_once()
+        mock_controller.update_item.assert_not_called()
+
+        mock_controller.iter_items.side_effect = lambda **kwargs: iter([pod(['fooey'], '2')])
+        test_controller.handle_update()
+        mock_controller.handle_item.assert_called_once()
+        updated_item = mock_controller.update_item.call_args[0][0]
+        self.assertEqual(updated_item.metadata.labels, {'checked': 'true'})
+        self.assertEqual(updated_item.metadata.resource_version, '2')
+        self.assertEqual(updated_item.metadata.initializers, None)
+
+    def test_multiplexed_watches(self):
+        """Tests that watches read by a WatchMultiplexer are handled, resuming after each slice."""
+        pod_event = {
+            'type': 'ADDED',
+            'object': {
+                'metadata': {
+                    'name': 'pod',
+                    'namespace': 'default',
+                    'resourceVersion': '42',
+                    'initializers': {
+                        'pending': [{
+                            'name': 'fooey'
+                        }]
+                    }
+                }
+            }
+        }
+        watch_calls = []
+
+        def list_all_items_fn(**kwargs):
+            watch_calls.append(kwargs)
+            return self.mock_watch_response([pod_event] if len(watch_calls) == 1 else [])
+
+        list_all_items_fn.__doc__ = ':return: V1PodList'
+        controllers = [self.mock_resource_controller(name, []) for name in ('a', 'b')]
+        for mock_controller in controllers:
+            mock_controller.list_all_items_fn = list_all_items_fn
+        handled = threading.Event()
+        controllers[0].handle_item.side_effect = lambda item: handled.set() or item
+
+        test_controller = InitializerController(
+            'fooey', controllers, watch_threads=1, watch_slice_seconds=5)
+        error_callback = Mock()
+        test_controller.async_handle_updates(error_callback)
+        self.assertTrue(handled.wait(5))
+        while len(watch_calls) < 3:
+            time.sleep(0.01)
+        test_controller.halt_async_handle_updates()
+
+        error_callback.assert_not_called()
+        self.assertNotIn('callback', watch_calls[0])
+        self.assertEqual(watch_calls[0]['timeout_seconds'], 5)
+        # Controller a's watch resumes from its watched event once its turn comes again.
+        self.assertEqual(watch_calls[2]['resource_version'], '42')
+
+    def test_multiplexed_watch_relists_on_dispatch_thread(self):
+        """Tests that an expired multiplexed watch is relisted off its I/O thread, then reopened."""
+        gone_event = {'type': 'ERROR', 'object': {'kind': 'Status', 'code': 410}}
+        mock_controller = self.mock_resource_controller('ctrl', [])
+        list_threads = []
+        iter_items = mock_controller.iter_items.side_effect
+
+        def record_list(**kwargs):
+            list_threads.append(threading.current_thread())
+            return iter_items(**kwargs)
+
+        mock_controller.iter_items.side_effect = record_list
+        watches = []
+        reopened = threading.Event()
+
+        def list_all_items_fn(**kwargs):
+            watches.append((threading.current_thread(), len(list_threads)))
+            if len(watches) == 1:
+                return self.mock_watch_response([gone_event])
+            reopened.set()
+            return self.mock_watch_response([])
+
+        list_all_items_fn.__doc__ = ':return: V1PodList'
+        mock_controller.list_all_items_fn = list_all_items_fn
+
+        test_controller = InitializerController('fooey', [mock_controller], watch_threads=1)
+        error_callback = Mock()
+        test_controller.async_handle_updates(error_callback)
+        self.assertTrue(reopened.wait(5))
+        test_controller.halt_async_handle_updates()
+
+        error_callback.assert_not_called()
+        # The watch was reopened only after the relist, which ran on another thread.
+        self.assertEqual(len(list_threads), 2)
+        self.assertEqual(watches[1][1], 2)
+        self.assertNotEqual(list_threads[1], watches[0][0])
+
+    def test_tracks_pending_items(self):
+        """Tests that repeated watch events are dropped, and handled items stop being tracked."""
+        pod_event = {
+            'type': 'ADDED',
+            'object': {
+                'metadata': {
+                    'name': 'pod',
+                    'namespace': 'default',
+                    'uid': 'pod-uid',
+                    'resourceVersion': '42',
+                    'initializers': {
+                        'pending': [{
+                            'name': 'fooey'
+                        }]
+                    }
+                }
+            }
+        }
+        mock_controller = self.mock_resource_controller('ctrl', [])
+        mock_controller.handle_item.side_effect = lambda item: item
+        mock_controller.update_item.side_effect = Exception('boom')
+        watch_calls = []
+
+        def list_all_items_fn(**kwargs):
+            watch_calls.append(kwargs)
+            if len(watch_calls) == 1:
+                kwargs['callback'](self.mock_watch_response([pod_event, pod_event]))
+            else:
+                test_controller.halt_async_handle_updates()
+
+        list_all_items_fn.__doc__ = ':return: V1PodList'
+        mock_controller.list_all_items_fn = list_all_items_fn
+
+        test_controller = InitializerController('fooey', [mock_controller])
+        test_controller.async_handle_updates(Mock())
+
+        # The failed item is still tracked, and its repeated event was dropped.
+        mock_controller.handle_item.assert_called_once()
+        self.assertEqual(test_controller.tracking_store.count('ctrl', 'fooey'), 1)
+
+        # A relist retries it; once saved, it's no longer tracked.
+        mock_item = self.mock_item('pod')
+        mock_item.metadata.uid = 'pod-uid'
+        mock_item.metadata.initializers = V1Initializers(pending=[V1Initializer(name='fooey')])
+        mock_controller.iter_items.side_effect = lambda **kwargs: iter([mock_item])
+        mock_controller.update_item.side_effect = None
+        test_controller.handle_update()
+        self.assertNotIn('pod-uid', test_controller.tracking_store)
@@ -0,0 +1,44 @@
+import threading
+import unittest
+from unittest.mock import Mock
+
+from ai2.kubernetes.initializer.item_batcher import ItemBatcher
+
+
+class TestItemBatcher(unittest.TestCase):
+    def test_flushes_full_batches(self):
+        """Tests that a batch is processed as soon as it's full."""
+        process_batch = Mock()
+        batcher = ItemBatcher(2, None, process_batch, None)
+        batcher.add(1)
+        process_batch.assert_not_called()
+        batcher.add(2)
+        batcher.add(3)
+        process_batch.assert_called_once_with([1, 2])
+        batcher.flush()
+        process_batch.assert_called_with([3])
+
+    def test_flushes_after_window(self):
+        """Tests that a partial batch is processed once its window has passed."""
+        flushed = threading.Event()
+        batches = []
+
+        def process_batch(items):
+            batches.append(items)
+            flushed.set()
+
+        batcher = ItemBatcher(10, 0.01, process_batch, Mock())
+        batcher.add(1)
+        self.assertTrue(flushed.wait(5))
+        self.assertEqual(batches, [[1]])
+
+    def test_reports_timed_flush_errors(self):
+        """Tests that errors from timed flushes go to the error callback."""
+        error = ValueError('broken')
+        called = threading.Event()
+        error_callback = Mock(side_effect=lambda e: called.set())
+
+        batcher = ItemBatcher(10, 0.01, Mock(side_effect=error), error_callback)
+        batcher.add(1)
+        self.assertTrue(called.wait(5))
+        error_callback.assert_called_once_with(error)
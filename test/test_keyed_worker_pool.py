@@ -0,0 +1,50 @@
+import threading
+import unittest
+
+from ai2.kubernetes.initializer.keyed_worker_pool import KeyedWorkerPool
+
+
+class TestKeyedWorkerPool(unittest.TestCase):
+    def test_same_key_runs_in_order(self):
+        """Tests that work with the same key runs serially, in submission order."""
+        pool = KeyedWorkerPool(max_workers=4)
+        results = []
+        release = threading.Event()
+
+        def first():
+            release.wait(5)
+            results.append(1)
+
+        futures = [pool.submit('key', first), pool.submit('key', results.append, 2)]
+        release.set()
+        for future in futures:
+            future.result(5)
+        pool.shutdown()
+
+        self.assertEqual(results, [1, 2])
+        self.assertEqual(pool.pending_count, 0)
+
+    def test_different_keys_run_concurrently(self):
+        """Tests that work with different keys doesn't block on each other."""
+        pool = KeyedWorkerPool(max_workers=2)
+        release = threading.Event()
+
+        blocked = pool.submit('a', release.wait, 5)
+        # This would deadlock if 'b' waited on 'a'.
+        pool.submit('b', release.set).result(5)
+        self.assertTrue(blocked.result(5))
+        pool.shutdown()
+
+    def test_errors_are_returned(self):
+        """Tests that errors are set on the returned future."""
+        pool = KeyedWorkerPool(max_workers=1, max_pending=1)
+
+        def fail():
+            raise ValueError('failed')
+
+        future = pool.submit('key', fail)
+        with self.assertRaises(ValueError):
+            future.result(5)
+        # The pending slot should have been released.
+        self.assertEqual(pool.submit('key', lambda: 3).result(5), 3)
+        pool.shutdown()
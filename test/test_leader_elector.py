@@ -0,0 +1,113 @@
+import json
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from kubernetes.client.models.v1_config_map import V1ConfigMap
+from kubernetes.client.models.v1_object_meta import V1ObjectMeta
+from kubernetes.client.rest import ApiException
+
+from ai2.kubernetes.initializer.leader_elector import LEADER_ANNOTATION, LeaderElector
+
+
+class TestLeaderElector(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('kubernetes.client.CoreV1Api')
+        self.mock_core_client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.stored = None
+
+        def read(name, namespace, **kwargs):
+            if self.stored is None:
+                raise ApiException(status=404)
+            return V1ConfigMap(
+                metadata=V1ObjectMeta(
+                    name=name, annotations=dict(self.stored.metadata.annotations)))
+
+        def save(*args, **kwargs):
+            self.stored = args[-1]
+            return self.stored
+
+        self.mock_core_client.read_namespaced_config_map.side_effect = read
+        self.mock_core_client.create_namespaced_config_map.side_effect = save
+        self.mock_core_client.replace_namespaced_config_map.side_effect = save
+
+    def elector(self, identity, lease_seconds=15):
+        return LeaderElector(
+            Mock(), 'leader', 'space', identity=identity, lease_seconds=lease_seconds)
+
+    def record(self):
+        return json.loads(self.stored.metadata.annotations[LEADER_ANNOTATION])
+
+    def test_single_leader(self):
+        """Tests that only one replica acquires the lease, and renewals keep it."""
+        leader = self.elector('a')
+        standby = self.elector('b')
+        listener = Mock()
+        leader.add_listener(listener)
+
+        self.assertTrue(leader.try_acquire_or_renew())
+        self.assertFalse(standby.try_acquire_or_renew())
+        self.assertTrue(leader.try_acquire_or_renew())
+        self.assertTrue(leader.is_leader)
+        self.assertFalse(standby.is_leader)
+        listener.assert_called_once_with(True)
+        self.assertEqual(self.record()['holderIdentity'], 'a')
+        self.assertEqual(self.record()['leaderTransitions'], 1)
+
+    def test_standby_takes_over_on_release(self):
+        """Tests that a stopped leader releases the lease to a standby immediately."""
+        leader = self.elector('a')
+        standby = self.elector('b')
+        leader.try_acquire_or_renew()
+        self.assertFalse(standby.try_acquire_or_renew())
+
+        leader.stop()
+        self.assertFalse(leader.is_leader)
+        self.assertTrue(standby.try_acquire_or_renew())
+        self.assertEqual(self.record()['holderIdentity'], 'b')
+        self.assertEqual(self.record()['leaderTransitions'], 2)
+
+    def test_standby_takes_over_on_expiry(self):
+        """Tests that a lease which isn't renewed expires."""
+        leader = self.elector('a', lease_seconds=0.05)
+        standby = self.elector('b')
+        leader.try_acquire_or_renew()
+        self.assertFalse(standby.try_acquire_or_renew())
+        time.sleep(0.1)
+        self.assertTrue(standby.try_acquire_or_renew())
+
+    def test_conflicts_lose_the_race(self):
+        """Tests that a conflicting update means another replica won."""
+        elector = self.elector('a')
+        self.mock_core_client.create_namespaced_config_map.side_effect = ApiException(status=409)
+        self.assertFalse(elector.try_acquire_or_renew())
+
+    def test_running(self):
+        """Tests that running reports the background thread."""
+        elector = self.elector('a')
+        self.assertFalse(elector.running)
+        elector.start(Mock())
+        self.addCleanup(elector.stop)
+        self.assertTrue(elector.running)
+
+    def test_lease_expires_without_renewal(self):
+        """Tests that a leader stops reporting leadership once its lease lapses unrenewed."""
+        elector = self.elector('a', lease_seconds=0.05)
+        self.assertTrue(elector.try_acquire_or_renew())
+        self.assertTrue(elector.is_leader)
+        time.sleep(0.1)
+        self.assertFalse(elector.is_leader)
+
+    def test_request_timeout(self):
+        """Tests that every API call times out before the lease does."""
+        elector = self.elector('a', lease_seconds=10)
+        elector.try_acquire_or_renew()
+        elector.try_acquire_or_renew()
+        elector.stop()
+        for method in ('read_namespaced_config_map', 'create_namespaced_config_map',
+                       'replace_namespaced_config_map'):
+            for call in getattr(self.mock_core_client, method).call_args_list:
+                self.assertEqual(call[1]['_request_timeout'], 5)
+        with self.assertRaises(ValueError):
+            LeaderElector(Mock(), 'leader', 'space', lease_seconds=1, request_timeout_seconds=1)
@@ -0,0 +1,60 @@
+import unittest
+from unittest.mock import Mock
+
+from ai2.kubernetes.initializer.load_shedding import (FAIL_CLOSED, FAIL_OPEN, LoadShedder,
+                                                      LoadSheddingPolicy)
+from ai2.kubernetes.initializer.metrics import (ITEMS_SHED, LOAD_SHEDDING_ACTIVE,
+                                                LOAD_SHEDDING_TRANSITIONS, Metrics)
+from ai2.kubernetes.initializer.rejection import Rejection
+
+
+class TestLoadSheddingPolicy(unittest.TestCase):
+    def test_hysteresis(self):
+        """Tests that degraded mode is entered and left at different thresholds."""
+        policy = LoadSheddingPolicy(enter_backlog=10, enter_age_seconds=20)
+        self.assertEqual(policy.update('ctrl', 9, 19), None)
+        self.assertFalse(policy.is_degraded('ctrl'))
+        self.assertTrue(policy.update('ctrl', 10, 0))
+        self.assertTrue(policy.is_degraded('ctrl'))
+        self.assertFalse(policy.is_degraded('other'))
+        # Below the entry thresholds, but not yet at the exit thresholds.
+        self.assertEqual(policy.update('ctrl', 6, 5), None)
+        self.assertEqual(policy.update('ctrl', 5, 11), None)
+        self.assertFalse(policy.update('ctrl', 5, 10))
+        self.assertFalse(policy.is_degraded('ctrl'))
+        self.assertTrue(policy.update('ctrl', 0, 20))
+
+    def test_degraded_results(self):
+        """Tests that fail-open accepts items unchanged, and fail-closed rejects them."""
+        item = Mock()
+        self.assertEqual(LoadSheddingPolicy(FAIL_OPEN, enter_backlog=1).degraded_result(item), item)
+        result = LoadSheddingPolicy(
+            FAIL_CLOSED, enter_backlog=1, rejection_reason='Busy').degraded_result(item)
+        self.assertIsInstance(result, Rejection)
+        self.assertEqual(result.status.reason, 'Busy')
+
+    def test_validates_arguments(self):
+        """Tests that a mode and threshold are required."""
+        with self.assertRaises(ValueError):
+            LoadSheddingPolicy('maybe', enter_backlog=1)
+        with self.assertRaises(ValueError):
+            LoadSheddingPolicy()
+
+
+class TestLoadShedder(unittest.TestCase):
+    def test_applies_policies_by_controller(self):
+        """Tests that per-controller policies are applied, and transitions and sheds recorded."""
+        metrics = Metrics()
+        shedder = LoadShedder({'ctrl': LoadSheddingPolicy(FAIL_OPEN, enter_backlog=2)}, metrics)
+        item = Mock()
+
+        shedder.update('ctrl', 2, None)
+        shedder.update('other', 100, None)
+
+        self.assertTrue(shedder.is_degraded('ctrl'))
+        self.assertFalse(shedder.is_degraded('other'))
+        self.assertEqual(shedder.shed_result('ctrl', item), item)
+        self.assertIsNone(shedder.shed_result('other', item))
+        self.assertEqual(metrics.get(LOAD_SHEDDING_ACTIVE, 'ctrl'), 1)
+        self.assertEqual(metrics.get(LOAD_SHEDDING_TRANSITIONS, 'ctrl', state='entered'), 1)
+        self.assertEqual(metrics.get(ITEMS_SHED, 'ctrl', mode=FAIL_OPEN), 1)
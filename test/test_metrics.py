@@ -0,0 +1,59 @@
+import unittest
+import urllib.request
+
+from ai2.kubernetes.initializer.metrics import (EVENTS_RECEIVED, HANDLE_SECONDS,
+                                                LOAD_SHEDDING_ACTIVE, RESULTS, Metrics)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_counters(self):
+        """Tests that counters are incremented per controller and label."""
+        metrics = Metrics()
+        metrics.increment(EVENTS_RECEIVED, 'pod')
+        metrics.increment(EVENTS_RECEIVED, 'pod', amount=2)
+        metrics.increment(RESULTS, 'pod', result='accepted')
+
+        self.assertEqual(metrics.get(EVENTS_RECEIVED, 'pod'), 3)
+        self.assertEqual(metrics.get(EVENTS_RECEIVED, 'job'), 0)
+        self.assertEqual(metrics.get(RESULTS, 'pod', result='accepted'), 1)
+        self.assertEqual(metrics.get(RESULTS, 'pod', result='rejected'), 0)
+
+    def test_gauges(self):
+        """Tests that gauges hold the last value set, and are rendered."""
+        metrics = Metrics()
+        metrics.set_gauge(LOAD_SHEDDING_ACTIVE, 'pod', 1)
+        metrics.set_gauge(LOAD_SHEDDING_ACTIVE, 'pod', 0)
+
+        self.assertEqual(metrics.get(LOAD_SHEDDING_ACTIVE, 'pod'), 0)
+        rendered = metrics.render()
+        self.assertIn('# TYPE initializer_load_shedding_active gauge\n', rendered)
+        self.assertIn('initializer_load_shedding_active{controller="pod"} 0\n', rendered)
+
+    def test_render(self):
+        """Tests that metrics are rendered in the Prometheus text format."""
+        metrics = Metrics(buckets=(0.1, 1))
+        metrics.increment(EVENTS_RECEIVED, 'pod')
+        metrics.observe(HANDLE_SECONDS, 'pod', 0.5)
+
+        rendered = metrics.render()
+        self.assertIn('# TYPE initializer_events_received_total counter\n', rendered)
+        self.assertIn('initializer_events_received_total{controller="pod"} 1\n', rendered)
+        self.assertIn('# TYPE initializer_handle_seconds histogram\n', rendered)
+        self.assertIn('initializer_handle_seconds_bucket{controller="pod",le="0.1"} 0\n', rendered)
+        self.assertIn('initializer_handle_seconds_bucket{controller="pod",le="1.0"} 1\n', rendered)
+        self.assertIn('initializer_handle_seconds_bucket{controller="pod",le="+Inf"} 1\n', rendered)
+        self.assertIn('initializer_handle_seconds_sum{controller="pod"} 0.5\n', rendered)
+        self.assertIn('initializer_handle_seconds_count{controller="pod"} 1\n', rendered)
+
+    def test_http_server(self):
+        """Tests that the HTTP server serves the rendered metrics."""
+        metrics = Metrics()
+        metrics.increment(EVENTS_RECEIVED, 'pod')
+        server = metrics.start_http_server(0, address='127.0.0.1')
+        try:
+            url = 'http://127.0.0.1:{}/metrics'.format(server.server_address[1])
+            with urllib.request.urlopen(url, timeout=5) as response:
+                self.assertEqual(response.read().decode('utf8'), metrics.render())
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,100 @@
+import unittest
+from unittest.mock import Mock, patch
+
+from kubernetes.client.rest import ApiException
+
+from ai2.kubernetes.initializer.owner_resolver import OwnerResolver, ResourceCache
+
+
+def mock_object(name, uid, owner=None, resource_version='1'):
+    """Returns a mock object in namespace 'space', controlled by the given owner mock."""
+    item = Mock()
+    item.metadata.name = name
+    item.metadata.namespace = 'space'
+    item.metadata.uid = uid
+    item.metadata.resource_version = resource_version
+    item.metadata.owner_references = []
+    if owner:
+        reference = Mock(controller=True, uid=owner.metadata.uid)
+        reference.name = owner.metadata.name
+        reference.kind = owner.kind
+        item.metadata.owner_references = [reference]
+    return item
+
+
+def mock_handler(items):
+    """Returns a mock ResourceHandler listing the given items at resourceVersion '10'."""
+    handler = Mock()
+    handler.selector_kwargs = {}
+
+    def iter_items(resource_version=None, metadata_callback=None):
+        metadata_callback(Mock(resource_version='10'))
+        return iter(items)
+
+    handler.iter_items.side_effect = iter_items
+    handler.read_item.side_effect = ApiException(status=404)
+    return handler
+
+
+class TestOwnerResolver(unittest.TestCase):
+    def setUp(self):
+        self.deployment = mock_object('deployment', 'd-uid')
+        self.deployment.kind = 'Deployment'
+        self.replica_set = mock_object('rs', 'rs-uid', self.deployment)
+        self.replica_set.kind = 'ReplicaSet'
+        self.pod = mock_object('pod', 'pod-uid', self.replica_set)
+
+    def test_resolves_owner_chain(self):
+        """Tests that owners are walked through the caches."""
+        rs_cache = ResourceCache(mock_handler([self.replica_set]))
+        deployment_cache = ResourceCache(mock_handler([self.deployment]))
+        rs_cache._relist()
+        deployment_cache._relist()
+        resolver = OwnerResolver({'ReplicaSet': rs_cache, 'Deployment': deployment_cache})
+
+        self.assertTrue(resolver.wait_for_sync(0))
+        self.assertEqual(resolver.owner(self.pod), self.replica_set)
+        self.assertEqual(resolver.owners(self.pod), [self.replica_set, self.deployment])
+        self.assertEqual(resolver.owners(self.deployment), [])
+
+    def test_misses_read_through(self):
+        """Tests that uncached owners are read once, and mismatched uids aren't returned."""
+        handler = mock_handler([])
+        handler.read_item.side_effect = None
+        handler.read_item.return_value = self.replica_set
+        resolver = OwnerResolver({'ReplicaSet': ResourceCache(handler)})
+
+        self.assertFalse(resolver.wait_for_sync(0))
+        self.assertEqual(resolver.owner(self.pod), self.replica_set)
+        self.assertEqual(resolver.owner(self.pod), self.replica_set)
+        handler.read_item.assert_called_once_with('rs', 'space')
+
+        self.replica_set.metadata.uid = 'recreated-uid'
+        self.assertEqual(resolver.owner(self.pod), None)
+
+    def test_uncached_kinds_are_not_resolved(self):
+        """Tests that owners of kinds without a cache resolve to None."""
+        resolver = OwnerResolver({})
+        self.assertEqual(resolver.owner(self.pod), None)
+
+    @patch('kubernetes.watch.Watch')
+    def test_cache_applies_watch_events(self, mock_watch_class):
+        """Tests that watch events update the cache, and 410 Gone triggers a relist."""
+        updated_rs = mock_object('rs', 'rs-uid', resource_version='11')
+        mock_watch_class.return_value.stream.return_value = [
+            {'type': 'MODIFIED', 'object': updated_rs, 'raw_object': {}},
+            {'type': 'DELETED', 'object': self.deployment, 'raw_object': {}},
+            {'type': 'ERROR', 'object': None, 'raw_object': {'code': 410}},
+        ]
+        handler = mock_handler([self.replica_set, self.deployment])
+        cache = ResourceCache(handler)
+        cache._relist()
+        self.assertEqual(len(cache), 2)
+
+        cache._watch_once()
+
+        stream_kwargs = mock_watch_class.return_value.stream.call_args[1]
+        self.assertEqual(stream_kwargs['resource_version'], '10')
+        self.assertEqual(cache.get('space', 'rs'), updated_rs)
+        self.assertEqual(cache.get('space', 'deployment'), None)
+        self.assertEqual(cache._resource_version, None)
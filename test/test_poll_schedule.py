@@ -0,0 +1,28 @@
+import unittest
+
+from ai2.kubernetes.initializer.poll_schedule import PollSchedule
+
+
+class TestPollSchedule(unittest.TestCase):
+    def test_backs_off_when_idle(self):
+        """Tests that idle polls back off exponentially, up to the latency target."""
+        schedule = PollSchedule(
+            latency_target_seconds=1, min_interval_seconds=0.2, jitter=0,
+            random_function=lambda: 0.5)
+        intervals = [schedule.next_interval(False) for _ in range(4)]
+        self.assertEqual(intervals, [0.2, 0.4, 0.8, 1])
+
+    def test_polls_immediately_after_work(self):
+        """Tests that a poll finding work resets the backoff."""
+        schedule = PollSchedule(min_interval_seconds=0.2, jitter=0)
+        schedule.next_interval(False)
+        schedule.next_interval(False)
+        self.assertEqual(schedule.next_interval(True), 0)
+        self.assertEqual(schedule.next_interval(False), 0.2)
+
+    def test_jitter_shortens_intervals(self):
+        """Tests that jitter never lengthens an interval past the target."""
+        schedule = PollSchedule(
+            latency_target_seconds=1, min_interval_seconds=1, jitter=0.5,
+            random_function=lambda: 0.5)
+        self.assertEqual(schedule.next_interval(False), 0.75)
@@ -0,0 +1,37 @@
+import os
+import unittest
+from unittest.mock import Mock
+
+from kubernetes.client.models.v1_object_meta import V1ObjectMeta
+from kubernetes.client.models.v1_pod import V1Pod
+
+from ai2.kubernetes.initializer.process_handler_pool import ProcessHandlerPool
+from ai2.kubernetes.initializer.rejection import Rejection
+from ai2.kubernetes.initializer.simple_resource_controller import SimpleResourceController
+
+
+class TestProcessHandlerPool(unittest.TestCase):
+    def test_handles_items_in_workers(self):
+        """Tests that handle_item runs in a worker, returning its changes or Rejection."""
+
+        def handle_item(item):
+            if item.metadata.name == 'bad':
+                raise Rejection(message='bad pod', reason='Bad', code=403)
+            item.metadata.labels = {'pid': str(os.getpid())}
+            return item
+
+        mock_handler = Mock()
+        mock_handler.name = 'pod'
+        controller = SimpleResourceController(mock_handler, handle_item)
+        pool = ProcessHandlerPool([controller], 1)
+        self.addCleanup(pool.close)
+
+        result = pool.handle_item(controller, V1Pod(metadata=V1ObjectMeta(name='good')))
+        self.assertIsInstance(result, V1Pod)
+        self.assertEqual(result.metadata.name, 'good')
+        self.assertNotEqual(result.metadata.labels['pid'], str(os.getpid()))
+
+        with self.assertRaises(Rejection) as context:
+            pool.handle_item(controller, V1Pod(metadata=V1ObjectMeta(name='bad')))
+        self.assertEqual(context.exception.status.reason, 'Bad')
+        self.assertEqual(context.exception.status.code, 403)
@@ -18,7 +18,7 @@ class TestResourceController(unittest.TestCase):
         self.assertEqual(test_controller.list_all_items(), self.mock_handler.list_all_items())
         fake_item = {'a': 1}
         test_controller.update_item(fake_item)
-        self.mock_handler.update_item.assert_called_with(fake_item)
+        self.mock_handler.update_item.assert_called_with(fake_item, None)
 
     def test_rejects_all(self):
         """Test that a controller throws an appropriate Rejection by default."""
@@ -30,3 +30,13 @@ class TestResourceController(unittest.TestCase):
             self.fail('Expected a Rejection to be thrown')
         except Rejection as rejection:
             self.assertEqual(rejection.status.reason, 'RejectAll')
+
+    def test_handle_items_defaults_to_handle_item(self):
+        """Test that handle_items calls handle_item per item, returning any Rejections."""
+        test_controller = ResourceController(self.mock_handler)
+        mock_item = Mock()
+        mock_item.metadata.name = 'A name'
+        results = test_controller.handle_items([mock_item, mock_item])
+        self.assertEqual(len(results), 2)
+        for result in results:
+            self.assertIsInstance(result, Rejection)
@@ -1,6 +1,9 @@
 import unittest
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
+import kubernetes
+
+from ai2.kubernetes.initializer.exceptions import InitializerError
 from ai2.kubernetes.initializer.resource_handler import ResourceHandler
 
 
@@ -33,6 +36,11 @@ class TestResourceHandler(unittest.TestCase):
         handler = ResourceHandler.deployment_handler(self.mock_client)
         self.assertEqual(handler.name, "deployment")
 
+    def test_replica_set_handler(self):
+        """Test that a replica set handler can be created."""
+        handler = ResourceHandler.replica_set_handler(self.mock_client)
+        self.assertEqual(handler.name, "replicaset")
+
     def test_daemon_set_handler(self):
         """Test that a daemon set handler can be created."""
         handler = ResourceHandler.daemon_set_handler(self.mock_client)
@@ -42,3 +50,56 @@ class TestResourceHandler(unittest.TestCase):
         """Test that a job job handler can be created."""
         handler = ResourceHandler.cron_job_handler(self.mock_client)
         self.assertEqual(handler.name, "cronjob")
+
+    def test_namespaced_handlers(self):
+        """Test that namespaced handlers list only their namespace, keeping the list docstring."""
+        api_client = kubernetes.client.ApiClient()
+        with patch.object(kubernetes.client.CoreV1Api, 'list_namespaced_pod') as mock_list:
+            mock_list.__doc__ = kubernetes.client.CoreV1Api.list_pod_for_all_namespaces.__doc__
+            handlers = ResourceHandler.namespaced_handlers(ResourceHandler.pod_handler, api_client,
+                                                           {'b', 'a'})
+            self.assertEqual([handler.name for handler in handlers], ['pod/a', 'pod/b'])
+            handlers[1].list_all_items()
+            mock_list.assert_called_once_with('b', include_uninitialized='true')
+            self.assertEqual(
+                kubernetes.watch.Watch().get_return_type(handlers[1].list_all_items_fn), 'V1Pod')
+
+    def test_iter_items_single_page(self):
+        """Test that iter_items makes a single list call when no page size is set."""
+        mock_list = Mock()
+        mock_list.return_value.items = [1, 2]
+        handler = ResourceHandler('thing', mock_list, Mock(), label_selector='a=b')
+        self.assertEqual(list(handler.iter_items()), [1, 2])
+        mock_list.assert_called_once_with(include_uninitialized="true", label_selector='a=b')
+
+    def test_iter_items_pages(self):
+        """Test that iter_items follows continue tokens when a page size is set."""
+        first_page = Mock()
+        first_page.items = [1, 2]
+        first_page.metadata._continue = 'next'
+        second_page = Mock()
+        second_page.items = [3]
+        second_page.metadata._continue = None
+        mock_list = Mock(side_effect=[first_page, second_page])
+        handler = ResourceHandler('thing', mock_list, Mock(), page_size=2, field_selector='x=y')
+
+        self.assertEqual(list(handler.iter_items(resource_version='0')), [1, 2, 3])
+        mock_list.assert_any_call(
+            include_uninitialized="true", field_selector='x=y', limit=2, resource_version='0')
+        mock_list.assert_called_with(
+            include_uninitialized="true", field_selector='x=y', limit=2, _continue='next')
+
+    def test_factory_passes_options(self):
+        """Test that factory methods pass through handler options."""
+        handler = ResourceHandler.pod_handler(self.mock_client, label_selector='a=b')
+        self.assertEqual(handler.selector_kwargs, {'label_selector': 'a=b'})
+
+    def test_read_item(self):
+        """Test that read_item delegates, and requires a read function."""
+        mock_read = Mock()
+        handler = ResourceHandler('thing', Mock(), Mock(), read_item=mock_read)
+        handler.read_item('name', 'space')
+        mock_read.assert_called_once_with(name='name', namespace='space')
+
+        with self.assertRaises(InitializerError):
+            ResourceHandler('thing', Mock(), Mock()).read_item('name', 'space')
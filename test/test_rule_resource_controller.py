@@ -0,0 +1,145 @@
+import json
+import unittest
+from unittest.mock import Mock
+
+from kubernetes.client.models.extensions_v1beta1_deployment import ExtensionsV1beta1Deployment
+from kubernetes.client.models.v1_config_map import V1ConfigMap
+from kubernetes.client.models.v1_deployment import V1Deployment
+from kubernetes.client.models.v1_deployment_spec import V1DeploymentSpec
+from kubernetes.client.models.v1_label_selector import V1LabelSelector
+from kubernetes.client.models.v1_object_meta import V1ObjectMeta
+from kubernetes.client.models.v1_pod import V1Pod
+from kubernetes.client.models.v1_pod_template_spec import V1PodTemplateSpec
+from kubernetes.client.models.v1beta1_cron_job import V1beta1CronJob
+
+from ai2.kubernetes.initializer.rejection import Rejection
+from ai2.kubernetes.initializer.rule_resource_controller import RuleResourceController, RuleSet
+
+
+class TestRuleSet(unittest.TestCase):
+    def pod(self, namespace='space', labels=None):
+        """Returns a pod (without its kind set, as in list results) with the given labels."""
+        return V1Pod(metadata=V1ObjectMeta(name='pendy', namespace=namespace, labels=labels))
+
+    def deployment(self, labels, template_labels=None):
+        """Returns a deployment with the given labels on it and its template."""
+        return V1Deployment(
+            metadata=V1ObjectMeta(name='deppy', namespace='space', labels=labels),
+            spec=V1DeploymentSpec(
+                selector=V1LabelSelector(),
+                template=V1PodTemplateSpec(metadata=V1ObjectMeta(labels=template_labels))))
+
+    def test_require(self):
+        """Tests that require rules reject items missing the label."""
+        rules = RuleSet([{'type': 'require', 'label': 'owner'}])
+        rules.apply(self.pod(labels={'owner': 'me'}))
+        with self.assertRaises(Rejection) as context:
+            rules.apply(self.pod(labels={'owner': ''}))
+        self.assertEqual(context.exception.status.reason, 'MissingOwner')
+
+    def test_default(self):
+        """Tests that default rules only set missing annotations."""
+        rules = RuleSet([{'type': 'default', 'annotation': 'team', 'value': 'infra'}])
+        self.assertEqual(rules.apply(self.pod()).metadata.annotations, {'team': 'infra'})
+        pod = self.pod()
+        pod.metadata.annotations = {'team': 'web'}
+        self.assertEqual(rules.apply(pod).metadata.annotations, {'team': 'web'})
+
+    def test_copy_to_template(self):
+        """Tests that labels are copied to templates, and mismatches rejected."""
+        rules = RuleSet([{'type': 'copy_to_template', 'label': 'owner'}])
+        deployment = rules.apply(self.deployment({'owner': 'me'}))
+        self.assertEqual(deployment.spec.template.metadata.labels, {'owner': 'me'})
+        with self.assertRaises(Rejection) as context:
+            rules.apply(self.deployment({'owner': 'me'}, {'owner': 'you'}))
+        self.assertEqual(context.exception.status.reason, 'MismatchedOwner')
+        self.assertTrue(context.exception.status.message.startswith(
+            'Template label owner=you does not match owner=me on '))
+        # Items without templates are left alone.
+        rules.apply(self.pod(labels={'owner': 'me'}))
+
+    def test_reject(self):
+        """Tests that reject rules match on all of their labels."""
+        rules = RuleSet([{
+            'type': 'reject',
+            'match_labels': {'tier': 'test', 'debug': None},
+            'reason': 'NoDebug'
+        }])
+        rules.apply(self.pod(labels={'tier': 'test'}))
+        rules.apply(self.pod(labels={'tier': 'prod', 'debug': 'yes'}))
+        with self.assertRaises(Rejection) as context:
+            rules.apply(self.pod(labels={'tier': 'test', 'debug': 'yes'}))
+        self.assertEqual(context.exception.status.reason, 'NoDebug')
+
+    def test_rules_are_scoped_and_ordered(self):
+        """Tests that rules only apply to their kinds and namespaces, in their original order."""
+        rules = RuleSet([
+            {'type': 'default', 'label': 'owner', 'value': 'pod', 'kinds': ['Pod']},
+            {'type': 'default', 'label': 'owner', 'value': 'deployment', 'kinds': ['Deployment']},
+            {'type': 'default', 'label': 'owner', 'value': 'any'},
+            {'type': 'require', 'label': 'team', 'namespaces': ['strict']},
+        ])
+        self.assertEqual(rules.apply(self.pod()).metadata.labels, {'owner': 'pod'})
+        deployment = rules.apply(self.deployment(None))
+        self.assertEqual(deployment.metadata.labels, {'owner': 'deployment'})
+        with self.assertRaises(Rejection):
+            rules.apply(self.pod(namespace='strict'))
+        self.assertEqual(len(rules), 4)
+
+    def test_kinds_match_grouped_models(self):
+        """Tests that kinds are recognized on models named for their API group, without `kind`."""
+        rules = RuleSet([{
+            'type': 'default',
+            'label': 'owner',
+            'value': 'me',
+            'kinds': ['Deployment']
+        }])
+        deployment = ExtensionsV1beta1Deployment(
+            metadata=V1ObjectMeta(name='deppy', namespace='space'))
+        self.assertEqual(rules.apply(deployment).metadata.labels, {'owner': 'me'})
+        cron_job = V1beta1CronJob(metadata=V1ObjectMeta(name='crony', namespace='space'))
+        self.assertIsNone(rules.apply(cron_job).metadata.labels)
+
+    def test_invalid_rules(self):
+        """Tests that invalid rules are reported when compiling."""
+        with self.assertRaises(ValueError):
+            RuleSet([{'type': 'unknown'}])
+        with self.assertRaises(ValueError):
+            RuleSet([{'type': 'require'}])
+        with self.assertRaises(ValueError):
+            RuleSet([{'type': 'default', 'label': 'owner'}])
+
+
+class TestRuleResourceController(unittest.TestCase):
+    def config_map(self, rules, resource_version):
+        """Returns a ConfigMap holding the given rules."""
+        return V1ConfigMap(
+            metadata=V1ObjectMeta(name='rules', resource_version=resource_version),
+            data={'rules.json': json.dumps(rules)})
+
+    def test_reloads_rules_on_change(self):
+        """Tests that rules are reloaded from a ConfigMap only when it changes."""
+        controller = RuleResourceController(Mock())
+        core_client = Mock()
+        core_client.read_namespaced_config_map.return_value = self.config_map(
+            [{'type': 'require', 'label': 'owner'}], '1')
+
+        self.assertTrue(controller.reload_rules(core_client, 'rules', 'space'))
+        self.assertFalse(controller.reload_rules(core_client, 'rules', 'space'))
+        self.assertEqual(controller.rule_count, 1)
+        with self.assertRaises(Rejection):
+            controller.handle_item(V1Pod(metadata=V1ObjectMeta(name='pendy')))
+
+        core_client.read_namespaced_config_map.return_value = self.config_map([], '2')
+        self.assertTrue(controller.reload_rules(core_client, 'rules', 'space'))
+        controller.handle_item(V1Pod(metadata=V1ObjectMeta(name='pendy')))
+
+    def test_keeps_rules_on_invalid_reload(self):
+        """Tests that invalid rules leave the current rules in place."""
+        controller = RuleResourceController(Mock(), [{'type': 'require', 'label': 'owner'}])
+        core_client = Mock()
+        core_client.read_namespaced_config_map.return_value = self.config_map(
+            [{'type': 'nope'}], '1')
+        with self.assertRaises(ValueError):
+            controller.reload_rules(core_client, 'rules', 'space')
+        self.assertEqual(controller.rule_count, 1)
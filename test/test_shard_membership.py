@@ -0,0 +1,84 @@
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from kubernetes.client.models.v1_config_map import V1ConfigMap
+from kubernetes.client.models.v1_object_meta import V1ObjectMeta
+from kubernetes.client.rest import ApiException
+
+from ai2.kubernetes.initializer.shard_membership import ShardMembership, shard_of
+
+
+class TestShardMembership(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('kubernetes.client.CoreV1Api')
+        self.mock_core_client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.stored = None
+
+        def read(name, namespace):
+            if self.stored is None:
+                raise ApiException(status=404)
+            return V1ConfigMap(metadata=self.stored.metadata, data=dict(self.stored.data))
+
+        def save(*args):
+            self.stored = args[-1]
+            return self.stored
+
+        self.mock_core_client.read_namespaced_config_map.side_effect = read
+        self.mock_core_client.create_namespaced_config_map.side_effect = save
+        self.mock_core_client.replace_namespaced_config_map.side_effect = save
+
+    def membership(self, identity):
+        return ShardMembership(Mock(), 'shards', 'space', identity=identity, lease_seconds=30)
+
+    def test_shards_split_items(self):
+        """Tests that every item is owned by exactly one live replica."""
+        replicas = [self.membership(identity) for identity in ('a', 'b', 'c')]
+        for replica in replicas:
+            replica.renew()
+        # Earlier replicas see the later ones on their next renewal.
+        for replica in replicas:
+            replica.renew()
+            self.assertEqual(replica.members, ('a', 'b', 'c'))
+
+        for i in range(50):
+            owners = [replica for replica in replicas if replica.owns('ns', 'uid{}'.format(i))]
+            self.assertEqual(len(owners), 1)
+        self.assertEqual(shard_of('ns', 'uid', 3), shard_of('ns', 'uid', 3))
+
+    def test_rebalances_when_replicas_expire(self):
+        """Tests that expired replicas are dropped, and listeners notified."""
+        self.stored = V1ConfigMap(
+            metadata=V1ObjectMeta(name='shards'),
+            data={'gone': repr(time.time() - 60), 'b': repr(time.time())})
+        replica = self.membership('a')
+        listener = Mock()
+        replica.add_listener(listener)
+
+        replica.renew()
+        self.assertEqual(replica.members, ('a', 'b'))
+        listener.assert_called_once_with(('a', 'b'))
+
+        replica.renew()
+        listener.assert_called_once()
+
+        replica.stop()
+        self.assertEqual(sorted(self.stored.data), ['b'])
+        self.assertFalse(replica.owns('ns', 'uid'))
+
+    def test_owns_nothing_before_joining(self):
+        """Tests that a replica owns nothing until its heartbeat is recorded."""
+        self.assertFalse(self.membership('a').owns('ns', 'uid'))
+
+    def test_owns_nothing_once_lease_lapses(self):
+        """Tests that a replica which can't renew stops owning items once its lease runs out."""
+        replica = self.membership('a')
+        replica.renew()
+        self.assertTrue(replica.owns('ns', 'uid'))
+
+        self.mock_core_client.read_namespaced_config_map.side_effect = ApiException(status=500)
+        with self.assertRaises(ApiException):
+            replica.renew()
+        with patch('time.monotonic', return_value=time.monotonic() + 31):
+            self.assertFalse(replica.owns('ns', 'uid'))
@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import Mock
 
+from ai2.kubernetes.initializer.rejection import Rejection
 from ai2.kubernetes.initializer.simple_resource_controller import SimpleResourceController
 
 
@@ -14,3 +15,22 @@ class TestSimpleResourceController(unittest.TestCase):
 
         self.assertEqual(test_controller._resource_handler, mock_handler)
         self.assertEqual(test_controller.handle_item, mock_handle_item)
+
+    def test_handle_item_uses_batch_function(self):
+        """Tests handle_item delegates to handle_items_function when it's the only function."""
+        mock_item = Mock()
+        mock_handle_items = Mock(return_value=[mock_item])
+
+        test_controller = SimpleResourceController(Mock(), handle_items_function=mock_handle_items)
+
+        self.assertEqual(test_controller.handle_item(mock_item), mock_item)
+        mock_handle_items.assert_called_once_with([mock_item])
+
+        mock_handle_items.return_value = [Rejection(message='no')]
+        with self.assertRaises(Rejection):
+            test_controller.handle_item(mock_item)
+
+    def test_requires_a_function(self):
+        """Tests SimpleResourceController requires one of its handler functions."""
+        with self.assertRaises(ValueError):
+            SimpleResourceController(Mock())
@@ -0,0 +1,106 @@
+import unittest
+from unittest.mock import Mock
+
+from kubernetes.client.models.v1_container import V1Container
+from kubernetes.client.models.v1_initializer import V1Initializer
+from kubernetes.client.models.v1_initializers import V1Initializers
+from kubernetes.client.models.v1_object_meta import V1ObjectMeta
+from kubernetes.client.models.v1_pod import V1Pod
+from kubernetes.client.models.v1_pod_spec import V1PodSpec
+
+from ai2.kubernetes.initializer.metrics import SPECULATION_LOOKUPS, Metrics
+from ai2.kubernetes.initializer.rejection import Rejection
+from ai2.kubernetes.initializer.speculation_cache import SpeculationCache
+
+
+class TestSpeculationCache(unittest.TestCase):
+    def pod(self, pending, image='busybox', resource_version='1'):
+        """Returns a pod with the given pending initializer names."""
+        return V1Pod(
+            kind='Pod',
+            metadata=V1ObjectMeta(
+                name='pendy',
+                namespace='space',
+                uid='pendy-uid',
+                resource_version=resource_version,
+                labels={'app': 'web'},
+                initializers=V1Initializers(
+                    pending=[V1Initializer(name=name) for name in pending])),
+            spec=V1PodSpec(containers=[V1Container(name='main', image=image)]))
+
+    def mock_controller(self, handle_item):
+        """Returns a mock controller with the given handle_item."""
+        mock_controller = Mock()
+        mock_controller.name = 'pods'
+        mock_controller.handle_item.side_effect = handle_item
+        return mock_controller
+
+    def test_replays_decision_for_unchanged_item(self):
+        """Tests that an early decision is replayed once the item's turn comes."""
+
+        def handle_item(item):
+            item.metadata.labels['checked'] = 'true'
+            return item
+
+        metrics = Metrics()
+        cache = SpeculationCache(metrics=metrics)
+        controller = self.mock_controller(handle_item)
+        cache.evaluate(controller, self.pod(['other', 'fooey']))
+        result = cache.lookup(controller, self.pod(['fooey'], resource_version='2'))
+
+        controller.handle_item.assert_called_once()
+        self.assertEqual(result.metadata.labels, {'app': 'web', 'checked': 'true'})
+        self.assertEqual(result.metadata.resource_version, '2')
+        self.assertEqual(result.metadata.initializers.pending, [V1Initializer(name='fooey')])
+        self.assertEqual(metrics.get(SPECULATION_LOOKUPS, 'pods', result='hit'), 1)
+        # Decisions are only used once.
+        self.assertEqual(cache.cache_size, 0)
+
+    def test_changed_fields_miss(self):
+        """Tests that a decision isn't used if an earlier initializer changed the item."""
+        metrics = Metrics()
+        cache = SpeculationCache(metrics=metrics)
+        controller = self.mock_controller(lambda item: item)
+        cache.evaluate(controller, self.pod(['other', 'fooey']))
+        self.assertIsNone(cache.lookup(controller, self.pod(['fooey'], image='nginx')))
+        self.assertEqual(metrics.get(SPECULATION_LOOKUPS, 'pods', result='miss'), 1)
+
+    def test_fields_function_limits_hashed_fields(self):
+        """Tests that changes outside the selected fields don't invalidate a decision."""
+        cache = SpeculationCache(fields_function=lambda item: item['metadata'].get('labels'))
+        controller = self.mock_controller(lambda item: item)
+        cache.evaluate(controller, self.pod(['other', 'fooey']))
+        result = cache.lookup(controller, self.pod(['fooey'], image='nginx'))
+        self.assertEqual(result.spec.containers[0].image, 'nginx')
+
+    def test_replays_rejections(self):
+        """Tests that an early rejection is returned as a Rejection."""
+
+        def handle_item(item):
+            raise Rejection(message='no', reason='Nope', code=403)
+
+        cache = SpeculationCache()
+        controller = self.mock_controller(handle_item)
+        cache.evaluate(controller, self.pod(['other', 'fooey']))
+        result = cache.lookup(controller, self.pod(['fooey']))
+        self.assertIsInstance(result, Rejection)
+        self.assertEqual(result.status.reason, 'Nope')
+
+    def test_skips_evaluated_items(self):
+        """Tests that an item is only evaluated again if its fields change."""
+        cache = SpeculationCache()
+        controller = self.mock_controller(lambda item: item)
+        cache.evaluate(controller, self.pod(['other', 'fooey']))
+        cache.evaluate(controller, self.pod(['other', 'fooey'], resource_version='2'))
+        self.assertEqual(controller.handle_item.call_count, 1)
+        cache.evaluate(controller, self.pod(['other', 'fooey'], image='nginx'))
+        self.assertEqual(controller.handle_item.call_count, 2)
+
+    def test_errors_are_not_cached(self):
+        """Tests that handler errors leave the item to be handled on its turn."""
+        cache = SpeculationCache()
+        controller = self.mock_controller(Exception('boom'))
+        cache.evaluate(controller, self.pod(['other', 'fooey']))
+        self.assertEqual(cache.cache_size, 0)
+        self.assertIsNone(cache.lookup(controller, self.pod(['fooey'])))
+
@@ -0,0 +1,162 @@
+import datetime
+import sys
+import unittest
+from unittest.mock import Mock
+
+from kubernetes.client.models.v1_initializer import V1Initializer
+from kubernetes.client.models.v1_initializers import V1Initializers
+from kubernetes.client.models.v1_object_meta import V1ObjectMeta
+from kubernetes.client.models.v1_pod import V1Pod
+
+from ai2.kubernetes.initializer.metrics import EVENTS_FILTERED, Metrics
+from ai2.kubernetes.initializer.tracking_store import ItemTracker, TrackingStore
+
+
+class TestTrackingStore(unittest.TestCase):
+    def test_observe_tracks_latest_state(self):
+        """Tests that observations update records, keeping their first_seen time."""
+        times = iter([1, 2])
+        store = TrackingStore(clock=lambda: next(times))
+        self.assertFalse(store.observe('pods', 'uid', 'space', 'pendy', '1', 'other'))
+        self.assertFalse(store.observe('pods', 'uid', 'space', 'pendy', '2', 'fooey'))
+
+        tracked = store.get('uid')
+        self.assertEqual((tracked.resource_version, tracked.pending_head, tracked.first_seen),
+                         ('2', 'fooey', 1))
+        self.assertEqual(store.count('pods', 'fooey'), 1)
+        self.assertEqual(store.count('pods', 'other'), 0)
+        # Records are compact, and share strings.
+        self.assertFalse(hasattr(tracked, '__dict__'))
+        self.assertIs(tracked.namespace, sys.intern('space'))
+
+    def test_observe_reports_duplicates(self):
+        """Tests that repeated observations at one resourceVersion are reported."""
+        store = TrackingStore()
+        store.observe('pods', 'uid', 'space', 'pendy', '1', 'fooey')
+        self.assertTrue(store.observe('pods', 'uid', 'space', 'pendy', '1', 'fooey'))
+
+    def test_observe_item(self):
+        """Tests that models are reduced to tracked fields."""
+        store = TrackingStore()
+        store.observe_item(
+            'pods',
+            V1Pod(
+                metadata=V1ObjectMeta(
+                    name='pendy',
+                    namespace='space',
+                    uid='uid',
+                    resource_version='1',
+                    initializers=V1Initializers(pending=[V1Initializer(name='fooey')]))))
+        self.assertEqual(store.get('uid').name, 'pendy')
+        self.assertEqual(store.count('pods', 'fooey'), 1)
+
+    def test_discard_and_retain(self):
+        """Tests that objects are dropped when discarded, or missing from a source's list."""
+        store = TrackingStore()
+        for uid in ('a', 'b', 'c'):
+            store.observe('pods', uid, 'space', uid, '1', 'fooey')
+        store.observe('jobs', 'd', 'space', 'd', '1', 'fooey')
+
+        store.discard('a')
+        store.discard('missing')
+        store.retain('pods', {'b'})
+
+        self.assertEqual(len(store), 2)
+        self.assertIn('b', store)
+        self.assertIn('d', store)
+        self.assertEqual(store.count('pods', 'fooey'), 1)
+
+    def test_retain_keeps_later_observations(self):
+        """Tests that retain keeps objects observed after the given marker, even if unlisted."""
+        store = TrackingStore()
+        store.observe('pods', 'a', 'space', 'a', '1', 'fooey')
+        store.observe('pods', 'b', 'space', 'b', '1', 'fooey')
+        mark = store.mark()
+        store.observe('pods', 'b', 'space', 'b', '2', 'fooey')
+        store.observe('pods', 'c', 'space', 'c', '1', 'fooey')
+
+        store.retain('pods', set(), since=mark)
+
+        self.assertNotIn('a', store)
+        self.assertIn('b', store)
+        self.assertIn('c', store)
+
+    def test_oldest_age_seconds(self):
+        """Tests that the longest-waiting object is found by creation time, else first_seen."""
+        now = [100.0]
+        store = TrackingStore(clock=lambda: now[0])
+        store.observe('pods', 'a', 'space', 'a', '1', 'fooey')
+        store.observe('pods', 'b', 'space', 'b', '1', 'fooey', created='1970-01-01T00:00:40Z')
+        store.observe_item(
+            'pods',
+            V1Pod(
+                metadata=V1ObjectMeta(
+                    name='c',
+                    namespace='space',
+                    uid='c',
+                    resource_version='1',
+                    creation_timestamp=datetime.datetime(
+                        1970, 1, 1, 0, 0, 20, tzinfo=datetime.timezone.utc),
+                    initializers=V1Initializers(pending=[V1Initializer(name='other')]))))
+        now[0] = 110.0
+        self.assertEqual(store.oldest_age_seconds('pods', 'fooey'), 70)
+        self.assertIsNone(store.oldest_age_seconds('jobs', 'fooey'))
+
+        # Objects stop counting once discarded, or no longer pending first on the initializer.
+        store.discard('b')
+        self.assertEqual(store.oldest_age_seconds('pods', 'fooey'), 10)
+        store.observe('pods', 'a', 'space', 'a', '2', 'other')
+        self.assertIsNone(store.oldest_age_seconds('pods', 'fooey'))
+        self.assertEqual(store.oldest_age_seconds('pods', 'other'), 90)
+
+    def test_resume_versions(self):
+        """Tests that each source's latest resourceVersion is kept until reset."""
+        store = TrackingStore()
+        store.set_resume_version('pods', '1')
+        store.set_resume_version('pods', None)
+        self.assertEqual(store.resume_version('pods'), '1')
+        store.reset_resume_version('pods')
+        self.assertIsNone(store.resume_version('pods'))
+
+
+class TestItemTracker(unittest.TestCase):
+    def event(self, name, pending, event_type='ADDED', resource_version='1'):
+        """Returns a raw watch event for an object with the given pending initializers."""
+        return {
+            'type': event_type,
+            'object': {
+                'metadata': {
+                    'name': name,
+                    'namespace': 'space',
+                    'uid': name,
+                    'resourceVersion': resource_version,
+                    'initializers': {
+                        'pending': [{
+                            'name': pending_name
+                        } for pending_name in pending]
+                    }
+                }
+            }
+        }
+
+    def test_accept_event(self):
+        """Tests that events are tracked, and accepted only if new and pending first on us."""
+        store = TrackingStore()
+        metrics = Metrics()
+        tracker = ItemTracker(store, 'fooey', lambda namespace, uid: uid != 'unowned', metrics)
+
+        self.assertTrue(tracker.accept_event('pods', self.event('mine', ['fooey'])))
+        self.assertFalse(tracker.accept_event('pods', self.event('mine', ['fooey'])))
+        self.assertFalse(tracker.accept_event('pods', self.event('later', ['other', 'fooey'])))
+        self.assertFalse(tracker.accept_event('pods', self.event('unowned', ['fooey'])))
+        self.assertFalse(
+            tracker.accept_event('pods', self.event('mine', [], 'DELETED', resource_version='2')))
+
+        self.assertNotIn('mine', store)
+        self.assertIn('later', store)
+        self.assertEqual(store.resume_version('pods'), '2')
+        self.assertEqual(metrics.get(EVENTS_FILTERED, 'pods'), 4)
+        # Items pending later are accepted for early evaluation, if asked for.
+        tracker = ItemTracker(store, 'fooey', Mock(return_value=True), metrics, include_later=True)
+        later_event = self.event('later', ['x', 'fooey'], 'MODIFIED', resource_version='3')
+        self.assertTrue(tracker.accept_event('pods', later_event))
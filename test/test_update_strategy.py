@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import Mock
+
+from kubernetes.client.models.v1_initializer import V1Initializer
+from kubernetes.client.models.v1_initializers import V1Initializers
+from kubernetes.client.models.v1_object_meta import V1ObjectMeta
+from kubernetes.client.models.v1_pod import V1Pod
+
+from ai2.kubernetes.initializer.update_strategy import (JsonPatchUpdateStrategy,
+                                                        ReplaceUpdateStrategy, json_patch_apply,
+                                                        json_patch_diff)
+
+
+class TestUpdateStrategy(unittest.TestCase):
+    def test_replace(self):
+        """Tests that the replace strategy replaces the item."""
+        mock_handler = Mock()
+        strategy = ReplaceUpdateStrategy()
+        self.assertEqual(strategy.snapshot('item'), None)
+        strategy.update(mock_handler, 'item', None)
+        mock_handler.replace_item.assert_called_once_with('item')
+
+    def test_json_patch_diff(self):
+        """Tests that diffs only include changed fields."""
+        original = {'a': {'b': 1, 'c': [1, 2], 'd': 'x'}, 'e/f': 1}
+        updated = {'a': {'b': 1, 'c': [1, 3], 'g': True}, 'e/f': 2}
+        self.assertEqual(
+            json_patch_diff(original, updated), [
+                {'op': 'replace', 'path': '/a/c', 'value': [1, 3]},
+                {'op': 'remove', 'path': '/a/d'},
+                {'op': 'add', 'path': '/a/g', 'value': True},
+                {'op': 'replace', 'path': '/e~1f', 'value': 2},
+            ])
+        self.assertEqual(json_patch_diff(original, original), [])
+
+    def test_json_patch_apply(self):
+        """Tests that applying a diff reproduces the updated document, and copies the input."""
+        original = {'a': {'b': 1, 'c': [1, 2], 'd': 'x'}, 'e/f': 1}
+        updated = {'a': {'b': 1, 'c': [1, 3], 'g': True}, 'e/f': 2}
+        self.assertEqual(json_patch_apply(original, json_patch_diff(original, updated)), updated)
+        self.assertEqual(original['a']['d'], 'x')
+        with self.assertRaises(ValueError):
+            json_patch_apply(original, [{'op': 'add', 'path': '/x/y', 'value': 1}])
+
+    def test_json_patch_update(self):
+        """Tests that the patch strategy sends the initializers change and handler changes."""
+        pod = V1Pod(metadata=V1ObjectMeta(
+            name='pod',
+            namespace='space',
+            resource_version='5',
+            labels={'keep': 'me'},
+            initializers=V1Initializers(pending=[V1Initializer(name='fooey')])))
+        mock_handler = Mock()
+        strategy = JsonPatchUpdateStrategy(api_client=Mock(
+            sanitize_for_serialization=lambda item: item.to_dict()))
+
+        snapshot = strategy.snapshot(pod)
+        pod.metadata.initializers = None
+        pod.metadata.labels['owner'] = 'someone'
+        strategy.update(mock_handler, pod, snapshot)
+
+        mock_handler.patch_item.assert_called_once_with(pod, [
+            {'op': 'replace', 'path': '/metadata/resourceVersion', 'value': '5'},
+            {'op': 'replace', 'path': '/metadata/initializers', 'value': None},
+            {'op': 'add', 'path': '/metadata/labels/owner', 'value': 'someone'},
+        ])
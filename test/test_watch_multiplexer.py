@@ -0,0 +1,113 @@
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+
+from ai2.kubernetes.initializer.watch_multiplexer import (RECONNECT, ReconnectAfter,
+                                                           WatchMultiplexer)
+
+
+class TestWatchMultiplexer(unittest.TestCase):
+    def mock_response(self, lines):
+        """Returns a mocked streaming response containing the given lines."""
+        mock_response = Mock()
+        mock_response.read_chunked.return_value = [(line + '\n').encode('utf8') for line in lines]
+        return mock_response
+
+    def test_shares_threads_between_watches(self):
+        """Tests that more watches than threads take turns, reconnecting in a loop."""
+        dispatched = []
+        opens = []
+        done = threading.Event()
+
+        def dispatch(key, value):
+            dispatched.append((key, value))
+            if len(dispatched) == 4:
+                done.set()
+
+        multiplexer = WatchMultiplexer(1, dispatch, Mock(), slice_seconds=5)
+
+        def open_function(key):
+            def open_watch(timeout_seconds):
+                opens.append((key, timeout_seconds))
+                count = sum(1 for opened_key, _ in opens if opened_key == key)
+                return self.mock_response(['{}-{}'.format(key, count)])
+
+            return open_watch
+
+        multiplexer.add_watch('a', open_function('a'), lambda line: line)
+        multiplexer.add_watch('b', open_function('b'), lambda line: line)
+        multiplexer.start()
+        self.assertTrue(done.wait(5))
+        multiplexer.stop()
+
+        self.assertEqual(dispatched[:4], [('a', 'a-1'), ('b', 'b-1'), ('a', 'a-2'), ('b', 'b-2')])
+        self.assertEqual(opens[0], ('a', 5))
+
+    def test_line_function_filters_and_reconnects(self):
+        """Tests that None drops a line, and RECONNECT ends the connection."""
+        dispatched = []
+        done = threading.Event()
+        responses = [self.mock_response(['skip', 'keep', 'reconnect', 'unread'])]
+
+        def open_watch(timeout_seconds):
+            if responses:
+                return responses.pop()
+            done.set()
+            return self.mock_response([])
+
+        def line_function(line):
+            return {'skip': None, 'reconnect': RECONNECT}.get(line, line)
+
+        multiplexer = WatchMultiplexer(1, lambda key, value: dispatched.append(value), Mock())
+        multiplexer.add_watch('a', open_watch, line_function)
+        multiplexer.start()
+        self.assertTrue(done.wait(5))
+        multiplexer.stop()
+
+        self.assertEqual(dispatched, ['keep'])
+
+    def test_reconnects_after_dispatch(self):
+        """Tests that a ReconnectAfter's value is dispatched before the watch is reopened."""
+        events = []
+        done = threading.Event()
+
+        def open_watch(timeout_seconds):
+            events.append('open')
+            if len(events) > 1:
+                done.set()
+            return self.mock_response(['relist', 'unread'])
+
+        def dispatch(key, value):
+            time.sleep(0.05)
+            events.append(value)
+
+        multiplexer = WatchMultiplexer(1, dispatch, Mock())
+        multiplexer.add_watch('a', open_watch, ReconnectAfter)
+        multiplexer.start()
+        self.assertTrue(done.wait(5))
+        multiplexer.stop()
+
+        self.assertEqual(events[:3], ['open', 'relist', 'open'])
+
+    def test_reports_errors_and_retries(self):
+        """Tests that connection errors are reported, and the watch reopened."""
+        error = Exception('boom')
+        error_callback = Mock()
+        done = threading.Event()
+        calls = []
+
+        def open_watch(timeout_seconds):
+            calls.append(timeout_seconds)
+            if len(calls) == 1:
+                raise error
+            done.set()
+            return self.mock_response([])
+
+        multiplexer = WatchMultiplexer(1, Mock(), error_callback, retry_delay_seconds=0)
+        multiplexer.add_watch('a', open_watch, lambda line: line)
+        multiplexer.start()
+        self.assertTrue(done.wait(5))
+        multiplexer.stop()
+
+        error_callback.assert_called_once_with(error)
@@ -0,0 +1,69 @@
+import time
+import unittest
+
+from ai2.kubernetes.initializer.work_queue import WorkQueue
+
+
+class TestWorkQueue(unittest.TestCase):
+    def test_collapses_queued_duplicates(self):
+        """Tests that adding a queued key replaces its value, keeping its place."""
+        queue = WorkQueue()
+        queue.add('a', 1)
+        queue.add('b', 2)
+        queue.add('a', 3)
+        self.assertEqual(queue.depth, 2)
+
+        self.assertEqual(queue.get(timeout=0), ('a', 3))
+        self.assertEqual(queue.get(timeout=0), ('b', 2))
+        self.assertEqual(queue.get(timeout=0), None)
+
+    def test_holds_keys_while_processing(self):
+        """Tests that a key added while processing is queued only once processing is done."""
+        queue = WorkQueue()
+        queue.add('a', 1, version='1')
+        self.assertEqual(queue.get(timeout=0), ('a', 1))
+
+        # Same version as the in-flight value: dropped.
+        queue.add('a', 1, version='1')
+        # New version: held until done.
+        queue.add('a', 2, version='2')
+        self.assertEqual(queue.get(timeout=0), None)
+
+        queue.done('a')
+        self.assertEqual(queue.get(timeout=0), ('a', 2))
+        queue.done('a')
+        self.assertEqual(queue.depth, 0)
+
+    def test_retries_with_backoff(self):
+        """Tests that failed keys are retried after an increasing delay, up to max_retries."""
+        queue = WorkQueue(base_retry_delay_seconds=0.05, max_retries=2)
+        queue.add('a', 1)
+
+        queue.get(timeout=0)
+        queue.done('a')
+        self.assertTrue(queue.add_after_failure('a', 1))
+        # Not ready until the delay passes.
+        self.assertEqual(queue.get(timeout=0), None)
+        self.assertEqual(queue.depth, 1)
+        start = time.monotonic()
+        self.assertEqual(queue.get(timeout=5), ('a', 1))
+        self.assertGreaterEqual(time.monotonic() - start, 0.03)
+
+        queue.done('a')
+        self.assertTrue(queue.add_after_failure('a', 1))
+        queue.get(timeout=5)
+        queue.done('a')
+        self.assertFalse(queue.add_after_failure('a', 1))
+        self.assertEqual(queue.depth, 0)
+
+    def test_forget_resets_failures(self):
+        """Tests that forget resets a key's failure count."""
+        queue = WorkQueue(max_retries=1)
+        queue.add('a', 1)
+        queue.get(timeout=0)
+        queue.done('a')
+        self.assertTrue(queue.add_after_failure('a', 1))
+        queue.get(timeout=5)
+        queue.forget('a')
+        queue.done('a')
+        self.assertTrue(queue.add_after_failure('a', 1))